@@ -0,0 +1,670 @@
+#!/usr/bin/env python
+#
+#   Copyright 2015 Michele Filannino
+#
+#   gnTEAM, School of Computer Science, University of Manchester.
+#   All rights reserved. This program and the accompanying materials
+#   are made available under the terms of the GNU General Public License.
+#
+#   author: Michele Filannino
+#   email:  filannim@cs.man.ac.uk
+#
+#   For details, see www.cs.man.ac.uk/~filannim/
+
+'''It measures the performance of ManTIME end to end.
+
+   A synthetic TempEval-3 corpus is generated (or a folder of .tml files is
+   used), a model is trained on it with ManTIME.train and the test documents
+   are annotated with ManTIME.label. Each stage is timed: reader parse,
+   StanfordCoreNLP, complete_structure, feature extraction, the training rows
+   and the test matrices of each classifier, each crf_learn/crf_test call,
+   identification, normalisation, linking and writing.
+
+   By default nothing external is needed: StanfordCoreNLP is replaced by a
+   stand-in which replays the parses cached in the workspace (the missing
+   ones are produced by a rule-based tokeniser and cached) and CRF++ by two
+   small scripts which memorise the most frequent label of each token. With
+   --crf the real CRF++ binaries (MANTIME_CRF_TRAIN, MANTIME_CRF_TEST) are
+   used instead; --parses replays a buffer folder of real StanfordCoreNLP
+   parses.
+
+   The stage timings are inclusive (the parse stage contains the
+   StanfordCoreNLP and complete_structure ones, the identify stage contains
+   the identification matrix and the crf_test calls, ...). The results can be
+   saved as a baseline (--save) and compared with a previous one
+   (--baseline): the exit status is 1 if a stage got slower than the
+   tolerance allows.
+'''
+
+import argparse
+import cgi
+import json
+import logging
+import os
+import random
+import re
+import resource
+import shutil
+import stat
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import types
+
+BENCHMARK_FORMAT = 1
+LOGGER = logging.getLogger('benchmark')
+
+CRF_LEARN = '''#!{python}
+# crf_learn stand-in: it memorises the most frequent label of each token.
+import collections
+import json
+import sys
+
+arguments = [a for a in sys.argv[1:] if not a.startswith('-')]
+if '-p' in sys.argv:
+    arguments.remove(sys.argv[sys.argv.index('-p') + 1])
+_, training_set, model = arguments
+counts = collections.defaultdict(collections.Counter)
+for line in open(training_set):
+    row = line.rstrip('\\n').split('\\t')
+    if len(row) > 1:
+        counts[row[0]][row[-1]] += 1
+labels = sorted(set(l for c in counts.values() for l in c)) or ['O']
+memory = dict((token, c.most_common(1)[0][0])
+              for token, c in counts.items())
+json.dump({{'labels': labels, 'memory': memory}}, open(model, 'w'))
+'''
+
+CRF_TEST = '''#!{python}
+# crf_test stand-in: it labels each token with its most frequent label.
+import json
+import sys
+
+model = json.load(open(sys.argv[sys.argv.index('-m') + 1]))
+labels, memory = model['labels'], model['memory']
+default = 'O' if 'O' in labels else labels[0]
+marginals = '-v2' in sys.argv
+header = True
+output = sys.stdout
+for line in open(sys.argv[-1]):
+    row = line.rstrip('\\n')
+    if not row:
+        output.write('\\n')
+        header = True
+        continue
+    if marginals and header:
+        output.write('# 1.000000\\n')
+        header = False
+    label = memory.get(row.split('\\t')[0], default)
+    if marginals:
+        columns = '\\t'.join('{{}}/{{:.6f}}'.format(l, float(l == label))
+                             for l in labels)
+        output.write('{{}}\\t{{}}/1.000000\\t{{}}\\n'.format(
+            row, label, columns))
+    else:
+        output.write('{{}}\\t{{}}\\n'.format(row, label))
+'''
+
+# synthetic corpus
+SUBJECTS = ('The company', 'Officials', 'The minister', 'Analysts',
+            'The bank', 'Doctors', 'The committee', 'Investors')
+OBJECTS = ('its results', 'the agreement', 'the new plan', 'sales',
+           'the report', 'a treatment', 'the budget', 'prices')
+EVENTS = (('announced', 'OCCURRENCE', 'VERB', 'PAST'),
+          ('said', 'REPORTING', 'VERB', 'PAST'),
+          ('approved', 'OCCURRENCE', 'VERB', 'PAST'),
+          ('expects', 'I_STATE', 'VERB', 'PRESENT'),
+          ('reviewed', 'OCCURRENCE', 'VERB', 'PAST'),
+          ('cut', 'OCCURRENCE', 'VERB', 'PAST'),
+          ('plans', 'I_ACTION', 'VERB', 'PRESENT'))
+TIMEXES = (('Monday', 'DATE', 'XXXX-WXX-1'),
+           ('yesterday', 'DATE', 'PAST_REF'),
+           ('last year', 'DATE', 'PAST_REF'),
+           ('two weeks', 'DURATION', 'P2W'),
+           ('March 3, 2015', 'DATE', '2015-03-03'),
+           ('every day', 'SET', 'P1D'),
+           ('the morning', 'TIME', 'XXXX-XX-XXTMO'))
+RELATIONS = ('BEFORE', 'AFTER', 'INCLUDES', 'IS_INCLUDED', 'SIMULTANEOUS')
+
+# stand-in parser
+TOKEN = re.compile(r'\w+|[^\w\s]', re.UNICODE)
+TAGS = {'the': 'DT', 'a': 'DT', 'every': 'DT', 'its': 'PRP$',
+        'that': 'IN', 'last': 'JJ', 'new': 'JJ', 'two': 'CD',
+        'said': 'VBD', 'cut': 'VBD', 'expects': 'VBZ', 'plans': 'VBZ',
+        'weeks': 'NNS', 'sales': 'NNS', 'prices': 'NNS', 'officials': 'NNS',
+        'analysts': 'NNS', 'investors': 'NNS', 'doctors': 'NNS'}
+DATE_WORDS = ('monday', 'yesterday', 'year', 'weeks', 'march', 'day',
+              'morning')
+
+
+def synthetic_document(rng, number, sentences):
+    '''It returns a synthetic TempEval-3 document (as a string) with its
+    events, temporal expressions and temporal links.
+
+    '''
+    pieces, instances, links = [], [], []
+    n_timex = 0
+
+    def event():
+        form, eclass, pos, tense = rng.choice(EVENTS)
+        eid = 'e{}'.format(len(instances) + 1)
+        instances.append((eid, pos, tense))
+        return eid, '<EVENT eid="{}" class="{}">{}</EVENT>'.format(
+            eid, eclass, form)
+
+    for _ in xrange(sentences):
+        form, ttype, value = rng.choice(TIMEXES)
+        n_timex += 1
+        tid = 't{}'.format(n_timex)
+        timex = '<TIMEX3 tid="{}" type="{}" value="{}">{}</TIMEX3>'.format(
+            tid, ttype, value, cgi.escape(form))
+        eid, tagged_event = event()
+        links.append((eid, tid))
+        if rng.random() < .5:
+            pieces.append('{} {} {} {} .'.format(
+                rng.choice(SUBJECTS), tagged_event, rng.choice(OBJECTS),
+                timex))
+        else:
+            eid2, tagged_event2 = event()
+            links.append((eid2, 't0'))
+            pieces.append('{} , {} {} that {} {} {} .'.format(
+                timex, rng.choice(SUBJECTS), tagged_event,
+                rng.choice(SUBJECTS).lower(), tagged_event2,
+                rng.choice(OBJECTS)))
+
+    output = ['<?xml version="1.0" ?>',
+              '<TimeML xmlns:xsi="http://www.w3.org/2001/XMLSchema-' +
+              'instance" xsi:noNamespaceSchemaLocation="http://timeml.org/' +
+              'timeMLdocs/TimeML_1.2.1.xsd">',
+              '<DOCID>benchmark_{:05d}</DOCID>'.format(number),
+              '<DCT><TIMEX3 tid="t0" type="DATE" value="2015-03-02" ' +
+              'temporalFunction="false" functionInDocument=' +
+              '"CREATION_TIME">2015-03-02</TIMEX3></DCT>',
+              '<TITLE>Benchmark document {}</TITLE>'.format(number),
+              '<TEXT>', ' '.join(pieces), '</TEXT>']
+    for eid, pos, tense in instances:
+        output.append(str('<MAKEINSTANCE eventID="{0}" eiid="ei{1}" ' +
+                          'tense="{2}" aspect="NONE" polarity="POS" ' +
+                          'pos="{3}" />').format(eid, eid[1:], tense, pos))
+    for lid, (eid, tid) in enumerate(links, start=1):
+        output.append(str('<TLINK lid="l{}" relType="{}" eventInstanceID=' +
+                          '"ei{}" relatedToTime="{}" />').format(
+                              lid, rng.choice(RELATIONS), eid[1:], tid))
+    output.append('</TimeML>')
+    return '\n'.join(output) + '\n'
+
+
+def synthetic_corpus(folder, documents, sentences, seed):
+    '''It writes a synthetic TempEval-3 corpus in folder.
+
+    '''
+    if not os.path.exists(folder):
+        os.makedirs(folder)
+    rng = random.Random(seed)
+    for number in xrange(documents):
+        with open(os.path.join(folder, 'benchmark_{:05d}.tml'.format(
+                number)), 'w') as output:
+            output.write(synthetic_document(rng, number, sentences))
+    return folder
+
+
+def synthetic_parse(text):
+    '''It returns a StanfordCoreNLP-like parse of text: rule-based tokens,
+    part-of-speech tags and named entities, a flat constituency tree and a
+    chain of dependencies.
+
+    '''
+    sentences, tokens = [], []
+    for match in TOKEN.finditer(text):
+        tokens.append(match)
+        if match.group() in ('.', '!', '?'):
+            sentences.append(tokens)
+            tokens = []
+    if tokens:
+        sentences.append(tokens)
+
+    result = []
+    for tokens in sentences:
+        words, leaves = [], []
+        for match in tokens:
+            form = match.group()
+            lower = form.lower()
+            if not form[0].isalnum():
+                pos = form if form in ('.', ',', ':') else 'SYM'
+            elif form.isdigit():
+                pos = 'CD'
+            elif lower in TAGS:
+                pos = TAGS[lower]
+            elif lower.endswith('ed'):
+                pos = 'VBD'
+            elif form[0].isupper() and match.start() != tokens[0].start():
+                pos = 'NNP'
+            else:
+                pos = 'NN'
+            ner = 'DATE' if lower in DATE_WORDS or form.isdigit() else 'O'
+            words.append((form, {'CharacterOffsetBegin': str(match.start()),
+                                 'CharacterOffsetEnd': str(match.end()),
+                                 'Lemma': lower,
+                                 'NamedEntityTag': ner,
+                                 'PartOfSpeech': pos}))
+            leaf = {'(': '-LRB-', ')': '-RRB-'}.get(form, form)
+            leaves.append(u'({} {})'.format(pos, leaf))
+        dependencies = [(u'root', u'0', u'1')] + [
+            (u'dep', unicode(position), unicode(position + 1))
+            for position in xrange(1, len(words))]
+        result.append({
+            'words': words,
+            'parsetree': u'(ROOT (S {}))'.format(u' '.join(leaves)),
+            'text': text[tokens[0].start():tokens[-1].end()],
+            'basic_dependencies': dependencies,
+            'collapsed_dependencies': list(dependencies)})
+    return {'sentences': result, 'coref': []}
+
+
+def replayed_corenlp(folder):
+    '''It returns a StanfordCoreNLP stand-in which replays the parses cached
+    in folder (in the format of the reader cache) and caches the synthetic
+    parse of the missing texts.
+
+    '''
+    from mantime.readers import BatchedCoreNLP
+
+    class ReplayedCoreNLP(BatchedCoreNLP):
+
+        def parse(self, text, folder=None):
+            return self.parse_many([text])[0]
+
+        def parse_many(self, texts, folder=None):
+            return BatchedCoreNLP.parse_many(self, texts, self.folder)
+
+        def _parse_many(self, texts):
+            return {text: synthetic_parse(text) for text in texts}
+
+    if not os.path.exists(folder):
+        os.makedirs(folder)
+    return ReplayedCoreNLP(os.path.abspath(folder))
+
+
+def crf_standins(folder):
+    '''It writes the CRF++ stand-ins in folder and returns their paths.
+
+    '''
+    if not os.path.exists(folder):
+        os.makedirs(folder)
+    paths = []
+    for name, script in (('crf_learn', CRF_LEARN), ('crf_test', CRF_TEST)):
+        path = os.path.join(folder, name)
+        with open(path, 'w') as output:
+            output.write(script.format(python=sys.executable))
+        os.chmod(path, os.stat(path).st_mode | stat.S_IEXEC)
+        paths.append(path)
+    return paths
+
+
+def peak_rss():
+    '''It returns the peak resident set size of this process and of its
+    finished children (in KB on Linux, in bytes on Mac OS X).
+
+    They are high-water marks since the process started, not per phase: the
+    peak at the end of the label phase may be the one of the training.
+    '''
+    return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+
+
+class Profiler(object):
+    '''It times functions and external processes by stage, within the
+    current phase (e.g. train or label).
+
+    '''
+
+    def __init__(self):
+        self.phases = {}
+        self.phase = None
+        self._lock = threading.Lock()
+        self._patches = []
+        self._waiters = []
+
+    def start_phase(self, name):
+        self.phase = name
+        self.phases[name] = {'stages': {}, 'documents': 0, 'tokens': 0,
+                             'seconds': 0.}
+        self._phase_start = time.time()
+
+    def end_phase(self):
+        for waiter in self._waiters:
+            waiter.join()
+        self._waiters = []
+        phase = self.phases[self.phase]
+        phase['seconds'] = time.time() - self._phase_start
+        phase['peak_rss'], phase['peak_rss_children'] = peak_rss()
+        if phase['seconds']:
+            phase['docs_per_second'] = phase['documents'] / phase['seconds']
+            phase['tokens_per_second'] = phase['tokens'] / phase['seconds']
+        self.phase = None
+
+    def record(self, stage, seconds):
+        if self.phase is None:
+            return
+        with self._lock:
+            stages = self.phases[self.phase]['stages']
+            calls, total = stages.get(stage, (0, 0.))
+            stages[stage] = (calls + 1, total + seconds)
+
+    def count(self, documents):
+        '''It counts the documents (and their tokens) of the phase.
+
+        '''
+        if self.phase is None:
+            return
+        phase = self.phases[self.phase]
+        for document in documents:
+            phase['documents'] += 1
+            phase['tokens'] += sum(len(sentence.words)
+                                   for sentence in document.sentences)
+
+    def wrap(self, owner, name, stage, on_result=None):
+        '''It times each call of owner.name (a function of a module or a
+        method of a class) as stage.
+
+        '''
+        original = vars(owner)[name] if name in vars(owner) else \
+            getattr(owner, name)
+        profiler = self
+
+        def timed(*args, **kwargs):
+            start = time.time()
+            try:
+                result = original(*args, **kwargs)
+            finally:
+                profiler.record(stage, time.time() - start)
+            if on_result is not None:
+                on_result(result)
+            return result
+
+        self.replace(owner, name, timed)
+
+    def replace(self, owner, name, value):
+        '''It sets owner.name to value until restore() is called.
+
+        '''
+        original = vars(owner)[name] if name in vars(owner) else None
+        setattr(owner, name, value)
+        self._patches.append((owner, name, original))
+
+    def popen(self):
+        '''It returns a subprocess.Popen replacement which times each CRF++
+        process from its start to its end, by tool and model.
+
+        '''
+        profiler = self
+
+        class TimedPopen(subprocess.Popen):
+
+            def __init__(self, command, *args, **kwargs):
+                subprocess.Popen.__init__(self, command, *args, **kwargs)
+                start = time.time()
+                tool = 'crf_learn' if '-p' in command else 'crf_test'
+                model = command[-1] if tool == 'crf_learn' else \
+                    command[command.index('-m') + 1]
+                stage = '{} {}'.format(tool, os.path.basename(model))
+
+                def wait():
+                    self.wait()
+                    profiler.record(stage, time.time() - start)
+
+                waiter = threading.Thread(target=wait)
+                waiter.daemon = True
+                waiter.start()
+                profiler._waiters.append(waiter)
+
+        return TimedPopen
+
+    def restore(self):
+        for owner, name, original in reversed(self._patches):
+            if original is None:
+                delattr(owner, name)
+            else:
+                setattr(owner, name, original)
+        self._patches = []
+
+
+def instrument(profiler, mantime):
+    '''It wraps the stages of ManTIME with the profiler.
+
+    '''
+    from mantime import classifier
+    from mantime import readers
+    from mantime.model.document import Document
+
+    wrap = profiler.wrap
+    wrap(type(mantime.reader), 'parse_many', 'parse',
+         on_result=profiler.count)
+    wrap(type(readers.CORENLP), 'parse_many', 'corenlp')
+    wrap(Document, 'complete_structure', 'complete_structure')
+    wrap(type(mantime.extractor), 'extract', 'extract')
+    wrap(classifier.IdentificationClassifier, 'add_training_document',
+         'identification rows')
+    wrap(classifier.NormalisationClassifier, 'add_training_document',
+         'normalisation rows')
+    wrap(classifier.RelationClassifier, 'add_training_document',
+         'relation rows')
+    for name in ('identification_attribute_matrix',
+                 'normalisation_attribute_matrix', 'relation_matrix'):
+        wrap(classifier, name, name)
+    wrap(classifier.IdentificationClassifier, 'test', 'identify')
+    wrap(classifier.NormalisationClassifier, 'test', 'normalise')
+    wrap(classifier.RelationClassifier, 'test', 'link')
+    wrap(type(mantime.writer), 'write', 'write')
+    # only the classifier sees the timed Popen
+    timed_subprocess = types.ModuleType('subprocess')
+    vars(timed_subprocess).update(vars(subprocess))
+    timed_subprocess.Popen = profiler.popen()
+    profiler.replace(classifier, 'subprocess', timed_subprocess)
+
+
+def run(args, workspace):
+    '''It trains and tests ManTIME on the corpus and returns the results.
+
+    '''
+    from mantime import readers
+    from mantime.mantime import ManTIME
+    from mantime.readers import TempEval3FileReader
+    from mantime.writers import TempEval3Writer
+    from mantime.attributes_extractor import FullExtractor
+    from mantime.attributes_extractor import start_profiling
+    from mantime.attributes_extractor import stop_profiling
+
+    if args.corpus:
+        train_folder = test_folder = os.path.abspath(args.corpus)
+    else:
+        train_folder = synthetic_corpus(os.path.join(workspace, 'train'),
+                                        args.documents, args.sentences, 1)
+        test_folder = synthetic_corpus(os.path.join(workspace, 'test'),
+                                       args.test_documents or args.documents,
+                                       args.sentences, 2)
+    test_files = sorted(os.path.join(test_folder, name)
+                        for name in os.listdir(test_folder)
+                        if name.endswith('.tml'))
+
+    corenlp = readers.CORENLP
+    readers.CORENLP = replayed_corenlp(args.parses or
+                                       os.path.join(workspace, 'parses'))
+    mantime = ManTIME(reader=TempEval3FileReader(), writer=TempEval3Writer(),
+                      extractor=FullExtractor(), model_name=args.model,
+                      pipeline=args.post_processing_pipeline)
+    profiler = Profiler()
+    instrument(profiler, mantime)
+    extractors = None
+    try:
+        if args.warm_up:
+            # it fills the parse cache, so that both phases replay it
+            for folder in set((train_folder, test_folder)):
+                for name in sorted(os.listdir(folder)):
+                    if name.endswith('.tml'):
+                        mantime.reader.parse(os.path.join(folder, name))
+        if args.profile_extractors:
+            extractors = start_profiling()
+        profiler.start_phase('train')
+        mantime.train(train_folder, streaming=args.streaming)
+        profiler.end_phase()
+        mantime.documents = []
+
+        profiler.start_phase('label')
+        for file_path in test_files:
+            mantime.label(file_path)
+        profiler.end_phase()
+    finally:
+        stop_profiling()
+        profiler.restore()
+        readers.CORENLP = corenlp
+        if not args.keep_model and mantime.model:
+            shutil.rmtree(os.path.dirname(mantime.model.path), True)
+
+    if extractors:
+        with open(args.profile_extractors, 'w') as output:
+            extractors.write_folded(output)
+        extractors.write_report(sys.stderr)
+    return {'format': BENCHMARK_FORMAT,
+            'corpus': args.corpus or 'synthetic',
+            'documents': args.documents,
+            'sentences': args.sentences,
+            'crf': 'real' if args.crf else 'stand-in',
+            'phases': profiler.phases}
+
+
+def report(results):
+    '''It logs the timing of each phase and stage.
+
+    '''
+    for name in ('train', 'label'):
+        phase = results['phases'][name]
+        LOGGER.info(str('{}: {} docs, {} tokens in {:.2f}s ({:.2f} ' +
+                        'docs/s, {:.0f} tokens/s); process peak RSS so far ' +
+                        '{} (children {}).').format(
+            name, phase['documents'], phase['tokens'], phase['seconds'],
+            phase.get('docs_per_second', 0),
+            phase.get('tokens_per_second', 0), phase['peak_rss'],
+            phase['peak_rss_children']))
+        for stage, (calls, seconds) in sorted(
+                phase['stages'].iteritems(), key=lambda s: -s[1][1]):
+            LOGGER.info('  {:<40} {:>6} calls {:>9.3f}s {:>6.1%}'.format(
+                stage, calls, seconds, seconds / (phase['seconds'] or 1)))
+
+
+def compare(results, baseline, tolerance, noise=.05):
+    '''It returns the stages (and phases) slower than in baseline by more
+    than tolerance (a fraction of the baseline time per document).
+
+    Differences below noise seconds are ignored.
+    '''
+    regressions = []
+    for name, phase in results['phases'].iteritems():
+        old_phase = baseline['phases'].get(name)
+        if not old_phase or not phase['documents'] or \
+                not old_phase['documents']:
+            continue
+        timings = [('total', phase['seconds'], old_phase['seconds'])]
+        for stage, (_, seconds) in phase['stages'].iteritems():
+            if stage in old_phase['stages']:
+                timings.append((stage, seconds,
+                                old_phase['stages'][stage][1]))
+        for stage, seconds, old_seconds in timings:
+            new = seconds / phase['documents']
+            old = old_seconds / old_phase['documents']
+            change = (new - old) / old if old else 0.
+            LOGGER.info('{} {:<40} {:>9.4f}s/doc ({:+.1%})'.format(
+                name, stage, new, change))
+            if change > tolerance and (seconds - old_seconds) > noise:
+                regressions.append((name, stage, change))
+    return regressions
+
+
+def main():
+    ''' It runs the benchmark.
+    '''
+    parser = argparse.ArgumentParser(
+        description='ManTIME: end-to-end benchmark')
+    parser.add_argument('-n', '--documents', type=int, default=20,
+                        help='Synthetic training documents (default: 20)')
+    parser.add_argument('--test-documents', type=int, default=None,
+                        help='Synthetic test documents (default: as many ' +
+                        'as the training ones)')
+    parser.add_argument('--sentences', type=int, default=20,
+                        help='Sentences per synthetic document')
+    parser.add_argument('--corpus', default=None,
+                        help='Folder of TempEval-3 files used for both ' +
+                        'training and test instead of the synthetic corpus')
+    parser.add_argument('--parses', default=None,
+                        help='Folder of cached StanfordCoreNLP parses to ' +
+                        'replay (e.g. ./buffer/)')
+    parser.add_argument('--workspace', default=None,
+                        help='Folder for the corpus, the parses and the ' +
+                        'CRF++ stand-ins (kept between runs)')
+    parser.add_argument('--crf', action='store_true',
+                        help='it uses the real CRF++ binaries.')
+    parser.add_argument('--model', default='_benchmark',
+                        help='Name of the model trained (default: _benchmark)')
+    parser.add_argument('--keep-model', action='store_true',
+                        help='it keeps the trained model.')
+    parser.add_argument('-s', '--streaming', action='store_true',
+                        help='it trains in streaming mode.')
+    parser.add_argument('-ppp', '--post_processing_pipeline',
+                        action='store_true',
+                        help='it uses the post processing pipeline.')
+    parser.add_argument('--no-warm-up', dest='warm_up', action='store_false',
+                        help='it does not fill the parse cache beforehand.')
+    parser.add_argument('--save', default=None,
+                        help='File where the results are saved (JSON)')
+    parser.add_argument('--baseline', default=None,
+                        help='Results of a previous run to compare with')
+    parser.add_argument('--tolerance', type=float, default=.1,
+                        help='Slowdown allowed before a stage is reported ' +
+                        'as a regression (default: 0.1)')
+    parser.add_argument('--profile-extractors', default=None,
+                        help='File where the time spent in each feature ' +
+                        'extractor is saved (folded stacks, flamegraph.pl)')
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        help='it logs the annotation steps too.')
+    args = parser.parse_args()
+
+    logging.basicConfig(format='%(asctime)s: %(message)s',
+                        level=logging.INFO,
+                        datefmt='%m/%d/%Y %I:%M:%S %p')
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+        LOGGER.setLevel(logging.INFO)
+
+    # the gazetteers and the models are looked for from the ManTIME folder
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    workspace = args.workspace or tempfile.mkdtemp(prefix='mantime_bench_')
+    if not args.crf:
+        train, test = crf_standins(os.path.join(workspace, 'bin'))
+        os.environ['MANTIME_CRF_TRAIN'] = train
+        os.environ['MANTIME_CRF_TEST'] = test
+    os.environ.setdefault('MANTIME_CORENLP_FOLDER', workspace)
+
+    try:
+        results = run(args, workspace)
+    finally:
+        if not args.workspace:
+            shutil.rmtree(workspace, True)
+
+    report(results)
+    if args.save:
+        with open(args.save, 'w') as output:
+            json.dump(results, output, indent=2, sort_keys=True)
+    if args.baseline:
+        with open(args.baseline) as source:
+            baseline = json.load(source)
+        regressions = compare(results, baseline, args.tolerance)
+        for phase, stage, change in regressions:
+            LOGGER.info('Regression: {} {} {:+.1%}.'.format(phase, stage,
+                                                             change))
+        if regressions:
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
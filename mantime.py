@@ -14,13 +14,19 @@
 import argparse
 import codecs
 import glob
+import json
 import logging
 import os
+import sys
 
 from mantime.mantime import ManTIME
 from mantime.readers import TempEval3FileReader
 from mantime.writers import TempEval3Writer
 from mantime.attributes_extractor import FullExtractor
+from mantime.incremental import AnnotationManifest
+from mantime.incremental import configuration
+from mantime.metrics import METRICS
+from mantime.metrics import JSONLinesSink
 
 
 def main():
@@ -32,8 +38,9 @@ def main():
     # Parse input
     parser = argparse.ArgumentParser(
         description='ManTIME: temporal information extraction')
-    parser.add_argument('mode', choices=['train', 'test'],
-                        help='Train or Test mode?')
+    parser.add_argument('mode', choices=['train', 'test', 'cv', 'select'],
+                        help='Train, Test, cross-validation (cv) or ' +
+                        'feature selection (select) mode?')
     parser.add_argument('input_folder', help='Input data folder path')
     parser.add_argument('model',
                         help='Name of the model to use (case sensitive)')
@@ -42,43 +49,99 @@ def main():
     parser.add_argument('-ppp', '--post_processing_pipeline',
                         action='store_true',
                         help='it uses the post processing pipeline.')
+    parser.add_argument('--viterbi', action='store_true',
+                        help='with -ppp, it decodes again with the scale ' +
+                        'factors instead of rewriting the labels.')
+    parser.add_argument('-s', '--streaming', action='store_true',
+                        help='it trains without holding the whole corpus ' +
+                        'in memory.')
+    parser.add_argument('-r', '--resume', action='store_true',
+                        help='it resumes an interrupted training from its ' +
+                        'last checkpoint.')
+    parser.add_argument('-k', '--folds', type=int, default=10,
+                        help='Number of folds of the cross-validation.')
+    parser.add_argument('--seed', type=int, default=None,
+                        help='it shuffles the documents of the ' +
+                        'cross-validation with this seed.')
+    parser.add_argument('--features', default=None,
+                        help='Feature configuration (JSON) used by the ' +
+                        'train, test and cv modes and written by the ' +
+                        'select one (default: features.json).')
+    parser.add_argument('--keep', type=float, default=.5,
+                        help='Fraction of the attributes kept by the ' +
+                        'select mode.')
+    parser.add_argument('--context', type=float, default=.25,
+                        help='Fraction of the attributes with the whole ' +
+                        'CRF++ template in the select mode.')
+    parser.add_argument('-i', '--incremental', action='store_true',
+                        help='it annotates only the inputs changed since ' +
+                        'the last run with the same model and options.')
+    parser.add_argument('--metrics', default=None,
+                        help='File where the metric events are appended ' +
+                        '(JSON lines)')
     args = parser.parse_args()
+    if args.metrics:
+        METRICS.add_sink(JSONLinesSink(args.metrics))
+
+    features = None
+    if args.features and args.mode != 'select':
+        with open(args.features) as features_file:
+            features = json.load(features_file)
 
     # ManTIME
     mantime = ManTIME(reader=TempEval3FileReader(),
                       writer=TempEval3Writer(),
-                      extractor=FullExtractor(),
+                      extractor=FullExtractor(features),
                       model_name=args.model,
-                      pipeline=args.post_processing_pipeline)
+                      pipeline=args.post_processing_pipeline,
+                      decoding='viterbi' if args.viterbi else 'rewrite')
 
     if args.mode == 'train':
         # Training
-        mantime.train(args.input_folder)
+        mantime.train(args.input_folder, streaming=args.streaming,
+                      resume=args.resume)
+    elif args.mode == 'cv':
+        # Cross-validation
+        validation = mantime.cross_validate(args.input_folder, args.folds,
+                                            args.seed)
+        sys.stdout.write(validation.report())
+    elif args.mode == 'select':
+        # Feature selection
+        selection = mantime.select_features(args.input_folder, args.keep,
+                                            args.context, args.folds,
+                                            args.seed)
+        selection.write(args.features or 'features.json')
+        sys.stdout.write(selection.report())
     else:
         # Testing
         assert os.path.exists(args.input_folder), 'Model not found.'
         input_files = os.path.join(args.input_folder, '*.*')
         documents = sorted(glob.glob(input_files))
         assert documents, 'Input folder is empty.'
-        for index, doc in enumerate(documents, start=1):
+
+        def output_path(doc):
+            writein = os.path.join('./output/', os.path.basename(doc))
+            return '.'.join(writein.split('.')[:-1])
+
+        manifest = None
+        if args.incremental:
+            manifest = AnnotationManifest('./output/', configuration(mantime))
+            documents = manifest.pending(documents, output_path)
+
+        annotations = mantime.label_stream(documents,
+                                           output_path=output_path)
+        for index, (doc, file_path) in enumerate(annotations, start=1):
             basename = os.path.basename(doc)
-            writein = os.path.join('./output/', basename)
             position = '[{}/{}]'.format(index, len(documents))
-            # if writein not in glob.glob('./output/*.*'):
-            file_path = '.'.join(writein.split('.')[:-1])
-            with codecs.open(file_path, 'w', encoding='utf8') as output:
-                # try:
-                    logging.info('{} Doc {}.'.format(position, basename))
-                    output.write(mantime.label(doc)[0])
-                    logging.info('{} Doc {} annotated.'.format(position,
-                                                               basename))
-                # except Exception:
-                    # logging.error('{} Doc {} ** skipped **!'.format(
-                    #     position, basename))
-                    # os.remove(file_path)
-            # else:
-            #     logging.info('{} Doc {} already in output folder.'.format(
-            #         position, basename))
+            if not file_path:
+                # skipped documents get an empty output file
+                with codecs.open(output_path(doc), 'w', encoding='utf8'):
+                    pass
+            elif manifest:
+                manifest.record(doc, file_path)
+            logging.info('{} Doc {} annotated.'.format(position, basename))
+        if manifest:
+            manifest.close()
 
 if __name__ == '__main__':
     main()
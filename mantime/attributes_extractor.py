@@ -14,9 +14,13 @@
 '''This module collect attributes from a sentence.'''
 
 from __future__ import division
+import copy
 import inspect
 import logging
+import threading
+import time
 
+from model.document import FeatureHeader
 from model_extractors import WordBasedResult
 from model_extractors import WordBasedResults
 from model_extractors import SentenceBasedResult
@@ -27,6 +31,92 @@ from extractors import DocumentBasedExtractors
 from extractors import RelationExtractors
 
 
+# the ExtractorProfile of the extractors (None when not profiling)
+_PROFILE = None
+
+
+class ExtractorProfile(object):
+    """It records the number of calls and the cumulative time of each
+       extractor function (word, sentence and relation extractors).
+
+    """
+    def __init__(self):
+        self.timings = {}
+        self._lock = threading.Lock()
+
+    def wrap(self, kind, extractor):
+        """It returns extractor timed under (kind, extractor name).
+
+        """
+        key = (kind, extractor.func_name)
+        timings = self.timings
+        lock = self._lock
+        clock = time.time
+
+        def timed(*args):
+            start = clock()
+            try:
+                return extractor(*args)
+            finally:
+                elapsed = clock() - start
+                with lock:
+                    calls, seconds = timings.get(key, (0, 0.))
+                    timings[key] = (calls + 1, seconds + elapsed)
+        timed.func_name = extractor.func_name
+        return timed
+
+    def report(self):
+        """It returns (kind, name, calls, seconds) for each extractor, the
+           most expensive first.
+
+        """
+        return sorted(((kind, name, calls, seconds)
+                       for (kind, name), (calls, seconds)
+                       in self.timings.iteritems()),
+                      key=lambda row: (-row[3], row[0], row[1]))
+
+    def write_report(self, output):
+        """It writes the report as a table on output (a file-like object).
+
+        """
+        total = sum(seconds for _, _, _, seconds in self.report()) or 1.
+        output.write('{:<8} {:<45} {:>10} {:>10} {:>10} {:>7}\n'.format(
+            'kind', 'extractor', 'calls', 'seconds', 'us/call', 'share'))
+        for kind, name, calls, seconds in self.report():
+            output.write(
+                '{:<8} {:<45} {:>10} {:>10.3f} {:>10.2f} {:>7.2%}\n'.format(
+                    kind, name, calls, seconds, seconds * 1e6 / calls,
+                    seconds / total))
+
+    def write_folded(self, output, root='extract'):
+        """It writes the timings as folded stacks (microseconds), the input
+           format of flamegraph.pl and speedscope.
+
+        """
+        for kind, name, _, seconds in self.report():
+            output.write('{};{};{} {}\n'.format(root, kind, name,
+                                                 int(round(seconds * 1e6))))
+
+
+def start_profiling(profile=None):
+    """It times every extractor function from now on, in every
+       AttributesExtractor, and returns the ExtractorProfile.
+
+    """
+    global _PROFILE
+    _PROFILE = profile or ExtractorProfile()
+    return _PROFILE
+
+
+def stop_profiling():
+    """It stops timing the extractors and returns the ExtractorProfile.
+
+    """
+    global _PROFILE
+    profile, _PROFILE = _PROFILE, None
+    return profile
+
+
 class AttributesExtractor(object):
     """This class is a generic AttributesExtractor. In the future we can have
        muliple of them, each one dedicated to the identification of particular
@@ -34,73 +124,219 @@ class AttributesExtractor(object):
 
        An AttributeExtractor contains sentence attributes extractors and word
        attributes extractor.
+
+       The attribute names are computed once per extractor configuration and
+       stored in a FeatureHeader (sorted by name), shared by all the
+       sentences. Each extractor is bound to the header positions it fills.
+
+       While profiling (see start_profiling) the extractors are replaced by
+       timed copies, so that the profiling costs nothing when it is off.
+
+       With a cache (e.g. an LRUCache), the values of a sentence are stored
+       by its fingerprint and restored when the same sentence (same words,
+       parse and dependencies) is extracted again.
+
+       Its manifest declares the extractors it computes (by name) and the
+       CRF++ template levels of the attributes; it is stored with the models
+       trained on them, which bind (see bound) the extractors used to
+       annotate with them.
     """
+    # the kinds of extractors declared in a manifest (by attribute)
+    kinds = (('document', 'document_extractors'),
+             ('sentence', 'sentence_extractors'),
+             ('word', 'word_extractors'))
+
     def __init__(self):
         self.document_extractors = []
         self.sentence_extractors = []
         self.word_extractors = []
         self.relation_extractors = []
+        self.header = None
+        self.expected_header = None
+        self.template_patterns = None
+        self._sentence_columns = None
+        self._word_columns = None
+        self._timed = {}
+        self.cache = None
+
+    def manifest(self):
+        """It returns the declaration of the attributes it computes: the
+        names of its extractors by kind and the template level of the
+        attributes (the schema of a FullExtractor configuration).
+
+        """
+        return {'extractors': {kind: [extractor.func_name for extractor
+                                      in getattr(self, attribute)]
+                               for kind, attribute in self.kinds},
+                'patterns': self.template_patterns or {}}
+
+    def bound(self, manifest, header=None):
+        """It returns a copy of itself which computes only the extractors
+        listed in manifest, in its order, and checks that their attributes
+        are the ones of header (e.g. those of a model).
+
+        """
+        extractor = copy.copy(self)
+        for kind, attribute in self.kinds:
+            available = {function.func_name: function
+                         for function in getattr(self, attribute)}
+            names = manifest['extractors'].get(kind, [])
+            missing = [name for name in names if name not in available]
+            assert not missing, 'Missing {} extractors: {}.'.format(
+                kind, ', '.join(missing))
+            setattr(extractor, attribute, [available[name] for name in names])
+        extractor.template_patterns = manifest.get('patterns') or None
+        extractor.header = None
+        extractor.expected_header = header
+        extractor._sentence_columns = None
+        extractor._word_columns = None
+        extractor._timed = {}
+        extractor.cache = None
+        return extractor
+
+    def _profiled(self, kind, extractors):
+        """It returns the extractors, timed if profiling.
+
+        """
+        profile = _PROFILE
+        if profile is None:
+            return extractors
+        timed = self._timed.get(kind)
+        if timed is None or timed[0] is not profile:
+            timed = (profile, [profile.wrap(kind, extractor)
+                               for extractor in extractors])
+            self._timed[kind] = timed
+        return timed[1]
 
     def __name_attr(self, type, num, name):
         return '{num:0>3}_{type}_{name}'.format(num=num, type=type, name=name)
 
-    def __extract_from_word(self, word, attribute_number, level='word'):
+    def __names_from_word(self, word, attribute_number, level='word'):
+        """It returns the attribute names produced by each word extractor.
+
+        """
+        names = []
         for word_extractor in self.word_extractors:
             extractor_result = word_extractor(word)
             if type(extractor_result) == WordBasedResult:
-                attribute_name = self.__name_attr(level,
-                                                  attribute_number,
-                                                  word_extractor.func_name)
-                word.attributes[attribute_name] = extractor_result.value
-                attribute_number += 1
+                extractor_names = [self.__name_attr(level,
+                                                    attribute_number,
+                                                    word_extractor.func_name)]
             elif type(extractor_result) == WordBasedResults:
-                for attribute_name, attribute_value in extractor_result.values:
-                    attribute_name = self.__name_attr(level,
-                                                      attribute_number,
-                                                      attribute_name)
-                    word.attributes[attribute_name] = attribute_value.value
-                    attribute_number += 1
+                extractor_names = [self.__name_attr(level,
+                                                    attribute_number + num,
+                                                    attribute_name)
+                                   for num, (attribute_name, _)
+                                   in enumerate(extractor_result.values)]
             else:
                 print extractor_result, type(extractor_result)
                 raise Exception('Unexpected word-based attribute-value type.')
-        return attribute_number
+            attribute_number += len(extractor_names)
+            names.append(extractor_names)
+        return names, attribute_number
+
+    def __names_from_sentence(self, sentence, attribute_number,
+                              level='sentence'):
+        """It returns the attribute names produced by each sentence extractor.
 
-    def __extract_from_sentence(self, sentence, attribute_number,
-                                level='sentence'):
+        """
+        names = []
         for sentence_extrator in self.sentence_extractors:
             extractor_result = sentence_extrator(sentence)
+            if type(extractor_result) == SentenceBasedResult:
+                extractor_names = [self.__name_attr(
+                    level, attribute_number, sentence_extrator.func_name)]
+                attribute_number += 1
+            elif type(extractor_result) == SentenceBasedResults:
+                extractor_names = [self.__name_attr(level,
+                                                    attribute_number + num,
+                                                    attr_name)
+                                   for num, (attr_name, _)
+                                   in enumerate(extractor_result.values[0])]
+                attribute_number += len(extractor_names) + 1
+            else:
+                raise Exception('Unexpected sentence-based ' +
+                                'attribute-value type.')
+            names.append(extractor_names)
+        return names, attribute_number
+
+    def __names_from_document(self, document, attribute_number,
+                              level='document'):
+        return [], attribute_number
+
+    def __build_header(self, document, sentence):
+        """It builds the header and the positions filled by each extractor.
+
+        """
+        _, doc_attr_number = self.__names_from_document(document, 0)
+        sentence_names, sent_attr_number = self.__names_from_sentence(
+            sentence, doc_attr_number)
+        word_names, _ = self.__names_from_word(sentence.words[0],
+                                               sent_attr_number)
+        all_names = [name for names in sentence_names + word_names
+                     for name in names]
+        self.header = FeatureHeader(sorted(all_names))
+        position = lambda names: tuple(self.header.positions[name]
+                                       for name in names)
+        self._sentence_columns = [position(names) for names in sentence_names]
+        self._word_columns = [position(names) for names in word_names]
+        if self.expected_header is not None:
+            assert list(self.header) == list(self.expected_header), \
+                'The attributes differ from the ones of the model.'
+        logging.info('Attributes: header of {} columns built.'.format(
+            len(self.header)))
+
+    def extractor_columns(self):
+        """It returns the kind, the function and the header positions of
+        each sentence and word extractor (once the header is built).
+
+        """
+        assert self.header is not None, 'Header not built yet.'
+        return [('sentence', extractor, columns) for extractor, columns
+                in zip(self.sentence_extractors, self._sentence_columns)] + \
+            [('word', extractor, columns) for extractor, columns
+             in zip(self.word_extractors, self._word_columns)]
+
+    def __extract_from_word(self, word, sentence, word_extractors):
+        for word_extractor, columns in zip(word_extractors,
+                                           self._word_columns):
+            extractor_result = word_extractor(word)
+            if type(extractor_result) == WordBasedResult:
+                sentence.set_attribute(word.id_token, columns[0],
+                                       extractor_result.value)
+            elif type(extractor_result) == WordBasedResults:
+                for column, (_, attribute_value) in zip(
+                        columns, extractor_result.values):
+                    sentence.set_attribute(word.id_token, column,
+                                           attribute_value.value)
+            else:
+                print extractor_result, type(extractor_result)
+                raise Exception('Unexpected word-based attribute-value type.')
+
+    def __extract_from_sentence(self, sentence, sentence_extractors):
+        for sentence_extrator, columns in zip(sentence_extractors,
+                                              self._sentence_columns):
+            extractor_result = sentence_extrator(sentence)
             if type(extractor_result) == SentenceBasedResult:
                 assert len(extractor_result.values) == len(sentence.words)
                 for word_num, word_value in enumerate(extractor_result.values):
                     word = sentence.words[word_num]
-                    attr_name = self.__name_attr(level,
-                                                 attribute_number,
-                                                 sentence_extrator.func_name)
-                    word.attributes[attr_name] = word_value.value
-                attribute_number += 1
+                    sentence.set_attribute(word.id_token, columns[0],
+                                           word_value.value)
             elif type(extractor_result) == SentenceBasedResults:
                 assert len(extractor_result.values) == len(sentence.words)
                 for word_num, word_values in\
                         enumerate(extractor_result.values):
-                    num_attributes = 0
-                    for (attr_name, value) in word_values:
-                        word = sentence.words[word_num]
-                        attr_name = self.__name_attr(level,
-                                                     attribute_number,
-                                                     attr_name)
-                        word.attributes[attr_name] = value.value
-                        attribute_number += 1
-                        num_attributes += 1
-                    attribute_number -= num_attributes
-                attribute_number = attribute_number + num_attributes + 1
+                    word = sentence.words[word_num]
+                    for column, (_, value) in zip(columns, word_values):
+                        sentence.set_attribute(word.id_token, column,
+                                               value.value)
             else:
                 raise Exception('Unexpected sentence-based ' +
                                 'attribute-value type.')
-        return attribute_number
 
-    def __extract_from_document(self, document, attribute_number,
-                                level='document'):
-        return attribute_number
+    def __extract_from_document(self, document):
+        pass
 
     def extract(self, document):
         """It returns an updated word with all the attributes extractors
@@ -109,14 +345,32 @@ class AttributesExtractor(object):
         """
         # document-based extractors
         logging.info('Attributes: extracting...')
-        doc_attr_number = self.__extract_from_document(document, 0)
+        if self.header is None:
+            sentences = [s for s in document.sentences if s.words]
+            if not sentences:
+                logging.info('Attributes: no words to extract from.')
+                return document
+            self.__build_header(document, sentences[0])
+        self.__extract_from_document(document)
+        sentence_extractors = self._profiled('sentence',
+                                             self.sentence_extractors)
+        word_extractors = self._profiled('word', self.word_extractors)
+        cache = self.cache
         for sentence in document.sentences:
+            if cache is not None:
+                key = sentence.fingerprint()
+                values = cache.get(key)
+                if values is not None:
+                    sentence.load_attribute_values(self.header, *values)
+                    continue
+            sentence.reset_attributes(self.header)
             # sentence-based extractors
-            sent_attr_number = self.__extract_from_sentence(sentence,
-                                                            doc_attr_number)
+            self.__extract_from_sentence(sentence, sentence_extractors)
             for word in sentence.words:
                 # word-based extractors
-                self.__extract_from_word(word, sent_attr_number)
+                self.__extract_from_word(word, sentence, word_extractors)
+            if cache is not None:
+                cache.put(key, sentence.attribute_values())
         logging.info('Attributes: extracted.')
         return document
 
@@ -134,8 +388,13 @@ class TimexesExtractor(AttributesExtractor):
 class FullExtractor(AttributesExtractor):
     """This extracts all the attributes declared in ManTIME (extractors.py).
 
+    A configuration (e.g. written by feature_selection.FeatureSelection)
+    restricts it to the extractors listed by kind in
+    configuration['extractors'] (the kinds not listed are kept whole) and
+    gives, in configuration['patterns'], the CRF++ template level of each
+    attribute (see ClassificationModel._generate_template).
     """
-    def __init__(self):
+    def __init__(self, configuration=None):
         '''Takes all the extractors (functions) declared in extractors.py.'''
         super(FullExtractor, self).__init__()
         self.document_extractors = [function[1] for function
@@ -150,6 +409,23 @@ class FullExtractor(AttributesExtractor):
                                 in inspect.getmembers(
                                     WordBasedExtractors,
                                     predicate=inspect.isfunction)]
+        self.configuration = configuration
+        if configuration:
+            self.sentence_extractors = self._selected(
+                configuration, 'sentence', self.sentence_extractors)
+            self.word_extractors = self._selected(
+                configuration, 'word', self.word_extractors)
+            self.template_patterns = configuration.get('patterns')
+
+    @staticmethod
+    def _selected(configuration, kind, extractors):
+        names = configuration.get('extractors', {}).get(kind)
+        if names is None:
+            return extractors
+        unknown = set(names) - set(e.func_name for e in extractors)
+        assert not unknown, 'Unknown {} extractors: {}.'.format(
+            kind, ', '.join(sorted(unknown)))
+        return [e for e in extractors if e.func_name in names]
 
 
 class TemporalRelationExtractor(AttributesExtractor):
@@ -162,17 +438,34 @@ class TemporalRelationExtractor(AttributesExtractor):
                                     in inspect.getmembers(
                                     RelationExtractors,
                                     predicate=inspect.isfunction)]
+        names = ['{:0>3}_{}'.format(feature_id, extractor.func_name)
+                 for feature_id, extractor
+                 in enumerate(self.relation_extractors)]
+        self.header = FeatureHeader(sorted(names))
+        self._relation_columns = sorted(
+            zip(names, self.relation_extractors))
+        self._relation_names = [name for name, _ in self._relation_columns]
+        self._relation_functions = [extractor for _, extractor
+                                    in self._relation_columns]
+
+    def _columns(self):
+        return zip(self._relation_names,
+                   self._profiled('relation', self._relation_functions))
 
     def extract(self, from_obj, to_obj, document):
         '''It returns a dictionary of computed features.
 
         '''
-        features = dict()
-        for feature_id, extractor in enumerate(self.relation_extractors):
-            feature_name = '{:0>3}_{}'.format(feature_id,
-                                              extractor.func_name)
-            features[feature_name] = extractor(from_obj, to_obj, document)
-        return features
+        return {name: extractor(from_obj, to_obj, document)
+                for name, extractor in self._columns()}
+
+    def extract_row(self, from_obj, to_obj, document):
+        '''It returns the feature values in header order.
+
+        '''
+        return [extractor(from_obj, to_obj, document).value
+                for extractor in self._profiled('relation',
+                                                self._relation_functions)]
 
     @staticmethod
     def flip_relation(relation):
@@ -19,20 +19,26 @@ import subprocess
 import re
 import codecs
 import cPickle
+import hashlib
 from itertools import permutations
+import json
 import logging
 import os
 import shutil
 import multiprocessing
 from tempfile import NamedTemporaryFile
 
-from crf_utilities import get_scale_factors
-from crf_utilities import probabilistic_correction
-from crf_utilities import label_switcher
+from crf_utilities import count_scale_factor
+from crf_utilities import normalise_scale_factors
+from crf_utilities import ScaleFactors
+from crf_utilities import post_process
+from crf_utilities import viterbi_decode
+from metrics import METRICS
 from attributes_extractor import TemporalRelationExtractor
 from model.data import Event
 from model.data import TemporalExpression
 from model.data import TemporalLink
+from model.document import FeatureHeader
 from model.document import SequenceLabel
 from settings import PATH_MODEL_FOLDER
 from settings import PATH_CRF_PP_ENGINE_TEST
@@ -40,10 +46,76 @@ from settings import PATH_CRF_PP_ENGINE_TRAIN
 from settings import EVENT_ATTRIBUTES
 from settings import NO_ATTRIBUTE
 from settings import SENTENCE_WINDOW_RELATION
-from utilities import Mute_stderr
+from utilities import DEVNULL
 from utilities import extractors_stamp
 
 
+# version of the model bundle (manifest.json and the files it lists)
+MODEL_FORMAT = 1
+MODEL_FILE_PREFIXES = ('identification', 'normalisation', 'relation',
+                       'attribute')
+# the CRF++ patterns of a column by template level: 'unigram' keeps the
+# first three, 'full' all of them and 'none' no one (see FullExtractor)
+COLUMN_PATTERNS = ('%x[0,{0}]', '%x[-1,{0}]', '%x[1,{0}]',
+                   '%x[-2,{0}]/%x[-1,{0}]', '%x[-1,{0}]/%x[0,{0}]',
+                   '%x[0,{0}]/%x[1,{0}]', '%x[-1,{0}]/%x[0,{0}]/%x[1,{0}]',
+                   '%x[0,{0}]/%x[1,{0}]/%x[2,{0}]',
+                   # Super light
+                   '%x[1,{0}]/%x[2,{0}]', '%x[-2,{0}]/%x[-1,{0}]/%x[0,{0}]',
+                   '%x[-1,{0}]/%x[1,{0}]', '%x[-2,{0}]/%x[2,{0}]')
+TEMPLATE_LEVELS = {'full': COLUMN_PATTERNS, 'unigram': COLUMN_PATTERNS[:3],
+                   'none': ()}
+
+
+def identification_rows(document, subject):
+    """It yields the attribute values of each word of the document together
+    with its gold label for the identification of subject.
+
+    It yields None at the end of each sentence.
+
+    """
+    assert subject in ('EVENT', 'TIMEX'), 'Wrong identification subject.'
+    for sentence in document.sentences:
+        for word in sentence.words:
+            row = sentence.attribute_row(word.id_token)
+            gold_label = word.gold_label
+
+            if not gold_label.is_out():
+                # The class of the instances different from the subject
+                # are changed in 'O'
+                if subject == 'EVENT':
+                    if gold_label.is_timex():
+                        gold_label.set_out()
+                    else:
+                        # For events, we use the attribute CLASS.
+                        try:
+                            gold_label.tag = word.tag_attributes['class']
+                        except KeyError:
+                            # the clinical event type in i2b2 are
+                            # annotated with the attribute 'TYPE'.
+                            gold_label.tag = word.tag_attributes['type']
+                else:
+                    if gold_label.is_event():
+                        gold_label.set_out()
+            yield row, gold_label
+        yield None
+
+
+def write_identification_rows(rows, matrix, training=True):
+    """It writes in matrix (an open file) the rows of identification_rows.
+
+    """
+    for row in rows:
+        if row is None:
+            matrix.write('\n')
+            continue
+        row, gold_label = row
+        matrix.write('\t'.join(row))
+        if training:
+            matrix.write('\t' + str(gold_label))
+        matrix.write('\n')
+
+
 def identification_attribute_matrix(documents, dest, subject, training=True):
     """It writes in dest the entire training matrix for the identification.
 
@@ -55,44 +127,75 @@ def identification_attribute_matrix(documents, dest, subject, training=True):
     # It stores the attribute matrix
     with codecs.open(dest, 'w', encoding='utf8') as matrix:
         for document in documents:
-            for sentence in document.sentences:
-                for word in sentence.words:
-                    row = [v for _, v in sorted(word.attributes.items())]
-                    matrix.write('\t'.join(row))
-                    gold_label = word.gold_label.copy()
-
-                    if not gold_label.is_out():
-                        # The class of the instances different from the subject
-                        # are changed in 'O'
-                        if subject == 'EVENT':
-                            if gold_label.is_timex():
-                                gold_label.set_out()
-                            else:
-                                # For events, we use the attribute CLASS.
-                                try:
-                                    gold_label.tag = word.tag_attributes[
-                                        'class']
-                                except KeyError:
-                                    # the clinical event type in i2b2 are
-                                    # annotated with the attribute 'TYPE'.
-                                    gold_label.tag = word.tag_attributes[
-                                        'type']
-                        else:
-                            if gold_label.is_event():
-                                gold_label.set_out()
-                    if training:
-                        matrix.write('\t' + str(gold_label))
-                    matrix.write('\n')
-                matrix.write('\n')
+            write_identification_rows(identification_rows(document, subject),
+                                      matrix, training)
         matrix.close()
 
 
-def normalisation_attribute_matrix(documents, dest, subject, training=True):
-    """It writes in dest the entire training matrix for the attribute.
+def cached_identification_matrix(documents, dest, subject, cache, options):
+    """It writes in dest the test rows of the sentences whose labels are
+    not in cache and returns, for each sentence, its cache key, its cached
+    labels (None if missing) and its number of words.
+
+    A key is the MD5 of the rows of the sentence and of options (what else
+    the labels depend on): the CRF++ sequences are the sentences, hence the
+    labels of a sentence only depend on its own rows.
+
+    """
+    sentences = []
+    with codecs.open(dest, 'w', encoding='utf8') as matrix:
+        for document in documents:
+            rows = []
+            for row in identification_rows(document, subject):
+                if row is not None:
+                    rows.append(row)
+                    continue
+                md5_obj = hashlib.md5(repr(options))
+                for values, _ in rows:
+                    md5_obj.update(u'\t'.join(values).encode('utf8'))
+                    md5_obj.update('\n')
+                key = md5_obj.digest()
+                labels = cache.get(key) if rows else []
+                if labels is None:
+                    write_identification_rows(rows + [None], matrix,
+                                              training=False)
+                sentences.append((key, labels, len(rows)))
+                rows = []
+    return sentences
+
+
+def cached_labels(sentences, lines, cache):
+    """It yields the label of each word of sentences (as returned by
+    cached_identification_matrix), and '' at the end of each sentence,
+    taking the missing ones from lines (the labels of the sentences written
+    in the matrix) and caching them.
+
+    """
+    for key, labels, n_words in sentences:
+        if labels is None:
+            labels = []
+            for line in lines:
+                line = line.strip()
+                if not line:
+                    break
+                labels.append(line.split('\t')[-1])
+            assert len(labels) == n_words, 'Wrong number of labels.'
+            cache.put(key, labels)
+        for label in labels:
+            yield label
+        yield ''
+
+
+def write_normalisation_rows(document, ndoc, matrix, subject, prev_label=None,
+                             training=True):
+    """It writes in matrix (an open file) the normalisation rows of the
+    document and returns the last identification label seen.
+
+    The sequences are grouped by identification label across consecutive
+    documents, hence the label returned has to be passed along with the
+    following document.
 
     """
-    assert type(documents) == list, 'Wrong type for documents.'
-    assert len(documents) > 0, 'Empty documents list.'
     assert subject in EVENT_ATTRIBUTES
 
     if training:
@@ -100,126 +203,141 @@ def normalisation_attribute_matrix(documents, dest, subject, training=True):
     else:
         get_label = lambda word: word.predicted_label
 
-    prev_label = get_label(documents[0].sentences[0].words[0])
+    for nsen, sentence in enumerate(document.sentences):
+        for nwor, word in enumerate(sentence.words):
+            # attributes:
+            row = sentence.attribute_row(word.id_token)
+
+            # identification label:
+            # I keep only the EVENT label (not TIMEX)
+            ident_label = get_label(word)
+            if prev_label is None:
+                prev_label = ident_label
+            if ident_label.is_timex():
+                ident_label.set_out()
+            row.append(str(ident_label))
+
+            # discard words that are not positively labelled
+            if ident_label.is_out():
+                prev_label = ident_label
+                continue
 
-    # It stores the attribute matrix
-    with codecs.open(dest, 'w', encoding='utf8') as matrix:
-        for ndoc, document in enumerate(documents):
-            for nsen, sentence in enumerate(document.sentences):
-                for nwor, word in enumerate(sentence.words):
-                    # attributes:
-                    row = [v for _, v
-                           in sorted(word.attributes.items())]
-
-                    # identification label:
-                    # I keep only the EVENT label (not TIMEX)
-                    ident_label = get_label(word)
-                    if ident_label.is_timex():
-                        ident_label.set_out()
-                    row.append(str(ident_label))
-
-                    # discard words that are not positively labelled
-                    if ident_label.is_out():
-                        prev_label = ident_label
-                        continue
-
-                    # group sequences by identification label
-                    if str(prev_label) != str(ident_label):
-                        matrix.write('\n')
-
-                    # normalisation label (CLASS) for training
-                    if training:
-                        label = word.tag_attributes.get(subject, NO_ATTRIBUTE)
-
-                        # Different null representation are collapsed.
-                        label_to_be_fixed = any((not label, label == 'None',
-                                                 ident_label.is_out()))
-                        if label_to_be_fixed:
-                            label = NO_ATTRIBUTE
-
-                        label = label.replace(' ', '_').upper()
-                        row.append(label)
-
-                    # token coordinates for test purpose
-                    else:
-                        # I sneak in the coordinates of each token
-                        row.append('{}_{}_{}'.format(ndoc, nsen, nwor))
-                    matrix.write('\t'.join(row))
+            # group sequences by identification label
+            if str(prev_label) != str(ident_label):
+                matrix.write('\n')
 
-                    # I am using CRFs with singleton sequences
-                    matrix.write('\n')
+            # normalisation label (CLASS) for training
+            if training:
+                label = word.tag_attributes.get(subject, NO_ATTRIBUTE)
 
-                    prev_label = ident_label
-        matrix.close()
+                # Different null representation are collapsed.
+                label_to_be_fixed = any((not label, label == 'None',
+                                         ident_label.is_out()))
+                if label_to_be_fixed:
+                    label = NO_ATTRIBUTE
 
+                label = label.replace(' ', '_').upper()
+                row.append(label)
 
-def relation_matrix(documents, dest, training=True):
-    """ It writes in dest an entire feature matrix for the relations.
+            # token coordinates for test purpose
+            else:
+                # I sneak in the coordinates of each token
+                row.append('{}_{}_{}'.format(ndoc, nsen, nwor))
+            matrix.write('\t'.join(row))
+
+            # I am using CRFs with singleton sequences
+            matrix.write('\n')
+
+            prev_label = ident_label
+    return prev_label
+
+
+def normalisation_attribute_matrix(documents, dest, subject, training=True):
+    """It writes in dest the entire training matrix for the attribute.
 
     """
     assert type(documents) == list, 'Wrong type for documents.'
     assert len(documents) > 0, 'Empty documents list.'
+    assert subject in EVENT_ATTRIBUTES
 
+    # It stores the attribute matrix
+    with codecs.open(dest, 'w', encoding='utf8') as matrix:
+        prev_label = None
+        for ndoc, document in enumerate(documents):
+            if not training and ndoc:
+                # each document is labelled as if it were alone
+                prev_label = None
+                matrix.write('\n')
+            prev_label = write_normalisation_rows(
+                document, ndoc, matrix, subject, prev_label, training)
+        matrix.close()
+
+
+def write_relation_rows(document, doc_id, matrix, extractor, training=True):
+    """It writes in matrix (an open file) the relation rows of the document.
+
+    """
     if training:
-        annotations = lambda document: document.gold_annotations
+        annotations = document.gold_annotations
     else:
-        annotations = lambda document: document.predicted_annotations
+        annotations = document.predicted_annotations
 
     def sent_distance(obj1, obj2):
         return abs(obj1.id_sentence() - obj2.id_sentence())
 
+    inverted_index = {(obj.from_obj.identifier(),
+                       obj.to_obj.identifier()): obj.relation_type
+                      for obj in annotations.itervalues()
+                      if type(obj) == TemporalLink}
+    events = [e.identifier() for e in annotations.values()
+              if type(e) == Event]
+    timexes = [t.identifier() for t in annotations.values()
+               if type(t) == TemporalExpression]
+    candidated_objs = events + timexes
+    for from_id, to_id in permutations(candidated_objs, 2):
+        from_obj = annotations[from_id]
+        to_obj = annotations[to_id]
+
+        criteria_sent_distance = sent_distance(from_obj, to_obj) < \
+            SENTENCE_WINDOW_RELATION
+        criteria_meta = from_obj.meta or to_obj.meta
+
+        if criteria_meta or criteria_sent_distance:
+            if (from_id, to_id) in inverted_index:
+                row = extractor.extract_row(from_obj, to_obj, document)
+                if training:
+                    row.append(inverted_index[(from_id, to_id)])
+            elif (to_id, from_id) in inverted_index:
+                row = extractor.extract_row(to_obj, from_obj, document)
+                if training:
+                    row.append(TemporalRelationExtractor.flip_relation(
+                        inverted_index[(to_id, from_id)]))
+            else:
+                row = extractor.extract_row(from_obj, to_obj, document)
+                if training:
+                    row.append('O')
+            if not training:
+                # I sneak in the objects IDs
+                row.append('{}_{}_{}'.format(doc_id, from_id, to_id))
+            matrix.write('\t'.join(row))
+            matrix.write('\n\n')
+
+
+def relation_matrix(documents, dest, training=True):
+    """ It writes in dest an entire feature matrix for the relations.
+
+    """
+    assert type(documents) == list, 'Wrong type for documents.'
+    assert len(documents) > 0, 'Empty documents list.'
+
     extractor = TemporalRelationExtractor()
 
     # It stores the attribute matrix
-    features = {}
     with codecs.open(dest, 'w', encoding='utf8') as matrix:
         for doc_id, document in enumerate(documents):
-            inverted_index = {(obj.from_obj.identifier(),
-                               obj.to_obj.identifier()): obj.relation_type
-                              for obj
-                              in annotations(document).itervalues()
-                              if type(obj) == TemporalLink}
-            events = [e.identifier() for e in annotations(document).values()
-                      if type(e) == Event]
-            timexes = [t.identifier() for t in annotations(document).values()
-                       if type(t) == TemporalExpression]
-            candidated_objs = events + timexes
-            for from_id, to_id in permutations(candidated_objs, 2):
-                from_obj = annotations(document)[from_id]
-                to_obj = annotations(document)[to_id]
-
-                criteria_sent_distance = sent_distance(from_obj, to_obj) < \
-                    SENTENCE_WINDOW_RELATION
-                criteria_meta = from_obj.meta or to_obj.meta
-
-                if criteria_meta or criteria_sent_distance:
-                    if (from_id, to_id) in inverted_index.keys():
-                        features = extractor.extract(
-                            from_obj, to_obj, document)
-                        row = [v.value for _, v in sorted(features.items())]
-                        if training:
-                            row.append(inverted_index[(from_id, to_id)])
-                    elif (to_id, from_id) in inverted_index.keys():
-                        features = extractor.extract(
-                            to_obj, from_obj, document)
-                        row = [v.value for _, v in sorted(features.items())]
-                        if training:
-                            row.append(TemporalRelationExtractor.flip_relation(
-                                inverted_index[(to_id, from_id)]))
-                    else:
-                        features = extractor.extract(
-                            from_obj, to_obj, document)
-                        row = [v.value for _, v in sorted(features.items())]
-                        if training:
-                            row.append('O')
-                    if not training:
-                        # I sneak in the objects IDs
-                        row.append('{}_{}_{}'.format(doc_id, from_id, to_id))
-                    matrix.write('\t'.join(row))
-                    matrix.write('\n\n')
+            write_relation_rows(document, doc_id, matrix, extractor, training)
     matrix.close()
-    header = [name for name, _ in sorted(features.items())]
-    return header
+    return list(extractor.header)
 
 
 class Classifier(object):
@@ -236,6 +354,30 @@ class Classifier(object):
         """
         assert len(set([d.annotation_format for d in documents])) == 1
 
+    @abstractmethod
+    def start_training(self, model):
+        """ It opens the training matrices (streaming training).
+
+        """
+        pass
+
+    @abstractmethod
+    def add_training_document(self, document):
+        """ It appends the rows of a single document to the training
+            matrices (streaming training). The document can be released
+            afterwards.
+
+        """
+        pass
+
+    @abstractmethod
+    def end_training(self):
+        """ It closes the training matrices, trains the CRF models and
+            returns the ClassificationModel object (streaming training).
+
+        """
+        pass
+
     @abstractmethod
     def test(self, documents, model, post_processing_pipeline=False):
         """ It returns a List of <Document> (with .predicted_annotations
@@ -256,77 +398,151 @@ class IdentificationClassifier(Classifier):
         """It returns a ClassificationModel object.
 
         """
-        # TO-DO: feature extractor deve yieldare anziche' ritornare
         assert type(documents) == list, 'Wrong type for documents.'
         assert len(documents) > 0, 'Empty documents list.'
 
-        model = ClassificationModel(model_name)
+        self.start_training(model_name)
+        for document in documents:
+            self.add_training_document(document)
+        return self.end_training()
+
+    def start_training(self, model):
+        """It opens the training matrices of model (a ClassificationModel or
+        the name of a new one) and returns the model.
+
+        """
+        if not isinstance(model, ClassificationModel):
+            model = ClassificationModel(model)
+        self.model = model
+        self.trainingsets = {}
+        self.scaling_factors = {}
+        for idnt_class in ('EVENT', 'TIMEX'):
+            self.trainingsets[idnt_class] = codecs.open(
+                model.trainingset_path('identification', idnt_class), 'w',
+                encoding='utf8')
+            self.scaling_factors[idnt_class] = {}
+        return self.model
+
+    def add_training_document(self, document):
+        """It writes the identification rows of the document and counts the
+        labels for the scale factors.
 
-        # load the header into the model
-        first_word = documents[0].sentences[0].words[0]
-        header = [k for k, _ in sorted(first_word.attributes.items())]
-        model.load_header(header)
+        """
+        model = self.model
+        if not model.num_of_features:
+            # load the header into the model
+            header = list(document.sentences[0].header)
+            model.load_header(header)
 
-        # search for the token_normalised attribute position
-        token_normalised_pos = [p for p, a in enumerate(header)
-                                if a.find('token_normalised') > -1][0]
-        model.pp_pipeline_attribute_pos = token_normalised_pos
+            # search for the token_normalised attribute position
+            token_normalised_pos = [p for p, a in enumerate(header)
+                                    if a.find('token_normalised') > -1][0]
+            model.pp_pipeline_attribute_pos = token_normalised_pos
 
-        # save trainingset to model_name.trainingset.class
-        scaling_factors = {}
         for idnt_class in ('EVENT', 'TIMEX'):
-            path_and_model = (PATH_MODEL_FOLDER, model.name, idnt_class)
-            trainingset_path = '{}/{}/identification.trainingset.{}'.format(
-                *path_and_model)
-            identification_attribute_matrix(documents, trainingset_path,
-                                            idnt_class)
+            rows = []
+            for row in identification_rows(document, idnt_class):
+                if row is not None:
+                    count_scale_factor(
+                        self.scaling_factors[idnt_class],
+                        row[0][model.pp_pipeline_attribute_pos], row[1])
+                rows.append(row)
+            write_identification_rows(rows, self.trainingsets[idnt_class])
+
+    def end_training(self):
+        """It closes the training matrices and trains the identification CRF
+        models.
+
+        """
+        self.close_training()
+        return self.learn(self.model)
+
+    def close_training(self):
+        """It closes the training matrices and stores the scale factors.
+
+        """
+        model = self.model
+        assert model.num_of_features, 'No training documents.'
+        for idnt_class in ('EVENT', 'TIMEX'):
+            self.trainingsets[idnt_class].close()
 
             # save scale factors for post processing pipeline
-            scaling_factors[idnt_class] = get_scale_factors(
-                trainingset_path, token_normalised_pos)
+            normalise_scale_factors(self.scaling_factors[idnt_class])
+
+        # save factors in the model
+        model.load_scaling_factors(self.scaling_factors)
+
+    def learn(self, model):
+        """It trains the identification CRF models on the closed training
+        matrices of model, but the ones already trained (see
+        ClassificationModel.complete).
 
+        """
+        for idnt_class in ('EVENT', 'TIMEX'):
+            step = 'identification.{}'.format(idnt_class)
+            model_path = '{}.{}'.format(model.path, idnt_class)
+            if model.completed(step):
+                msg = 'Identification CRF model ({}): already trained.'
+                logging.info(msg.format(idnt_class))
+                continue
             crf_command = [PATH_CRF_PP_ENGINE_TRAIN,
                            '-p', str(self.num_cores), model.path_topology,
-                           trainingset_path, '{}.{}'.format(model.path,
-                                                            idnt_class)]
-            with Mute_stderr():
-                process = subprocess.Popen(crf_command, stdout=subprocess.PIPE)
-                _, _ = process.communicate()
+                           model.trainingset_path('identification',
+                                                  idnt_class),
+                           model_path]
+            METRICS.inc('mantime_subprocess_launches_total',
+                        program='crf_learn')
+            process = subprocess.Popen(crf_command, stdout=subprocess.PIPE,
+                                       stderr=DEVNULL)
+            _, _ = process.communicate()
 
             # TO-DO: Check if the script saves a model or returns an error
             logging.info('Identification CRF model ({}): trained.'.format(
                 idnt_class))
-
-        # save factors in the model
-        model.load_scaling_factors(scaling_factors)
+            if os.path.isfile(model_path):
+                model.complete(step, model_path)
 
         return model
 
-    def test(self, documents, model, post_processing_pipeline=False):
+    def test(self, documents, model, post_processing_pipeline=False,
+             decoding='rewrite'):
         """It returns the sequence of labels from the CRF classifier.
 
         It returns the same data structure (list of documents, of sentences,
         of words with the right labels.
 
+        With the post-processing pipeline, decoding says how the scale
+        factors are used: 'rewrite' adjusts the CRF labels token by token,
+        'viterbi' decodes again each sentence with the factors as a prior
+        and only valid label sequences.
+
         """
+        assert decoding in ('rewrite', 'viterbi'), 'Unknown decoding.'
+
         logging.info('Identification: applying ML models.')
-        if extractors_stamp() != model.extractors_md5:
+        # the extractors of the models with a manifest are bound by ManTIME
+        if getattr(model, 'extractors', None) is None and \
+                extractors_stamp() != model.extractors_md5:
             logging.warning('The feature extractor component is different ' +
                             'from the one used in the training!')
 
         if post_processing_pipeline:
-            try:
-                factors = cPickle.load(open(model.path_factors))
-                logging.info('Scale factors loaded.')
-            except IOError:
+            factors = model.scale_factors()
+            if factors is None:
                 post_processing_pipeline = False
                 logging.warning('Scale factors not found.')
 
+        cache = getattr(model, 'label_cache', None)
         for idnt_class in ('EVENT', 'TIMEX'):
             testset_path = NamedTemporaryFile(delete=False).name
             model_path = '{}.{}'.format(model.path, idnt_class)
-            identification_attribute_matrix(documents, testset_path,
-                                            idnt_class, training=False)
+            if cache is None:
+                identification_attribute_matrix(documents, testset_path,
+                                                idnt_class, training=False)
+            else:
+                sentences = cached_identification_matrix(
+                    documents, testset_path, idnt_class, cache,
+                    (idnt_class, post_processing_pipeline, decoding))
             if post_processing_pipeline:
                 crf_command = [PATH_CRF_PP_ENGINE_TEST, '-v2', '-m',
                                model_path, testset_path]
@@ -339,20 +555,38 @@ class IdentificationClassifier(Classifier):
             assert os.stat(model_path).st_size > 0, 'Model is empty!'
             assert os.path.isfile(testset_path), 'Test set doesn\'t exist!'
 
-            with Mute_stderr():
-                process = subprocess.Popen(crf_command, stdout=subprocess.PIPE)
+            if cache is None or any(labels is None
+                                    for _, labels, _ in sentences):
+                METRICS.inc('mantime_subprocess_launches_total',
+                            program='crf_test')
+                process = subprocess.Popen(crf_command,
+                                           stdout=subprocess.PIPE,
+                                           stderr=DEVNULL)
+                output = iter(process.stdout.readline, '')
+            else:
+                # every sentence is in the cache
+                output = iter(())
 
             n_doc, n_sent, n_word = 0, 0, 0
 
             # post-processing pipeline
-            if post_processing_pipeline and factors:
-                scale_factors = factors[idnt_class]
-                lines = label_switcher(probabilistic_correction(
-                    iter(process.stdout.readline, ''),
-                    scale_factors, model.pp_pipeline_attribute_pos, model.num_of_features, .5),
-                    scale_factors, model.pp_pipeline_attribute_pos, .87)
+            if post_processing_pipeline and decoding == 'viterbi':
+                lines = viterbi_decode(output,
+                                       factors[idnt_class],
+                                       model.pp_pipeline_attribute_pos,
+                                       model.num_of_features,
+                                       model.correction_threshold)
+            elif post_processing_pipeline:
+                lines = post_process(output,
+                                     factors[idnt_class],
+                                     model.pp_pipeline_attribute_pos,
+                                     model.num_of_features,
+                                     model.correction_threshold,
+                                     model.switching_threshold)
             else:
-                lines = iter(process.stdout.readline, '')
+                lines = output
+            if cache is not None:
+                lines = cached_labels(sentences, lines, cache)
 
             prev_element = None
             prev_label = SequenceLabel('O')
@@ -422,16 +656,19 @@ class IdentificationClassifier(Classifier):
                 # annotation at the end of a sentence and at the beginning of a
                 # new one.
                 else:
+                    # at the end of a document n_doc has been already
+                    # incremented: prev_element belongs to the previous one.
+                    end_of_document = n_word == 0 and n_sent == 0
                     if prev_element:
-                        try:
-                            documents[n_doc].predicted_annotations[
-                                prev_element.identifier()] = prev_element
-                        except IndexError:
-                            # we are at the end of the document and n_doc has
-                            # been already incremented. we need to add
-                            # prev_element to the previous document.
-                            documents[n_doc - 1].predicted_annotations[
-                                prev_element.identifier()] = prev_element
+                        owner = documents[n_doc - 1 if end_of_document
+                                          else n_doc]
+                        owner.predicted_annotations[
+                            prev_element.identifier()] = prev_element
+                    if end_of_document:
+                        # each document is labelled as if it were alone
+                        prev_element = None
+                        prev_label = SequenceLabel('O')
+                        n_timex, n_event = 1, 1
 
         logging.info('Identification: done.')
         return documents
@@ -449,25 +686,78 @@ class NormalisationClassifier(Classifier):
         """It returns a ClassificationModel object for event CLASS attributes.
 
         """
-        # TO-DO: feature extractor deve yieldare anziche' ritornare
         assert type(documents) == list, 'Wrong type for documents.'
         assert len(documents) > 0, 'Empty documents list.'
 
+        self.start_training(model)
+        for document in documents:
+            self.add_training_document(document)
+        return self.end_training()
+
+    def start_training(self, model):
+        """It opens the training matrices of the attributes.
+
+        """
+        self.model = model
+        self.trainingsets = {}
+        self.prev_labels = {}
+        self.n_documents = 0
         # save trainingset to model_name.trainingset.*attribute*
         for attribute in self.attributes:
-            path_model_attribute = (PATH_MODEL_FOLDER, model.name, attribute)
-            trainingset_path = '{}/{}/normalisation.trainingset.{}'.format(
-                *path_model_attribute)
-            normalisation_attribute_matrix(documents, trainingset_path,
-                                           attribute, training=True)
+            self.trainingsets[attribute] = codecs.open(
+                model.trainingset_path('normalisation', attribute), 'w',
+                encoding='utf8')
+            self.prev_labels[attribute] = None
+        return model
+
+    def add_training_document(self, document):
+        """It writes the normalisation rows of the document.
+
+        """
+        for attribute in self.attributes:
+            self.prev_labels[attribute] = write_normalisation_rows(
+                document, self.n_documents, self.trainingsets[attribute],
+                attribute, self.prev_labels[attribute], training=True)
+        self.n_documents += 1
+
+    def end_training(self):
+        """It closes the training matrices and trains the normalisation CRF
+        models.
+
+        """
+        self.close_training()
+        return self.learn(self.model)
+
+    def close_training(self):
+        """It closes the training matrices.
+
+        """
+        assert self.n_documents, 'No training documents.'
+        for attribute in self.attributes:
+            self.trainingsets[attribute].close()
+
+    def learn(self, model):
+        """It trains the normalisation CRF models on the closed training
+        matrices of model, but the ones already trained.
+
+        """
+        for attribute in self.attributes:
+            step = 'normalisation.{}'.format(attribute)
             model_path = '{}.{}'.format(model.path_normalisation, attribute)
+            if model.completed(step):
+                msg = 'Normalisation CRF model ({}): already trained.'
+                logging.info(msg.format(attribute))
+                continue
             crf_command = [PATH_CRF_PP_ENGINE_TRAIN, '-p', str(self.num_cores),
-                           model.path_attribute_topology, trainingset_path,
+                           model.path_attribute_topology,
+                           model.trainingset_path('normalisation', attribute),
                            model_path]
 
-            with Mute_stderr():
-                process = subprocess.Popen(crf_command, stdout=subprocess.PIPE)
-                _, _ = process.communicate()
+            METRICS.inc('mantime_subprocess_launches_total',
+                        program='crf_learn')
+            process = subprocess.Popen(crf_command, stdout=subprocess.PIPE,
+                                       stderr=DEVNULL)
+            _, _ = process.communicate()
 
             # Weakly check the output models
             if not os.path.isfile(model_path):
@@ -476,6 +766,7 @@ class NormalisationClassifier(Classifier):
             else:
                 msg = 'Normalisation CRF model ({}): trained.'
                 logging.info(msg.format(attribute))
+                model.complete(step, model_path)
         return model
 
     def test(self, documents, model, domain='general'):
@@ -509,26 +800,27 @@ class NormalisationClassifier(Classifier):
                 logging.error(msg.format(attribute.lower(), testset_path))
                 continue
 
-            with Mute_stderr():
-                process = subprocess.Popen(crf_command, stdout=subprocess.PIPE,
-                                           stderr=None, stdin=None)
-
-                for line in iter(process.stdout.readline, ''):
-                    line = line.strip()
-                    if line:
-                        line = line.split('\t')
-                        label = line[-1]
-                        location = line[-2]
-                        seq_label = SequenceLabel(line[-3])
-                        if seq_label.is_event():
-                            n_doc, n_sent, n_word = location.split('_')
-                            documents[int(n_doc)]\
-                                .sentences[int(n_sent)].words[int(n_word)]\
-                                .tag_attributes[attribute] = label
-
-                # close stdout
-                process.stdout.close()
-                process.wait()
+            METRICS.inc('mantime_subprocess_launches_total',
+                        program='crf_test')
+            process = subprocess.Popen(crf_command, stdout=subprocess.PIPE,
+                                       stderr=DEVNULL, stdin=None)
+
+            for line in iter(process.stdout.readline, ''):
+                line = line.strip()
+                if line:
+                    line = line.split('\t')
+                    label = line[-1]
+                    location = line[-2]
+                    seq_label = SequenceLabel(line[-3])
+                    if seq_label.is_event():
+                        n_doc, n_sent, n_word = location.split('_')
+                        documents[int(n_doc)]\
+                            .sentences[int(n_sent)].words[int(n_word)]\
+                            .tag_attributes[attribute] = label
+
+            # close stdout
+            process.stdout.close()
+            process.wait()
 
             # delete testset
             os.remove(testset_path)
@@ -560,29 +852,75 @@ class RelationClassifier(Classifier):
         """ It returns a RelationModel object.
 
         """
-        # TO-DO: feature extractor deve yieldare anziche' ritornare
         assert type(documents) == list, 'Wrong type for documents.'
         assert len(documents) > 0, 'Empty documents list.'
 
-        path_model_attribute = (PATH_MODEL_FOLDER, model.name)
-        trainingset_path = '{}/{}/relation.trainingset.TLINK'.format(
-            *path_model_attribute)
-        header = relation_matrix(documents, trainingset_path, training=True)
-        model.load_relation_header(header)
+        self.start_training(model)
+        for document in documents:
+            self.add_training_document(document)
+        return self.end_training()
+
+    def start_training(self, model):
+        """ It opens the training matrix of the temporal links.
+
+        """
+        self.model = model
+        self.extractor = TemporalRelationExtractor()
+        self.n_documents = 0
+        self.trainingset = codecs.open(
+            model.trainingset_path('relation', 'TLINK'), 'w', encoding='utf8')
+        return model
+
+    def add_training_document(self, document):
+        """ It writes the relation rows of the document.
+
+        """
+        write_relation_rows(document, self.n_documents, self.trainingset,
+                            self.extractor, training=True)
+        self.n_documents += 1
+
+    def end_training(self):
+        """ It closes the training matrix and trains the temporal relation
+            CRF model.
+
+        """
+        self.close_training()
+        return self.learn(self.model)
+
+    def close_training(self):
+        """ It closes the training matrix and stores the relation header.
+
+        """
+        assert self.n_documents, 'No training documents.'
+        self.trainingset.close()
+        self.model.load_relation_header(list(self.extractor.header))
+
+    def learn(self, model):
+        """ It trains the temporal relation CRF model on the closed training
+            matrix of model, unless it is already trained.
+
+        """
         model_path = '{}'.format(model.path_relation)
+        if model.completed('relation'):
+            logging.info('Temporal relation model: already trained.')
+            return model
         crf_command = [PATH_CRF_PP_ENGINE_TRAIN, '-p', str(self.num_cores),
-                       model.path_relation_topology, trainingset_path,
+                       model.path_relation_topology,
+                       model.trainingset_path('relation', 'TLINK'),
                        model_path]
 
-        with Mute_stderr():
-            process = subprocess.Popen(crf_command, stdout=subprocess.PIPE)
-            _, _ = process.communicate()
+        METRICS.inc('mantime_subprocess_launches_total',
+                    program='crf_learn')
+        process = subprocess.Popen(crf_command, stdout=subprocess.PIPE,
+                                   stderr=DEVNULL)
+        _, _ = process.communicate()
 
         # Weakly check the output models
         if not os.path.isfile(model_path):
             logging.error('Temporal relation model: *not* trained.')
         else:
             logging.error('Temporal relation model: trained.')
+            model.complete('relation', model_path)
         return model
 
     def test(self, documents, model):
@@ -610,29 +948,30 @@ class RelationClassifier(Classifier):
             logging.error(msg.format(testset_path))
             return documents
 
-        with Mute_stderr():
-            process = subprocess.Popen(crf_command, stdout=subprocess.PIPE,
-                                       stderr=None, stdin=None)
-
-            tlink_counter = 0
-            for line in iter(process.stdout.readline, ''):
-                line = line.strip()
-                if line:
-                    line = line.split('\t')
-                    relation_type = line[-1].strip()
-                    if relation_type != 'O':
-                        n_doc, from_id, to_id = line[-2].split('_')
-                        n_doc = int(n_doc)
-                        annotations = documents[n_doc].predicted_annotations
-                        tlink_id = 'TL{}'.format(tlink_counter)
-                        from_obj = annotations[from_id]
-                        to_obj = annotations[to_id]
-                        annotations[tlink_id] = TemporalLink(
-                            tlink_id, from_obj, to_obj, relation_type)
-                        tlink_counter += 1
-            # close stdout
-            process.stdout.close()
-            process.wait()
+        METRICS.inc('mantime_subprocess_launches_total',
+                    program='crf_test')
+        process = subprocess.Popen(crf_command, stdout=subprocess.PIPE,
+                                   stderr=DEVNULL, stdin=None)
+
+        tlink_counters = [0] * len(documents)
+        for line in iter(process.stdout.readline, ''):
+            line = line.strip()
+            if line:
+                line = line.split('\t')
+                relation_type = line[-1].strip()
+                if relation_type != 'O':
+                    n_doc, from_id, to_id = line[-2].split('_')
+                    n_doc = int(n_doc)
+                    annotations = documents[n_doc].predicted_annotations
+                    tlink_id = 'TL{}'.format(tlink_counters[n_doc])
+                    from_obj = annotations[from_id]
+                    to_obj = annotations[to_id]
+                    annotations[tlink_id] = TemporalLink(
+                        tlink_id, from_obj, to_obj, relation_type)
+                    tlink_counters[n_doc] += 1
+        # close stdout
+        process.stdout.close()
+        process.wait()
 
         # delete testset
         os.remove(testset_path)
@@ -650,42 +989,316 @@ class ClassificationModel(object):
     model. In order to check for it I'll check if the timestamps of the .pyc
     files are equal. Does something more elegant exists? I don't know.
 
+    A new model is built in a staging folder (the model folder name plus
+    '.staging'), which replaces the model folder only when the model is
+    saved: until then the previous model stays in place and loadable. The
+    previous model folder is renamed '.old' during the swap: if the swap is
+    interrupted, load falls back to it and the next training puts it back.
+
+    The staging folder holds a training checkpoint as well (training.json):
+    the steps completed so far (the training matrices and each CRF++ model)
+    with the size of their files. With resume, a model whose checkpoint
+    matches the extractors and the corpus continues from there.
+
+    The manifest of the extractors the model is trained with (see
+    AttributesExtractor.manifest) is stored with it: the annotations are
+    extracted with those extractors only (see ManTIME) and the attributes
+    checked against the header of the model.
     """
-    def __init__(self, model_name):
-        simplify = lambda name: re.sub(r'[\W]+', '', re.sub(r'\s+', '_', name))
-        self.name = simplify(model_name)
-        path_and_model = (PATH_MODEL_FOLDER, self.name)
-        self.path = '{}/{}/identification.model'.format(*path_and_model)
-        self.path_normalisation = '{}/{}/normalisation.model'.format(
-            *path_and_model)
-        self.path_relation = '{}/{}/relation.model'.format(*path_and_model)
-        self.path_topology = '{}/{}/identification.template'.format(
-            *path_and_model)
-        self.path_attribute_topology = '{}/{}/attribute.template'.format(
-            *path_and_model)
-        self.path_relation_topology = '{}/{}/relation.template'.format(
-            *path_and_model)
-        self.path_header = '{}/{}/identification.header'.format(
-            *path_and_model)
-        self.path_relation_header = '{}/{}/relation.header'.format(
-            *path_and_model)
-        self.path_factors = '{}/{}/identification.factors'.format(
-            *path_and_model)
-        shutil.rmtree('{}/{}'.format(*path_and_model), ignore_errors=True)
-        os.makedirs('{}/{}'.format(*path_and_model))
+    # thresholds of the post-processing pipeline
+    correction_threshold = .5
+    switching_threshold = .87
+
+    def __init__(self, model_name, resume=False, corpus=None,
+                 extractors=None):
+        name = self.simplify(model_name)
+        self._restore_previous(name)
+        self.staging = '{}/{}.staging'.format(PATH_MODEL_FOLDER, name)
+        self._set_paths(name, self.staging)
         self.num_of_features = 0
+        self.num_of_relation_features = 0
         self.topology = None
         self.relation_topology = None
         self.attribute_topology = None
         self.pp_pipeline_attribute_pos = None
+        self.extractors = extractors
+        self.template_patterns = (extractors or {}).get('patterns') or None
+        self.header_names = None
         self.extractors_md5 = extractors_stamp()
+        self.corpus = corpus
+        self.steps = {}
+        self._factors = None
+        if not (resume and self._load_checkpoint()):
+            shutil.rmtree(self.staging, ignore_errors=True)
+            os.makedirs(self.staging)
         logging.info('Classification model: initialised.')
 
+    def _load_checkpoint(self):
+        """It restores the training checkpoint of the staging folder and
+        returns whether it can be resumed.
+
+        """
+        try:
+            with open(self.path_checkpoint) as checkpoint_file:
+                checkpoint = json.load(checkpoint_file)
+        except (IOError, ValueError):
+            logging.info('Training checkpoint: not found.')
+            return False
+        if checkpoint['format'] != MODEL_FORMAT or \
+                checkpoint['extractors_md5'] != \
+                self.extractors_md5.encode('hex') or \
+                checkpoint.get('extractors') != self.extractors or \
+                checkpoint['corpus'] != self.corpus:
+            logging.warning('Training checkpoint: extractors or corpus ' +
+                            'changed, training from scratch.')
+            return False
+        self.num_of_features = checkpoint['num_of_features']
+        self.num_of_relation_features = \
+            checkpoint['num_of_relation_features']
+        self.pp_pipeline_attribute_pos = \
+            checkpoint['pp_pipeline_attribute_pos']
+        for step, files in checkpoint['steps'].iteritems():
+            # the files of a step must be the ones it produced
+            if all(os.path.isfile(os.path.join(self.folder, file_name)) and
+                   os.path.getsize(os.path.join(self.folder, file_name)) ==
+                   size for file_name, size in files.iteritems()):
+                self.steps[step] = files
+        logging.info('Training checkpoint: resuming after {}.'.format(
+            ', '.join(sorted(self.steps)) or 'nothing'))
+        return True
+
+    def completed(self, step):
+        """It says whether the training step has been completed.
+
+        """
+        return step in self.steps
+
+    def complete(self, step, *paths):
+        """It records in the checkpoint that the training step has been
+        completed, producing the files at paths.
+
+        """
+        self.steps[step] = {os.path.basename(path): os.path.getsize(path)
+                            for path in paths}
+        checkpoint = {'format': MODEL_FORMAT,
+                      'name': self.name,
+                      'extractors_md5': self.extractors_md5.encode('hex'),
+                      'extractors': self.extractors,
+                      'corpus': self.corpus,
+                      'num_of_features': self.num_of_features,
+                      'num_of_relation_features':
+                          self.num_of_relation_features,
+                      'pp_pipeline_attribute_pos':
+                          self.pp_pipeline_attribute_pos,
+                      'steps': self.steps}
+        tmp_path = self.path_checkpoint + '.tmp'
+        with open(tmp_path, 'w') as checkpoint_file:
+            json.dump(checkpoint, checkpoint_file, indent=2, sort_keys=True)
+            checkpoint_file.flush()
+            os.fsync(checkpoint_file.fileno())
+        os.rename(tmp_path, self.path_checkpoint)
+
+    @staticmethod
+    def simplify(model_name):
+        return re.sub(r'[\W]+', '', re.sub(r'\s+', '_', model_name))
+
+    def _set_paths(self, name, folder=None):
+        self.name = name
+        self.folder = folder or '{}/{}'.format(PATH_MODEL_FOLDER, name)
+        self.path_manifest = '{}/manifest.json'.format(self.folder)
+        self.path_checkpoint = '{}/training.json'.format(self.folder)
+        self.path = '{}/identification.model'.format(self.folder)
+        self.path_normalisation = '{}/normalisation.model'.format(
+            self.folder)
+        self.path_relation = '{}/relation.model'.format(self.folder)
+        self.path_topology = '{}/identification.template'.format(self.folder)
+        self.path_attribute_topology = '{}/attribute.template'.format(
+            self.folder)
+        self.path_relation_topology = '{}/relation.template'.format(
+            self.folder)
+        self.path_header = '{}/identification.header'.format(self.folder)
+        self.path_relation_header = '{}/relation.header'.format(self.folder)
+        self.path_factors = '{}/identification.factors'.format(self.folder)
+
+    def trainingset_path(self, prefix, subject):
+        """It returns the path of a training matrix (e.g. identification,
+        EVENT).
+
+        """
+        return '{}/{}.trainingset.{}'.format(self.folder, prefix, subject)
+
+    def files(self):
+        """It returns the paths of the files of the model which exist (CRF++
+        models, templates, headers and scale factors, not the training
+        matrices).
+
+        """
+        folder = os.path.dirname(self.path_manifest)
+        return sorted(os.path.join(folder, file_name)
+                      for file_name in os.listdir(folder)
+                      if file_name.split('.')[0] in MODEL_FILE_PREFIXES and
+                      '.trainingset' not in file_name)
+
+    def fingerprint(self):
+        """It returns an MD5 digest (hex) which identifies the trained model:
+        the extractors stamp, the extractors manifest and the content of
+        the model files.
+
+        """
+        md5_obj = hashlib.md5(self.extractors_md5)
+        if getattr(self, 'extractors', None):
+            md5_obj.update(json.dumps(self.extractors, sort_keys=True))
+        for path in self.files():
+            md5_obj.update(os.path.basename(path))
+            with open(path, 'rb') as model_file:
+                for chunk in iter(lambda: model_file.read(1 << 20), ''):
+                    md5_obj.update(chunk)
+        return md5_obj.hexdigest()
+
+    def save(self):
+        """It writes the manifest of the model, which makes the model files
+        in its folder a loadable bundle.
+
+        """
+        manifest = {'format': MODEL_FORMAT,
+                    'name': self.name,
+                    'extractors_md5': self.extractors_md5.encode('hex'),
+                    'extractors': self.extractors,
+                    'num_of_features': self.num_of_features,
+                    'num_of_relation_features': getattr(
+                        self, 'num_of_relation_features', 0),
+                    'pp_pipeline_attribute_pos':
+                        self.pp_pipeline_attribute_pos,
+                    'correction_threshold': self.correction_threshold,
+                    'switching_threshold': self.switching_threshold,
+                    'files': {os.path.basename(path): os.path.getsize(path)
+                              for path in self.files()}}
+        tmp_path = self.path_manifest + '.tmp'
+        with open(tmp_path, 'w') as manifest_file:
+            json.dump(manifest, manifest_file, indent=2, sort_keys=True)
+        os.rename(tmp_path, self.path_manifest)
+        logging.info('Classification model: manifest stored.')
+        if getattr(self, 'staging', None):
+            self._commit()
+
+    @staticmethod
+    def _restore_previous(name):
+        """It puts the previous model folder back in place if a swap (see
+        _commit) has been interrupted before the new one was in place.
+
+        """
+        final = '{}/{}'.format(PATH_MODEL_FOLDER, name)
+        old = final + '.old'
+        if os.path.isdir(old) and not os.path.exists(final):
+            logging.warning('Classification model: {} restored.'.format(
+                final))
+            os.rename(old, final)
+
+    def _commit(self):
+        """It moves the staging folder in place of the model folder.
+
+        """
+        final = '{}/{}'.format(PATH_MODEL_FOLDER, self.name)
+        old = final + '.old'
+        if os.path.isfile(self.path_checkpoint):
+            os.remove(self.path_checkpoint)
+        shutil.rmtree(old, ignore_errors=True)
+        if os.path.exists(final):
+            os.rename(final, old)
+        os.rename(self.staging, final)
+        shutil.rmtree(old, ignore_errors=True)
+        self.staging = None
+        self._set_paths(self.name)
+        logging.info('Classification model: {} in place.'.format(final))
+
+    @classmethod
+    def load(cls, model_name):
+        """It returns the model called model_name.
+
+        Only the manifest is read: the CRF++ models are read (memory-mapped)
+        by crf_test and the scale factors are loaded on first use. Models
+        saved before the manifest existed are unpickled. It raises IOError
+        if there is no such model. If the model folder is missing because a
+        swap has been interrupted, the previous model ('.old') is loaded.
+
+        """
+        model = cls.__new__(cls)
+        model._set_paths(cls.simplify(model_name))
+        old = model.folder + '.old'
+        if not os.path.isdir(model.folder) and os.path.isdir(old):
+            # a swap has been interrupted (see _commit)
+            logging.warning('Classification model: {} used.'.format(old))
+            model._set_paths(model.name, old)
+        try:
+            with open(model.path_manifest) as manifest_file:
+                manifest = json.load(manifest_file)
+        except IOError:
+            legacy_path = '{}/{}/model.pickle'.format(PATH_MODEL_FOLDER,
+                                                      model_name)
+            with open(legacy_path) as legacy_file:
+                legacy_model = cPickle.load(legacy_file)
+            # the paths added with the manifest (e.g. used by files())
+            legacy_model._set_paths(legacy_model.name,
+                                    os.path.dirname(legacy_path))
+            return legacy_model
+        if manifest['format'] != MODEL_FORMAT:
+            raise IOError('Unknown model format: {}.'.format(
+                manifest['format']))
+        folder = os.path.dirname(model.path_manifest)
+        for file_name, size in manifest['files'].iteritems():
+            path = os.path.join(folder, file_name)
+            if not os.path.isfile(path) or os.path.getsize(path) != size:
+                raise IOError('Model file {} is missing or changed.'.format(
+                    path))
+        model.num_of_features = manifest['num_of_features']
+        model.num_of_relation_features = manifest['num_of_relation_features']
+        model.pp_pipeline_attribute_pos = \
+            manifest['pp_pipeline_attribute_pos']
+        model.extractors_md5 = str(manifest['extractors_md5']).decode('hex')
+        model.correction_threshold = manifest.get(
+            'correction_threshold', cls.correction_threshold)
+        model.switching_threshold = manifest.get(
+            'switching_threshold', cls.switching_threshold)
+        model.topology = None
+        model.relation_topology = None
+        model.attribute_topology = None
+        model.extractors = manifest.get('extractors')
+        model.template_patterns = None
+        model.header_names = None
+        model._factors = None
+        return model
+
+    def header(self):
+        """It returns the attribute names of the identification matrices.
+
+        """
+        with open(self.path_header) as header_file:
+            return header_file.read().split('\n')
+
+    def scale_factors(self):
+        """It returns the scale factors of the post-processing pipeline by
+        identification class (ScaleFactors objects), loading and indexing
+        them the first time (None if they are not available).
+
+        """
+        if getattr(self, '_factors', None) is None:
+            try:
+                with open(self.path_factors) as factors_file:
+                    factors = cPickle.load(factors_file)
+                self._factors = {idnt_class: ScaleFactors(class_factors)
+                                 for idnt_class, class_factors
+                                 in factors.iteritems()}
+                logging.info('Scale factors loaded.')
+            except IOError:
+                return None
+        return self._factors
+
     def load_header(self, header):
         """It loads the header and stores it.
 
         """
         self.num_of_features = len(header)
+        self.header_names = list(header)
         with open(self.path_header, 'w') as header_file:
             header_file.write('\n'.join(header))
         logging.info('Identification header: stored.')
@@ -725,6 +1338,19 @@ class ClassificationModel(object):
             'CRF topology template (attribute={}, links={}): stored.'.format(
                 attribute, relation))
 
+    def _column_patterns(self, column, relation=False):
+        """It returns the patterns of a column, according to its template
+        level in template_patterns (by FeatureHeader.key, 'full' if not
+        given).
+
+        """
+        level = 'full'
+        if self.template_patterns and self.header_names and not relation \
+                and column < len(self.header_names):
+            level = self.template_patterns.get(
+                FeatureHeader.key(self.header_names[column]), 'full')
+        return TEMPLATE_LEVELS[level]
+
     def _generate_template(self, attribute=False, relation=False):
         """It generates and dumps the CRF template for CRF++.
 
@@ -739,19 +1365,8 @@ class ClassificationModel(object):
 
         patterns = set()
         for i in xrange(n_of_features):
-            patterns.add('%x[0,{}]'.format(i))
-            patterns.add('%x[-1,{}]'.format(i))
-            patterns.add('%x[1,{}]'.format(i))
-            patterns.add('%x[-2,{}]/%x[-1,{}]'.format(i, i))
-            patterns.add('%x[-1,{}]/%x[0,{}]'.format(i, i))
-            patterns.add('%x[0,{}]/%x[1,{}]'.format(i, i))
-            patterns.add('%x[-1,{}]/%x[0,{}]/%x[1,{}]'.format(i, i, i))
-            patterns.add('%x[0,{}]/%x[1,{}]/%x[2,{}]'.format(i, i, i))
-            # Super light
-            patterns.add('%x[1,{}]/%x[2,{}]'.format(i, i))
-            patterns.add('%x[-2,{}]/%x[-1,{}]/%x[0,{}]'.format(i, i, i))
-            patterns.add('%x[-1,{}]/%x[1,{}]'.format(i, i))
-            patterns.add('%x[-2,{}]/%x[2,{}]'.format(i, i))
+            for pattern in self._column_patterns(i, relation):
+                patterns.add(pattern.format(i))
             # for m in sorted(list(set(range(num_of_features)) - set([i]))):
             #   template.add('%%x[0,%d]/%%x[0,%d]' % (i,m))
             #   template.add('%%x[-1,%d]/%%x[0,%d]' % (i,m))
@@ -0,0 +1,205 @@
+#!/usr/bin/env python
+#
+#   Copyright 2015 Michele Filannino
+#
+#   gnTEAM, School of Computer Science, University of Manchester.
+#   All rights reserved. This program and the accompanying materials
+#   are made available under the terms of the GNU General Public License.
+#
+#   author: Michele Filannino
+#   email:  filannim@cs.man.ac.uk
+#
+#   For details, see www.cs.man.ac.uk/~filannim/
+
+'''It contains the columnar export of the attribute matrices.
+
+   A CRF++ attribute matrix is plain text: a row per token, tab-separated
+   values (the last one is the label) and an empty line after each sequence.
+   The same values are written over and over, often as quoted strings. The
+   columnar layout stores each value once, in a vocabulary shared by all the
+   columns, and each column as an array of 32 bit integers (the vocabulary
+   indices), so that a column is loaded without parsing:
+
+       manifest.json     header, number of rows and sequences, byte order
+       vocabulary.txt    a value per line (UTF-8), line i has index i
+       columns.bin       the columns one after the other (column-major)
+       sequences.bin     the index of the first row of each sequence
+
+   columns.bin can be memory-mapped as it is, e.g. with
+   numpy.memmap(path, dtype='<i4', mode='r', shape=(columns, rows)).
+'''
+
+from array import array
+import codecs
+import io
+import json
+import os
+import sys
+
+COLUMNAR_FORMAT = 1
+
+
+class ColumnarMatrixBuilder(object):
+    '''It collects the rows of an attribute matrix as integer columns.
+
+    '''
+
+    def __init__(self, header=None):
+        self.header = list(header) if header is not None else None
+        self.vocabulary = {}
+        self.values = []
+        self.columns = None
+        self.sequences = array('i')
+        self.rows = 0
+        self._sequence_open = False
+
+    def _index(self, value):
+        index = self.vocabulary.get(value)
+        if index is None:
+            index = len(self.values)
+            self.vocabulary[value] = index
+            self.values.append(value)
+        return index
+
+    def add_row(self, row):
+        '''It appends a row (a sequence of strings) to the current sequence.
+
+        '''
+        if self.columns is None:
+            self.columns = [array('i') for _ in row]
+            # the columns without a name (e.g. the label) get their position
+            header = self.header or []
+            assert len(header) <= len(row), 'Wrong header length.'
+            self.header = header + [str(i) for i in xrange(len(header),
+                                                           len(row))]
+        assert len(row) == len(self.columns), 'Wrong row length.'
+        if not self._sequence_open:
+            self.sequences.append(self.rows)
+            self._sequence_open = True
+        index = self._index
+        for column, value in zip(self.columns, row):
+            column.append(index(value))
+        self.rows += 1
+
+    def end_sequence(self):
+        '''It closes the current sequence (empty sequences are ignored).
+
+        '''
+        self._sequence_open = False
+
+    def add_lines(self, lines):
+        '''It appends the rows of a CRF++ matrix given as lines of text.
+
+        '''
+        for line in lines:
+            line = line.rstrip('\r\n')
+            if line:
+                self.add_row(line.split('\t'))
+            else:
+                self.end_sequence()
+
+    def save(self, dest):
+        '''It writes the matrix in the columnar layout in dest (a folder).
+
+        '''
+        if not os.path.exists(dest):
+            os.makedirs(dest)
+        with open(os.path.join(dest, 'columns.bin'), 'wb') as columns:
+            for column in self.columns or []:
+                column.tofile(columns)
+        with open(os.path.join(dest, 'sequences.bin'), 'wb') as sequences:
+            self.sequences.tofile(sequences)
+        with codecs.open(os.path.join(dest, 'vocabulary.txt'), 'w',
+                         encoding='utf8') as vocabulary:
+            for value in self.values:
+                vocabulary.write(value)
+                vocabulary.write('\n')
+        manifest = {'format': COLUMNAR_FORMAT,
+                    'header': self.header or [],
+                    'rows': self.rows,
+                    'sequences': len(self.sequences),
+                    'vocabulary': len(self.values),
+                    'typecode': 'i',
+                    'itemsize': array('i').itemsize,
+                    'byteorder': sys.byteorder}
+        with open(os.path.join(dest, 'manifest.json'), 'w') as output:
+            json.dump(manifest, output, indent=2, sort_keys=True)
+        return dest
+
+
+class ColumnarMatrix(object):
+    '''An attribute matrix stored in the columnar layout.
+
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'manifest.json')) as source:
+            manifest = json.load(source)
+        assert manifest['format'] == COLUMNAR_FORMAT, 'Unknown format.'
+        assert manifest['itemsize'] == array('i').itemsize, \
+            'Unsupported integer size.'
+        self.header = manifest['header']
+        self.rows = manifest['rows']
+        self._swap = manifest['byteorder'] != sys.byteorder
+        with io.open(os.path.join(path, 'vocabulary.txt'), encoding='utf8',
+                     newline='\n') as source:
+            self.vocabulary = [line[:-1] for line in source]
+        assert len(self.vocabulary) == manifest['vocabulary'], \
+            'Corrupted vocabulary.'
+        self.sequences = self._read('sequences.bin', 0,
+                                    manifest['sequences'])
+
+    def _read(self, file_name, offset, length):
+        values = array('i')
+        with open(os.path.join(self.path, file_name), 'rb') as source:
+            source.seek(offset * values.itemsize)
+            values.fromfile(source, length)
+        if self._swap:
+            values.byteswap()
+        return values
+
+    def column(self, column):
+        '''It returns the vocabulary indices of a column (given by position
+        or by header name) as an array of integers.
+
+        '''
+        if not isinstance(column, int):
+            column = self.header.index(column)
+        assert 0 <= column < len(self.header), 'Wrong column.'
+        return self._read('columns.bin', column * self.rows, self.rows)
+
+    def values(self, column):
+        '''It returns the values of a column as strings.
+
+        '''
+        vocabulary = self.vocabulary
+        return [vocabulary[index] for index in self.column(column)]
+
+    def to_text(self, dest):
+        '''It writes the matrix back in the CRF++ text format.
+
+        '''
+        columns = [self.values(i) for i in xrange(len(self.header))]
+        starts = set(self.sequences)
+        with codecs.open(dest, 'w', encoding='utf8') as matrix:
+            for row in xrange(self.rows):
+                if row in starts and row:
+                    matrix.write('\n')
+                matrix.write('\t'.join(column[row] for column in columns))
+                matrix.write('\n')
+            if self.rows:
+                matrix.write('\n')
+        return dest
+
+
+def columnar_matrix(matrix_path, dest, header=None):
+    '''It converts a CRF++ attribute matrix (e.g. the output of
+    identification_attribute_matrix, normalisation_attribute_matrix or
+    relation_matrix) to the columnar layout in dest.
+
+    '''
+    builder = ColumnarMatrixBuilder(header)
+    with io.open(matrix_path, encoding='utf8', newline='\n') as matrix:
+        builder.add_lines(matrix)
+    return builder.save(dest)
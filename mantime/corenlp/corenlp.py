@@ -385,7 +385,8 @@ def parse_xml_output(input_dir, corenlp_path=DIRECTORY, memory="3g", raw_output=
 
     #creates the xml file of parser output:
 
-    call(command, shell=True)
+    with open(os.devnull, 'w') as devnull:
+        call(command, shell=True, stderr=devnull)
 
     #reading in the raw xml file:
     # result = []
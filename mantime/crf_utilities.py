@@ -26,13 +26,14 @@
 
 from __future__ import division
 
-import argparse
+from array import array
 import codecs
 from collections import Counter
 from os.path import isfile
 import logging
-import pickle
-import sys
+import math
+
+from model.document import SequenceLabel
 
 
 def get_scale_factors(source, column_index):
@@ -47,12 +48,28 @@ def get_scale_factors(source, column_index):
         for row in source.xreadlines():
             row = row.strip().split('\t')
             if len(row) > 1:
-                word = row[column_index]
-                label = unicode(row[-1])
-                scale_factors.setdefault(word, Counter([label]))
-                scale_factors[word][label] += 1.0
+                count_scale_factor(scale_factors, row[column_index], row[-1])
+    return normalise_scale_factors(scale_factors)
+
+
+def count_scale_factor(scale_factors, word, label):
+    '''It updates the label counts of *word* in *scale_factors*.
+
+       The counts can be collected incrementally (one row at a time) and
+       turned into scale factors by normalise_scale_factors.
+    '''
+    if isinstance(word, unicode):
+        word = word.encode('utf8')
+    label = unicode(label)
+    scale_factors.setdefault(word, Counter([label]))
+    scale_factors[word][label] += 1.0
 
-    # normalise scale_factors (counts)
+
+def normalise_scale_factors(scale_factors):
+    '''It normalises the label counts in place and returns them.
+
+       Words with less than two positive occurrences are discarded.
+    '''
     for word in scale_factors.keys():
         freq = sum(scale_factors[word].values())
         freq_positive = sum((c for k, c in scale_factors[word].iteritems()
@@ -65,126 +82,211 @@ def get_scale_factors(source, column_index):
     return scale_factors
 
 
-def probabilistic_correction(row_iterator, factors, index, lenght, threshold):
-    '''It yields perturbated sequences of predicted labels accoding to the
-       specified *threshold*.
+class ScaleFactors(dict):
+    '''The scale factors of an identification class: a dictionary of words
+       with their label probabilities (Counter objects).
+
+       The most likely label of each word, with its probability, is computed
+       once and kept in *best*.
+    '''
+
+    def __init__(self, factors=()):
+        super(ScaleFactors, self).__init__(factors)
+        self.best = {word: counts.most_common(1)[0]
+                     for word, counts in self.iteritems()}
+
 
-       It takes in input an attribute values matrix (N instances x M columns)
-       and returns a matrix with a DIFFERENT DIMENSION [Nx(M-4)].
+def read_sentences(row_iterator, index, lenght):
+    '''It yields the sentences of crf_test -v2 output, each one as a tuple:
+       (words, predicted labels, labels, marginals).
+
+       *labels* are the labels in the order CRF++ prints their marginals
+       and *marginals* is the flat (words x labels) array of probabilities.
+       Each line is split once; the lines without tabs are the sentence
+       headers ('# <probability>') and separators.
     '''
-    assert 0. <= threshold <= 1., 'Invalid threshold.'
-
-    def get_marginals(elements):
-        return {e.split('/')[0]: float(e.split('/')[1]) for e in elements}
-
-    def perturbate_row(marginals, factor, threshold):
-        '''It analyses the CRF predictions of a single token and returns the
-           most likely perturbated label with its confidence rate.
-        '''
-        import operator
-        # extract dictionary from CRF predictions
-        perturbate_value = lambda value1, value2, threshold: \
-            (value1*threshold) + value2*(1-threshold)
-        # perturbate it in place
-        for label, confidence in marginals.iteritems():
-            marginals[label] = perturbate_value(confidence, factor[label],
-                                                threshold)
-        best_prediction, best_prediction_confidence = sorted(
-            marginals.iteritems(), key=operator.itemgetter(1),
-            reverse=True)[0]
-        return (best_prediction, best_prediction_confidence)
-
-    try:
-        line = next(row_iterator).strip().split('\t')
-        while True:
-            # we skip lines which are not carrying data
-            # this happens when we use crf_test -v2 (verbose mode)
-            # the second condition makes sure it's not a data line with simply
-            # has a word starting by '#'.
-            if not (line[0].strip().startswith('#') or len(line) == 1):
-                current_word = line[index]
-                prediction = line[lenght].split('/')[0]
-                assert prediction[0] in 'OBIW', 'Wrong sequence label.'
-                marginals = get_marginals(line[lenght+1:])
-                data = '\t'.join(line[:-4])
-                if current_word in factors.keys():
-                    perturbated_label, confidence = \
-                        perturbate_row(marginals, factors[current_word],
-                                       threshold)
-                    if confidence >= threshold:
-                        if prediction != perturbated_label:
-                            logging.debug('PER: "{}"  {} --> {}'.format(
-                                current_word, prediction, perturbated_label))
-                        yield '{}\t{}'.format(data, perturbated_label)
-                    else:
-                        yield '{}\t{}'.format(data, prediction)
-                else:
-                    yield '{}\t{}'.format(data, prediction)
-            else:
-                if line[0].strip():
-                    yield ''
-            line = next(row_iterator).strip().split('\t')
-    except StopIteration:
-        pass
-
-
-def label_switcher(row_iterator, factors, index, threshold):
-    '''It yields adjusted sequences of predicted labels according to the
-       specified *threshold*.
-
-       It takes in input an attribute values matrix (N instances x M columns)
-       and returns a matrix with the SAME DIMENSION.
+    words, predictions, marginals = [], [], array('d')
+    labels = None
+    for line in row_iterator:
+        line = line.strip().split('\t')
+        if len(line) == 1:
+            if words:
+                yield words, predictions, labels, marginals
+                words, predictions, marginals = [], [], array('d')
+            continue
+        prediction = line[lenght].split('/')[0]
+        assert prediction[0] in 'OBIW', 'Wrong sequence label.'
+        columns = [column.split('/') for column in line[lenght + 1:]]
+        if labels is None:
+            labels = tuple(column[0] for column in columns)
+        words.append(line[index])
+        predictions.append(prediction)
+        marginals.extend(float(column[1]) for column in columns)
+    if words:
+        yield words, predictions, labels, marginals
+
+
+def post_process(row_iterator, factors, index, lenght, correction_threshold,
+                 switching_threshold):
+    '''It yields the post-processed label of each token of crf_test -v2
+       output, and '' at the end of each sentence.
+
+       For each sentence, the marginals of the words with scale factors are
+       perturbated towards the factors, and their best label replaces the
+       predicted one when it reaches correction_threshold; then the words
+       whose most likely label is confident enough are switched to it.
+    '''
+    assert 0. <= correction_threshold <= 1., 'Invalid threshold.'
+    assert 0. <= switching_threshold <= 1., 'Invalid threshold.'
+    if not isinstance(factors, ScaleFactors):
+        factors = ScaleFactors(factors)
+    weight = correction_threshold
+    for words, labels, label_names, marginals in read_sentences(
+            row_iterator, index, lenght):
+        n_labels = len(label_names)
+        positions = [position for position, word in enumerate(words)
+                     if word in factors]
+
+        # perturbation of the marginals of the known words
+        for position in positions:
+            factor = factors[words[position]]
+            start = position * n_labels
+            scores = [marginal * weight + factor[label] * (1 - weight)
+                      for marginal, label in zip(
+                          marginals[start:start + n_labels], label_names)]
+            best = max(xrange(n_labels), key=scores.__getitem__)
+            if scores[best] >= correction_threshold:
+                labels[position] = label_names[best]
+
+        # label switching of the confident words
+        for position in positions:
+            label, confidence = factors.best[words[position]]
+            if confidence >= switching_threshold:
+                labels[position] = label
+
+        for label in labels:
+            yield label
+        yield ''
+
+
+class TransitionConstraints(object):
+    '''The label transitions that the annotation schema (IO, BIO, BIOE,
+       WBIOE...) can produce, derived from SequenceLabel.chunk_positions.
+    '''
+
+    def __init__(self, annotation_format):
+        self.first, self.last, self.inside = set(), set(), set()
+        # every position pattern appears within annotations up to 4 words
+        for length in (1, 2, 3, 4):
+            pattern = SequenceLabel.chunk_positions(length, annotation_format)
+            self.first.add(pattern[0])
+            self.last.add(pattern[-1])
+            self.inside.update(zip(pattern, pattern[1:]))
+
+    @staticmethod
+    def split(label):
+        position, _, tag = label.partition('-')
+        return position, tag
+
+    def can_start(self, label):
+        position, _ = self.split(label)
+        return position == 'O' or position in self.first
+
+    def can_end(self, label):
+        position, _ = self.split(label)
+        return position == 'O' or position in self.last
+
+    def allowed(self, previous, label):
+        '''It says whether label can follow previous.'''
+        prev_position, prev_tag = self.split(previous)
+        position, tag = self.split(label)
+        if prev_position == 'O':
+            return position == 'O' or position in self.first
+        if position == 'O':
+            return prev_position in self.last
+        # same annotation or two adjacent ones
+        return (prev_tag == tag and (prev_position, position) in self.inside
+                or prev_position in self.last and position in self.first)
+
+
+def constrained_viterbi(scores, n_labels, allowed, start, end):
+    '''It returns the label indices of the best valid sequence.
+
+       *scores* is the flat (words x labels) array of emission scores,
+       *allowed* the (labels x labels) transition matrix (previous, next)
+       and *start* and *end* say which labels can begin and end a sequence.
+       If no sequence is valid, it returns the best label of each word.
+    '''
+    minus_inf = float('-inf')
+    n_words = len(scores) // n_labels
+    labels = xrange(n_labels)
+    best = [scores[label] if start[label] else minus_inf for label in labels]
+    backpointers = []
+    for word in xrange(1, n_words):
+        offset = word * n_labels
+        pointers, current = [], []
+        for label in labels:
+            candidates = [best[previous] if allowed[previous][label]
+                          else minus_inf for previous in labels]
+            previous = max(labels, key=candidates.__getitem__)
+            pointers.append(previous)
+            current.append(candidates[previous] + scores[offset + label])
+        backpointers.append(pointers)
+        best = current
+    final = [best[label] if end[label] else minus_inf for label in labels]
+    label = max(labels, key=final.__getitem__)
+    if final[label] == minus_inf:
+        logging.warning('Viterbi: no valid sequence, best labels used.')
+        return [max(labels, key=lambda label: scores[offset + label])
+                for offset in xrange(0, n_words * n_labels, n_labels)]
+    path = [label]
+    for pointers in reversed(backpointers):
+        label = pointers[label]
+        path.append(label)
+    path.reverse()
+    return path
+
+
+def viterbi_decode(row_iterator, factors, index, lenght, weight):
+    '''It yields the label of each token of crf_test -v2 output, and ''
+       at the end of each sentence, decoding each sentence again with the
+       scale factors as a prior.
+
+       The emission score of a label is the log of its CRF marginal or, for
+       the words with scale factors, of the marginal mixed with the factor
+       (weight * marginal + (1 - weight) * factor, as in the correction of
+       post_process). Only the transitions the annotation
+       schema can produce are allowed, hence the result is always a valid
+       sequence.
     '''
-    assert 0. <= threshold <= 1., 'Invalid threshold.'
-
-    try:
-        line = next(row_iterator).strip().split('\t')
-        while True:
-            if len(line) > 1:
-                current_word = line[index]
-                prediction = line[-1]
-                data = '\t'.join(line[:-1])
-                if current_word in factors.keys():
-                    most_likely_label, confidence = \
-                        factors[current_word].most_common(1)[0]
-                    if confidence >= threshold:
-                        if prediction != most_likely_label:
-                            logging.debug('LBS: "{}"  {} --> {}'.format(
-                                current_word, prediction, most_likely_label))
-                        yield '{}\t{}'.format(
-                            data, most_likely_label)
-                    else:
-                        yield '{}\t{}'.format(data, prediction)
-                else:
-                    yield '{}\t{}'.format(data, prediction)
-            else:
-                yield ''
-            line = next(row_iterator).strip().split('\t')
-    except StopIteration:
-        pass
-
-
-def main():
-    '''It reads from stdin and adjust or perturbate.'''
-    parser = argparse.ArgumentParser(
-        description='ManTIME: adjust predicted sequences.')
-    parser.add_argument('algorithm', help='training set file.')
-    parser.add_argument('option2', help='threshold or patterns.')
-    args = parser.parse_args()
-
-    lines = sys.stdin.xreadlines()
-    factors = pickle.load(open('models/tempeval3/factors'))['TIMEX']
-    if args.algorithm == 'probabilistic_correction':
-        adjusted_lines = probabilistic_correction(lines, factors,
-                                                  135, float(args.option2))
-    elif args.algorithm == 'label_switcher':
-        adjusted_lines = label_switcher(lines, factors, 135,
-                                        float(args.option2))
-    else:
-        raise NameError('Algorithm name invalid!')
-
-    for adjusted_line in adjusted_lines:
-        print adjusted_line
-
-if __name__ == '__main__':
-    main()
+    assert 0. <= weight <= 1., 'Invalid weight.'
+    if not isinstance(factors, ScaleFactors):
+        factors = ScaleFactors(factors)
+    tiny = 1e-12
+    label_names = constraints = None
+    for words, _, names, marginals in read_sentences(row_iterator, index,
+                                                     lenght):
+        if names != label_names:
+            label_names = names
+            positions = set(TransitionConstraints.split(name)[0]
+                            for name in names)
+            constraints = TransitionConstraints(''.join(positions))
+            allowed = [[constraints.allowed(previous, label)
+                        for label in names] for previous in names]
+            start = [constraints.can_start(label) for label in names]
+            end = [constraints.can_end(label) for label in names]
+        n_labels = len(names)
+        scores = array('d', marginals)
+        for position, word in enumerate(words):
+            factor = factors.get(word)
+            offset = position * n_labels
+            for label in xrange(n_labels):
+                probability = scores[offset + label]
+                if factor is not None:
+                    probability = (weight * probability +
+                                   (1 - weight) * factor[names[label]])
+                scores[offset + label] = math.log(max(probability, tiny))
+        for label in constrained_viterbi(scores, n_labels, allowed, start,
+                                         end):
+            yield names[label]
+        yield ''
@@ -0,0 +1,400 @@
+#!/usr/bin/env python
+#
+#   Copyright 2015 Michele Filannino
+#
+#   gnTEAM, School of Computer Science, University of Manchester.
+#   All rights reserved. This program and the accompanying materials
+#   are made available under the terms of the GNU General Public License.
+#
+#   author: Michele Filannino
+#   email:  filannim@cs.man.ac.uk
+#
+#   For details, see www.cs.man.ac.uk/~filannim/
+
+'''It contains the cross-validation of ManTIME and its error measures.
+
+   The corpus is parsed and extracted once: the training rows of each
+   document (identification, normalisation and relation matrices) are
+   rendered once as well, together with the label counts of the scale
+   factors, and the training matrices of each fold are assembled from them.
+   The folds are trained and tested in parallel (CRF++ runs in separate
+   processes, hence threads suffice).
+
+   Each stage is scored with precision, recall and F1 (micro-averaged over
+   the folds):
+       EVENT, TIMEX      strict span (sentence, first and last word)
+       EVENT.<attr>      strict span and attribute value (normalisation)
+       TIMEX.type/value
+       TLINK             spans of both ends and relation type (a link and
+                         its inverse are the same); links to the document
+                         creation time are not scored, since it is not an
+                         annotation of the text.
+'''
+
+from __future__ import division
+import codecs
+import logging
+import multiprocessing
+import os
+from multiprocessing.pool import ThreadPool
+import random
+import shutil
+import time
+import xml.etree.cElementTree as cElementTree
+from StringIO import StringIO
+
+from attributes_extractor import TemporalRelationExtractor
+from classifier import ClassificationModel
+from classifier import IdentificationClassifier
+from classifier import NormalisationClassifier
+from classifier import RelationClassifier
+from classifier import identification_rows
+from classifier import write_identification_rows
+from classifier import write_normalisation_rows
+from classifier import write_relation_rows
+from crf_utilities import count_scale_factor
+from crf_utilities import normalise_scale_factors
+from metrics import METRICS
+from metrics import record_document
+from model.data import Event
+from model.data import TemporalExpression
+from model.data import TemporalLink
+from settings import EVENT_ATTRIBUTES
+from settings import NO_ATTRIBUTE
+
+# the attributes scored by annotation type (name: Event/TemporalExpression
+# field)
+SCORED_ATTRIBUTES = {'EVENT': (('class', 'eclass'), ('pos', 'pos'),
+                               ('tense', 'tense'), ('aspect', 'aspect'),
+                               ('polarity', 'polarity'),
+                               ('modality', 'modality')),
+                     'TIMEX': (('type', 'ttype'), ('value', 'value'))}
+FOLD_STEPS = ('matrices', 'learn', 'identify', 'normalise', 'link')
+
+
+class Score(object):
+    '''The true positives, predicted and gold annotations of a stage.'''
+    __slots__ = ('true_positives', 'predicted', 'gold')
+
+    def __init__(self):
+        self.true_positives = 0
+        self.predicted = 0
+        self.gold = 0
+
+    def add(self, gold, predicted):
+        self.true_positives += len(gold & predicted)
+        self.predicted += len(predicted)
+        self.gold += len(gold)
+
+    @property
+    def precision(self):
+        return self.true_positives / self.predicted if self.predicted else 0.
+
+    @property
+    def recall(self):
+        return self.true_positives / self.gold if self.gold else 0.
+
+    @property
+    def f1(self):
+        total = self.precision + self.recall
+        return 2 * self.precision * self.recall / total if total else 0.
+
+
+def _span(obj):
+    return (obj.id_sentence(), obj.id_first_word(), obj.id_last_word())
+
+
+def _attribute(obj, name, field):
+    value = getattr(obj, field, None)
+    if value is None:
+        value = obj.tag_attributes.get(name)
+    value = unicode(value or '').strip().replace(' ', '_').upper()
+    # different null representations are collapsed
+    return '' if value in ('NONE', NO_ATTRIBUTE.upper()) else value
+
+
+def annotation_keys(annotations):
+    '''It returns, by stage, the set of the keys of the annotations (gold or
+    predicted) which are compared for scoring.
+
+    '''
+    keys = {stage: set() for stage in ('EVENT', 'TIMEX', 'TLINK')}
+    for name, attributes in SCORED_ATTRIBUTES.iteritems():
+        for attribute, _ in attributes:
+            keys['{}.{}'.format(name, attribute)] = set()
+    for obj in annotations.itervalues():
+        if type(obj) in (Event, TemporalExpression) and not obj.meta:
+            name = 'EVENT' if type(obj) == Event else 'TIMEX'
+            span = _span(obj)
+            keys[name].add(span)
+            for attribute, field in SCORED_ATTRIBUTES[name]:
+                keys['{}.{}'.format(name, attribute)].add(
+                    (span, _attribute(obj, attribute, field)))
+        elif type(obj) == TemporalLink and \
+                not (obj.from_obj.meta or obj.to_obj.meta):
+            from_span, to_span = _span(obj.from_obj), _span(obj.to_obj)
+            relation_type = obj.relation_type
+            if from_span > to_span:
+                from_span, to_span = to_span, from_span
+                relation_type = TemporalRelationExtractor.flip_relation(
+                    relation_type)
+            keys['TLINK'].add((from_span, to_span, relation_type))
+    return keys
+
+
+def stage_order(stage):
+    return ({'EVENT': 0, 'TIMEX': 1, 'TLINK': 3}.get(stage, 2), stage)
+
+
+class DocumentRows(object):
+    '''The training rows of a document for each training matrix (by its
+    ClassificationModel.trainingset_path arguments) and its identification
+    (word, label) occurrences, which make the scale factors.
+
+    The normalisation sequences continue from a document to the next one
+    (see write_normalisation_rows): the rows are rendered as if the document
+    were the first one and its first and last identification labels are
+    kept, so that normalisation_rows joins them as a regular training does.
+    '''
+    __slots__ = ('matrices', 'occurrences', 'first_label', 'last_label')
+
+    def __init__(self, document, token_position, relation_extractor):
+        self.matrices = {}
+        self.occurrences = {}
+        self.first_label = None
+        self.last_label = None
+        for idnt_class in ('EVENT', 'TIMEX'):
+            matrix = StringIO()
+            rows = list(identification_rows(document, idnt_class))
+            write_identification_rows(rows, matrix)
+            self.matrices[('identification', idnt_class)] = matrix.getvalue()
+            self.occurrences[idnt_class] = [(row[0][token_position], row[1])
+                                            for row in rows
+                                            if row is not None]
+        for attribute in EVENT_ATTRIBUTES:
+            matrix = StringIO()
+            last_label = write_normalisation_rows(document, 0, matrix,
+                                                  attribute)
+            self.matrices[('normalisation', attribute)] = matrix.getvalue()
+        if last_label is not None:
+            self.last_label = str(last_label)
+        for sentence in document.sentences:
+            if sentence.words:
+                first_label = sentence.words[0].gold_label
+                # only a positive word can open a new sequence
+                if not first_label.is_timex() and not first_label.is_out():
+                    self.first_label = str(first_label)
+                break
+        matrix = StringIO()
+        write_relation_rows(document, 0, matrix, relation_extractor)
+        self.matrices[('relation', 'TLINK')] = matrix.getvalue()
+
+    def normalisation_rows(self, attribute, prev_label):
+        '''It returns the normalisation rows of attribute following a
+        document whose last identification label is prev_label (None for
+        the first document).
+
+        '''
+        rows = self.matrices[('normalisation', attribute)]
+        if prev_label is not None and self.first_label is not None and \
+                self.first_label != prev_label:
+            return '\n' + rows
+        return rows
+
+
+def shuffled_folds(size, k, seed=None):
+    '''It returns k folds (lists of positions) of size items, shuffled with
+    seed (not shuffled if seed is None).
+
+    '''
+    positions = range(size)
+    if seed is not None:
+        random.Random(seed).shuffle(positions)
+    return [sorted(positions[fold::k]) for fold in xrange(k)]
+
+
+class CrossValidation(object):
+    '''The k-fold cross-validation of the models of a ManTIME object on a
+    corpus (see ManTIME.cross_validate), with its extractor or another one.
+
+    '''
+
+    def __init__(self, mantime, k=10, seed=None, processes=None,
+                 extractor=None):
+        assert k > 1, 'At least two folds are needed.'
+        self.mantime = mantime
+        self.extractor = extractor or mantime.extractor
+        self.k = k
+        self.seed = seed
+        self.processes = processes or min(k, multiprocessing.cpu_count())
+        self.documents = []
+        self.rows = []
+        self.gold = []
+        self.header = None
+        self.token_position = None
+        self.relation_header = None
+        self.folds = []
+        self.scores = {}
+        self.timings = []
+        self.model_sizes = []
+        self.extraction_seconds = 0.
+
+    def _extract(self, input_files):
+        mantime = self.mantime
+        relation_extractor = TemporalRelationExtractor()
+        start = time.time()
+        for index, input_file in enumerate(input_files, start=1):
+            position = '[{}/{}]'.format(index, len(input_files))
+            try:
+                logging.info('{} Doc {}.'.format(position, input_file))
+                with METRICS.span('parse'):
+                    doc = mantime.reader.parse(input_file)
+                with METRICS.span('extract'):
+                    doc = self.extractor.extract(doc)
+            except cElementTree.ParseError:
+                logging.error('{} Doc {} skipped: parse error.'.format(
+                    position, input_file))
+                continue
+            record_document(doc, 'train')
+            if self.header is None:
+                self.header = list(doc.sentences[0].header)
+                self.token_position = [
+                    p for p, a in enumerate(self.header)
+                    if a.find('token_normalised') > -1][0]
+            self.rows.append(DocumentRows(doc, self.token_position,
+                                          relation_extractor))
+            self.gold.append(annotation_keys(doc.gold_annotations))
+            self.documents.append(doc)
+        self.relation_header = list(relation_extractor.header)
+        self.extraction_seconds = time.time() - start
+
+    def _train(self, model, positions):
+        '''It writes the training matrices of model from the rows of the
+        documents at positions.
+
+        '''
+        model.template_patterns = getattr(self.extractor,
+                                          'template_patterns', None)
+        model.load_header(self.header)
+        model.pp_pipeline_attribute_pos = self.token_position
+        for matrix in self.rows[0].matrices:
+            with codecs.open(model.trainingset_path(*matrix), 'w',
+                             encoding='utf8') as trainingset:
+                prev_label = None
+                for position in positions:
+                    rows = self.rows[position]
+                    if matrix[0] != 'normalisation':
+                        trainingset.write(rows.matrices[matrix])
+                        continue
+                    trainingset.write(rows.normalisation_rows(matrix[1],
+                                                              prev_label))
+                    if rows.last_label is not None:
+                        prev_label = rows.last_label
+        factors = {}
+        for idnt_class in ('EVENT', 'TIMEX'):
+            factors[idnt_class] = {}
+            for position in positions:
+                for word, label in self.rows[position].occurrences[
+                        idnt_class]:
+                    count_scale_factor(factors[idnt_class], word, label)
+            normalise_scale_factors(factors[idnt_class])
+        model.load_scaling_factors(factors)
+        model.load_relation_header(self.relation_header)
+
+    def _fold(self, fold):
+        '''It trains the models of a fold on the other ones, labels its
+        documents and returns their predicted annotation keys, the seconds
+        spent in each step and the size (bytes) of the model.
+
+        '''
+        mantime = self.mantime
+        held_out = self.folds[fold]
+        held_out_set = set(held_out)
+        training = [position for position in xrange(len(self.documents))
+                    if position not in held_out_set]
+        model = ClassificationModel('{}_fold{}'.format(mantime.model_name,
+                                                       fold + 1))
+        classifiers = (IdentificationClassifier(), NormalisationClassifier(),
+                       RelationClassifier())
+        for classifier in classifiers:
+            # the folds share the cores
+            classifier.num_cores = max(
+                1, multiprocessing.cpu_count() // self.processes)
+        identifier, normaliser, linker = classifiers
+        docs = [self.documents[position] for position in held_out]
+        seconds = {}
+
+        def step(name, function, *args):
+            start = time.time()
+            with METRICS.span('cross_validation', step=name):
+                result = function(*args)
+            seconds[name] = time.time() - start
+            return result
+
+        def learn(model):
+            for classifier in classifiers:
+                model = classifier.learn(model)
+            return model
+
+        try:
+            step('matrices', self._train, model, training)
+            step('learn', learn, model)
+            step('identify', identifier.test, docs, model,
+                 mantime.post_processing_pipeline, mantime.decoding)
+            step('normalise', normaliser.test, docs, model, mantime.domain)
+            step('link', linker.test, docs, model)
+            size = sum(os.path.getsize(path) for path in model.files())
+        finally:
+            shutil.rmtree(model.folder, ignore_errors=True)
+        logging.info('Cross-validation: fold {} of {} done.'.format(
+            fold + 1, self.k))
+        return ([annotation_keys(doc.predicted_annotations) for doc in docs],
+                seconds, size)
+
+    def run(self, input_files):
+        '''It cross-validates the models on the documents at input_files and
+        returns self.
+
+        '''
+        self._extract(input_files)
+        assert len(self.documents) >= self.k, 'Less documents than folds.'
+        self.folds = shuffled_folds(len(self.documents), self.k, self.seed)
+        pool = ThreadPool(self.processes)
+        try:
+            outcomes = pool.map(self._fold, xrange(self.k))
+        finally:
+            pool.close()
+            pool.join()
+        for fold, (predicted, seconds, size) in zip(self.folds, outcomes):
+            self.timings.append(seconds)
+            self.model_sizes.append(size)
+            for position, predicted_keys in zip(fold, predicted):
+                for stage, gold_keys in self.gold[position].iteritems():
+                    self.scores.setdefault(stage, Score()).add(
+                        gold_keys, predicted_keys[stage])
+        return self
+
+    def report(self):
+        '''It returns the scores by stage and the timings by fold as text.
+
+        '''
+        lines = ['Cross-validation: {} folds, {} documents, seed {}.'.format(
+            self.k, len(self.documents), self.seed)]
+        lines.append('{:<18}{:>8}{:>8}{:>8}{:>8}'.format(
+            'stage', 'P', 'R', 'F1', 'gold'))
+        for stage in sorted(self.scores, key=stage_order):
+            score = self.scores[stage]
+            lines.append('{:<18}{:>8.4f}{:>8.4f}{:>8.4f}{:>8}'.format(
+                stage, score.precision, score.recall, score.f1, score.gold))
+        lines.append('')
+        lines.append('Extraction: {:.2f}s (once).'.format(
+            self.extraction_seconds))
+        lines.append('{:<6}{:>6}'.format('fold', 'docs') +
+                     ''.join('{:>11}'.format(name) for name in FOLD_STEPS) +
+                     '{:>12}'.format('model'))
+        for fold, seconds in enumerate(self.timings):
+            lines.append('{:<6}{:>6}'.format(fold + 1, len(self.folds[fold]))
+                         + ''.join('{:>10.2f}s'.format(seconds.get(name, 0.))
+                                   for name in FOLD_STEPS) +
+                         '{:>11}B'.format(self.model_sizes[fold]))
+        return '\n'.join(lines) + '\n'
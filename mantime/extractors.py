@@ -45,6 +45,33 @@ dep_labels = ['root', 'dep', 'aux', 'auxpass', 'cop', 'arg',
               'parataxis', 'punct', 'ref', 'sdep', 'xsubj',
               'discourse', 'n_of_outgoing_relations']
 max_steps = 30
+# the attribute names of the relation flags, by kind and direction
+relation_names = {(kind, direction): tuple(
+    '{}_dependency_{}_{}'.format(kind, direction, label)
+    for label in dep_labels)
+    for kind in ('basic', 'collapsed')
+    for direction in ('outgoing', 'incoming')}
+flag_results = {True: WordBasedResult(True), False: WordBasedResult(False)}
+
+
+def dependency_table(word, kind):
+    '''It returns the DependencyTable (basic or collapsed) of the sentence
+    of word, whose row word.id_token is the word.
+
+    '''
+    return word.sentence.dependency_table(kind, dep_labels)
+
+
+def relation_flags(kind, direction, flags):
+    '''It returns the WordBasedResults of the flags of a row of relations.
+
+    '''
+    return WordBasedResults(tuple(zip(relation_names[(kind, direction)],
+                                      (flag_results[flag] for flag in flags))))
+
+
+def is_verb(word):
+    return word.part_of_speech.startswith('V')
 
 
 def matching_gazetteer(gazetteer, sentence):
@@ -68,6 +95,43 @@ def matching_gazetteer(gazetteer, sentence):
     return SentenceBasedResult(tuple(result))
 
 
+def constituency_ancestors(word, levels):
+    '''It returns up to `levels` constituency nodes above the word, starting
+    from its part-of-speech node, as indices in the sentence's compact
+    ConstituencyTree.
+
+    '''
+    tree = word.sentence.constituency
+    try:
+        node = tree.parents[tree.leaves[word.id_token]]
+    except IndexError:
+        return []
+    ancestors = []
+    while node >= 0 and len(ancestors) < levels:
+        ancestors.append(node)
+        node = tree.parents[node]
+    return ancestors
+
+
+def constituency_childs(word, levels):
+    '''It joins the labels of the children of the node `levels` steps above
+    the word ('_^_' if there is no such node or any child is a leaf).
+
+    '''
+    tree = word.sentence.constituency
+    ancestors = constituency_ancestors(word, levels)
+    if len(ancestors) < levels:
+        return '_^_'
+    children = tree.children(ancestors[-1])
+    if any(tree.is_leaf[child] for child in children):
+        return '_^_'
+    return '_'.join(tree.labels[child] for child in children)
+
+
+def is_s_clause(label):
+    return label.startswith('S') or label == 'ROOT'
+
+
 class WordBasedExtractors(object):
 
     STOPWORDS = nltk.corpus.stopwords.words(LANGUAGE)
@@ -445,58 +509,40 @@ class WordBasedExtractors(object):
 
     @staticmethod
     def parse_2_levels_up_node(word):
-        try:
-            node_label = word.constituency_parent.parent().node
-            return WordBasedResult(node_label)
-        except TypeError:
+        ancestors = constituency_ancestors(word, 2)
+        if len(ancestors) < 2:
             return WordBasedResult('_^_')
+        tree = word.sentence.constituency
+        return WordBasedResult(tree.labels[ancestors[-1]])
 
     @staticmethod
     def parse_3_levels_up_node(word):
-        try:
-            node_label = word.constituency_parent.parent().parent().node
-            return WordBasedResult(node_label)
-        except (AttributeError, TypeError):
+        ancestors = constituency_ancestors(word, 3)
+        if len(ancestors) < 3:
             return WordBasedResult('_^_')
+        tree = word.sentence.constituency
+        return WordBasedResult(tree.labels[ancestors[-1]])
 
     @staticmethod
     def parse_2_levels_up_childs(word):
-        try:
-            node = word.constituency_parent.parent()
-            node_labels = [i.node for i in node]
-            return WordBasedResult('_'.join(node_labels))
-        except (AttributeError, TypeError):
-            return WordBasedResult('_^_')
+        return WordBasedResult(constituency_childs(word, 2))
 
     @staticmethod
     def parse_3_levels_up_childs(word):
-        try:
-            node = word.constituency_parent.parent().parent()
-            node_label = [i.node for i in node]
-            return WordBasedResult('_'.join(node_label))
-        except (AttributeError, TypeError):
-            return WordBasedResult('_^_')
+        return WordBasedResult(constituency_childs(word, 3))
 
     @staticmethod
     def parse_3_levels_up_nodes(word):
-        parents = []
-        try:
-            parents.append(word.constituency_parent.parent().node)
-            parents.append(word.constituency_parent.parent().parent().node)
-            parents.append(
-                word.constituency_parent.parent().parent().parent().node)
-        except (AttributeError, TypeError):
-            pass
+        tree = word.sentence.constituency
+        parents = [tree.labels[node]
+                   for node in constituency_ancestors(word, 4)[1:]]
         return WordBasedResult('_'.join(reversed(parents)))
 
     @staticmethod
     def parse_2_levels_up_nodes(word):
-        parents = []
-        try:
-            parents.append(word.constituency_parent.parent().node)
-            parents.append(word.constituency_parent.parent().parent().node)
-        except (AttributeError, TypeError):
-            pass
+        tree = word.sentence.constituency
+        parents = [tree.labels[node]
+                   for node in constituency_ancestors(word, 3)[1:]]
         return WordBasedResult('_'.join(reversed(parents)))
 
     @staticmethod
@@ -520,16 +566,14 @@ class WordBasedExtractors(object):
            http://nlp.stanford.edu/software/dependencies_manual.pdf
 
         '''
-        f_suffix = lambda f_name: 'basic_dependency_outgoing_' + f_name
-
-        r = ((f_suffix(l),
-              WordBasedResult(bool(word.basic_dependencies_out.get(l, False))))
-             for l in dep_labels)
-        return WordBasedResults(tuple(r))
+        table = dependency_table(word, 'basic')
+        return relation_flags('basic', 'outgoing',
+                              table.row(table.out_masks[word.id_token]))
 
     @staticmethod
     def dependency_outgoing_relations_number_basic(word):
-        return WordBasedResult(len(word.basic_dependencies_out))
+        return WordBasedResult(
+            dependency_table(word, 'basic').n_out[word.id_token])
 
     @staticmethod
     def dependency_incoming_relations_basic(word):
@@ -543,16 +587,14 @@ class WordBasedExtractors(object):
            http://nlp.stanford.edu/software/dependencies_manual.pdf
 
         '''
-        f_suffix = lambda f_name: 'basic_dependency_incoming_' + f_name
-
-        r = ((f_suffix(l),
-              WordBasedResult(bool(word.basic_dependencies_in.get(l, False))))
-             for l in dep_labels)
-        return WordBasedResults(tuple(r))
+        table = dependency_table(word, 'basic')
+        return relation_flags('basic', 'incoming',
+                              table.row(table.in_masks[word.id_token]))
 
     @staticmethod
     def dependency_incoming_relations_number_basic(word):
-        return WordBasedResult(len(word.basic_dependencies_in))
+        return WordBasedResult(
+            dependency_table(word, 'basic').n_in[word.id_token])
 
     # COLLAPSED DEPENDENCY RELATIONS
     @staticmethod
@@ -568,18 +610,14 @@ class WordBasedExtractors(object):
            http://nlp.stanford.edu/software/dependencies_manual.pdf
 
         '''
-        f_suffix = lambda f_name: 'collapsed_dependency_outgoing_' + f_name
-
-        r = ((f_suffix(l),
-              WordBasedResult(bool(word.collapsed_dependencies_out.get(l,
-                                                                       False)))
-              )
-             for l in dep_labels)
-        return WordBasedResults(tuple(r))
+        table = dependency_table(word, 'collapsed')
+        return relation_flags('collapsed', 'outgoing',
+                              table.row(table.out_masks[word.id_token]))
 
     @staticmethod
     def dependency_outgoing_relations_number_collapsed(word):
-        return WordBasedResult(len(word.collapsed_dependencies_out))
+        return WordBasedResult(
+            dependency_table(word, 'collapsed').n_out[word.id_token])
 
     @staticmethod
     def dependency_incoming_relations_collapsed(word):
@@ -594,81 +632,62 @@ class WordBasedExtractors(object):
            http://nlp.stanford.edu/software/dependencies_manual.pdf
 
         '''
-        f_suffix = lambda f_name: 'collapsed_dependency_incoming_' + f_name
-
-        r = ((f_suffix(l),
-              WordBasedResult(bool(word.collapsed_dependencies_in.get(l,
-                                                                      False))))
-             for l in dep_labels)
-        return WordBasedResults(tuple(r))
+        table = dependency_table(word, 'collapsed')
+        return relation_flags('collapsed', 'incoming',
+                              table.row(table.in_masks[word.id_token]))
 
     @staticmethod
     def dependency_incoming_relations_number_collapsed(word):
-        return WordBasedResult(len(word.collapsed_dependencies_in))
+        return WordBasedResult(
+            dependency_table(word, 'collapsed').n_in[word.id_token])
 
     @staticmethod
     def dependency_incoming_granfather_relations_basic(word):
-        try:
-            gfather = word.dependencies_in('basic')[0][1].dependencies_in(
-                'basic')[0][0]
-            return WordBasedResult(gfather)
-        except IndexError:
+        table = dependency_table(word, 'basic')
+        parent = table.parents[word.id_token]
+        if parent < 0 or table.parents[parent] < 0:
             return WordBasedResult(False)
+        return WordBasedResult(table.relations[parent])
 
     @staticmethod
     def dependency_incoming_granfather_relations_collapsed(word):
-        try:
-            gfather = word.dependencies_in('collapsed')[0][1].dependencies_in(
-                'collapsed')[0][0]
-            return WordBasedResult(gfather)
-        except IndexError:
+        table = dependency_table(word, 'collapsed')
+        parent = table.parents[word.id_token]
+        if parent < 0 or table.parents[parent] < 0:
             return WordBasedResult(False)
+        return WordBasedResult(table.relations[parent])
 
     @staticmethod
     def dependency_incoming_granfather_pos_basic(word):
-        try:
-            pos = word.dependencies_in('basic')[0][1].dependencies_in(
-                'basic')[0][1].part_of_speech
-            return WordBasedResult(pos)
-        except IndexError:
+        grandparent = dependency_table(word, 'basic').ancestors(2)[
+            word.id_token]
+        if grandparent < 0:
             return WordBasedResult(False)
+        return WordBasedResult(word.sentence.words[grandparent].part_of_speech)
 
     @staticmethod
     def dependency_incoming_granfather_pos_collapsed(word):
-        try:
-            pos = word.dependencies_in('collapsed')[0][1].dependencies_in(
-                'collapsed')[0][1].part_of_speech
-            return WordBasedResult(pos)
-        except IndexError:
+        grandparent = dependency_table(word, 'collapsed').ancestors(2)[
+            word.id_token]
+        if grandparent < 0:
             return WordBasedResult(False)
+        return WordBasedResult(word.sentence.words[grandparent].part_of_speech)
 
     @staticmethod
     def dominant_verb_basic(word):
-        if word.part_of_speech.startswith('V'):
-            return WordBasedResult(word.part_of_speech)
-        else:
-            steps = max_steps
-            while not word.part_of_speech.startswith('V') and steps:
-                try:
-                    word = word.dependencies_in('basic')[0][1]
-                    steps -= 1
-                except IndexError:
-                    return WordBasedResult(False)
-            return WordBasedResult(word.part_of_speech)
+        verb = dependency_table(word, 'basic').climb(is_verb, max_steps)[
+            word.id_token]
+        if verb < 0:
+            return WordBasedResult(False)
+        return WordBasedResult(word.sentence.words[verb].part_of_speech)
 
     @staticmethod
     def dominant_verb_collapsed(word):
-        if word.part_of_speech.startswith('V'):
-            return WordBasedResult(word.part_of_speech)
-        else:
-            steps = max_steps
-            while not word.part_of_speech.startswith('V') and steps:
-                try:
-                    word = word.dependencies_in('collapsed')[0][1]
-                    steps -= 1
-                except:
-                    return WordBasedResult(False)
-            return WordBasedResult(word.part_of_speech)
+        verb = dependency_table(word, 'collapsed').climb(is_verb, max_steps)[
+            word.id_token]
+        if verb < 0:
+            return WordBasedResult(False)
+        return WordBasedResult(word.sentence.words[verb].part_of_speech)
 
 
 class SentenceBasedExtractors(object):
@@ -697,25 +716,23 @@ class SentenceBasedExtractors(object):
         Typically temporal expressions are at the very end or beginning of a
         well-formed English sentence.
         '''
-        parsetree = sentence.parsetree
+        tree = sentence.constituency
         result = []
-        for idx in parsetree.treepositions(order='leaves'):
-            try:
-                tree = parsetree[idx[:-1]]
-                steps_up = 1
-                # there are some leaves which are not necessarily child of S
-                # all the leaves are always child of ROOT)
-                # Don't believe me? Try to parse this sentence:
-                # -  "And Rosneft benefits from BP's expertise in exploring in
-                #     difficult and potentially hazardous conditions."
-                while not (tree.node.startswith('S') or tree.node == 'ROOT'):
-                    tree = tree.parent()
-                    steps_up += 1
-                position_under_s = idx[(len(idx) - steps_up)]
-                leaf_result = position_under_s in(0, len(tree) - 1)
-                result.append(WordBasedResult(leaf_result))
-            except Exception:
+        for leaf in tree.leaves:
+            child, node = leaf, tree.parents[leaf]
+            # there are some leaves which are not necessarily child of S
+            # all the leaves are always child of ROOT)
+            # Don't believe me? Try to parse this sentence:
+            # -  "And Rosneft benefits from BP's expertise in exploring in
+            #     difficult and potentially hazardous conditions."
+            while node >= 0 and not is_s_clause(tree.labels[node]):
+                child, node = node, tree.parents[node]
+            if node < 0:
                 result.append(WordBasedResult(False))
+            else:
+                leaf_result = tree.child_positions[child] in \
+                    (0, tree.n_children[node] - 1)
+                result.append(WordBasedResult(leaf_result))
         return SentenceBasedResult(tuple(result))
 
     @staticmethod
@@ -723,23 +740,19 @@ class SentenceBasedExtractors(object):
         '''How far the current node (its POS) is from an S-parent.
 
         '''
-        parsetree = sentence.parsetree
+        tree = sentence.constituency
         result = []
-        for idx in parsetree.treepositions(order='leaves'):
-            tree = parsetree[idx[:-1]]
+        for leaf in tree.leaves:
+            node = tree.parents[leaf]
             steps_up = 1
             # there are some leaves which are not necessarily child of S
             # all the leaves are always child of ROOT)
             # Don't believe me? Try to parse this sentence:
             # -  "And Rosneft benefits from BP's expertise in exploring in
             #     difficult and potentially hazardous conditions."
-            try:
-                while not (tree.node.startswith('S') or tree.node == 'ROOT'):
-                    tree = tree.parent()
-                    steps_up += 1
-            except AttributeError:
-                pass
-
+            while node >= 0 and not is_s_clause(tree.labels[node]):
+                node = tree.parents[node]
+                steps_up += 1
             result.append(WordBasedResult(steps_up))
         return SentenceBasedResult(tuple(result))
 
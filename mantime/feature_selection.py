@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+#
+#   Copyright 2015 Michele Filannino
+#
+#   gnTEAM, School of Computer Science, University of Manchester.
+#   All rights reserved. This program and the accompanying materials
+#   are made available under the terms of the GNU General Public License.
+#
+#   author: Michele Filannino
+#   email:  filannim@cs.man.ac.uk
+#
+#   For details, see www.cs.man.ac.uk/~filannim/
+
+'''It contains the feature selection of ManTIME.
+
+   Each attribute (column of the training matrices) is scored with the
+   mutual information between its values and the labels, divided by the
+   entropy of the labels (so that the identification and normalisation
+   matrices are comparable), taking the best score over the matrices.
+
+   The best keep fraction of the attributes is kept: the best context
+   fraction with all the CRF++ patterns of _generate_template ('full'), the
+   others with the unigram ones only ('unigram'). The extractors whose
+   attributes are all discarded are not computed any more. The result is a
+   FullExtractor configuration (JSON):
+
+       {"extractors": {"sentence": [...], "word": [...]},
+        "patterns": {"word_token_normalised": "full", ...},
+        "scores": {"word_token_normalised": 0.93, ...}}
+
+   The rows come from a cross-validation of the whole feature set, which is
+   then repeated with the selected one to report the trade-off between
+   speed, model size and accuracy.
+'''
+
+from __future__ import division
+import json
+import math
+
+from attributes_extractor import FullExtractor
+from classifier import TEMPLATE_LEVELS
+from evaluation import CrossValidation
+from evaluation import FOLD_STEPS
+from evaluation import stage_order
+from model.document import FeatureHeader
+
+# the attribute needed by the post-processing pipeline, always kept whole
+REQUIRED_ATTRIBUTE = 'token_normalised'
+
+
+def mutual_information(rows, width):
+    '''It returns, for each of the first width columns of rows, the mutual
+    information between its values and the label (the last column) divided
+    by the entropy of the label.
+
+    '''
+    joint = [{} for _ in xrange(width)]
+    labels = {}
+    total = 0
+    for row in rows:
+        label = row[-1]
+        labels[label] = labels.get(label, 0) + 1
+        total += 1
+        for column, value in enumerate(row[:width]):
+            counts = joint[column]
+            key = (value, label)
+            counts[key] = counts.get(key, 0) + 1
+    entropy = -sum(count / total * math.log(count / total)
+                   for count in labels.itervalues()) if total else 0.
+    if not entropy:
+        return [0.] * width
+    scores = []
+    for counts in joint:
+        values = {}
+        for (value, _), count in counts.iteritems():
+            values[value] = values.get(value, 0) + count
+        information = sum(count / total * math.log(
+            count * total / (values[value] * labels[label]))
+            for (value, label), count in counts.iteritems())
+        scores.append(information / entropy)
+    return scores
+
+
+def matrix_rows(text):
+    '''It yields the rows of a training matrix (text).
+
+    '''
+    for line in text.split('\n'):
+        if line:
+            yield line.split('\t')
+
+
+class FeatureSelection(object):
+    '''The selection of the attributes of the extractor of a ManTIME object
+    on a corpus (see ManTIME.select_features).
+
+    '''
+
+    def __init__(self, mantime, keep=.5, context=.25, k=5, seed=None,
+                 processes=None):
+        assert 0 < keep <= 1 and 0 <= context <= keep, 'Wrong fractions.'
+        self.mantime = mantime
+        self.keep = keep
+        self.context = context
+        self.k = k
+        self.seed = seed
+        self.processes = processes
+        self.scores = {}
+        self.configuration = None
+        self.baseline = None
+        self.selected = None
+
+    def _score(self, validation):
+        '''It scores the attributes on the training rows of validation.
+
+        '''
+        width = len(validation.header)
+        best = [0.] * width
+        for matrix in validation.rows[0].matrices:
+            if matrix[0] == 'relation':
+                continue
+            rows = (row for document in validation.rows
+                    for row in matrix_rows(document.matrices[matrix]))
+            best = map(max, best, mutual_information(rows, width))
+        self.scores = {FeatureHeader.key(name): score
+                       for name, score in zip(validation.header, best)}
+
+    def _select(self, extractor):
+        '''It returns the configuration which keeps the best attributes of
+        extractor (whose header has been built).
+
+        '''
+        names = [FeatureHeader.key(name) for name in extractor.header]
+        ranking = sorted(names, key=lambda name: -self.scores[name])
+        n_keep = int(math.ceil(self.keep * len(names)))
+        n_context = int(math.ceil(self.context * len(names)))
+        levels = {}
+        for rank, name in enumerate(ranking):
+            if rank < n_context or name.endswith(REQUIRED_ATTRIBUTE):
+                levels[name] = 'full'
+            elif rank < n_keep:
+                levels[name] = 'unigram'
+            else:
+                levels[name] = 'none'
+        configuration = {'extractors': {'sentence': [], 'word': []},
+                         'patterns': {}, 'scores': {}}
+        for kind, function, positions in extractor.extractor_columns():
+            keys = [names[position] for position in positions]
+            if all(levels[key] == 'none' for key in keys):
+                continue
+            configuration['extractors'][kind].append(function.func_name)
+            for key in keys:
+                configuration['patterns'][key] = levels[key]
+                configuration['scores'][key] = round(self.scores[key], 6)
+        return configuration
+
+    def run(self, input_files):
+        '''It selects the attributes on the documents at input_files and
+        cross-validates both the whole and the selected ones; it returns
+        self.
+
+        '''
+        extractor = self.mantime.extractor
+        self.baseline = CrossValidation(self.mantime, self.k, self.seed,
+                                        self.processes).run(input_files)
+        self._score(self.baseline)
+        self.configuration = self._select(extractor)
+        self.selected = CrossValidation(
+            self.mantime, self.k, self.seed, self.processes,
+            FullExtractor(self.configuration)).run(input_files)
+        return self
+
+    def write(self, path):
+        '''It writes the configuration (JSON) at path.
+
+        '''
+        with open(path, 'w') as configuration_file:
+            json.dump(self.configuration, configuration_file, indent=2,
+                      sort_keys=True)
+
+    @staticmethod
+    def _template_size(header, patterns=None):
+        patterns = patterns or {}
+        return sum(len(TEMPLATE_LEVELS[patterns.get(FeatureHeader.key(name),
+                                                    'full')])
+                   for name in header)
+
+    def report(self):
+        '''It returns the sizes, scores and timings of the whole and of the
+        selected attributes as text.
+
+        '''
+        baseline, selected = self.baseline, self.selected
+        lines = ['Feature selection: keep {}, context {}.'.format(
+            self.keep, self.context)]
+        lines.append('{:<18}{:>12}{:>12}'.format('', 'whole', 'selected'))
+        for name, before, after in (
+                ('extractors',
+                 len(self.mantime.extractor.sentence_extractors) +
+                 len(self.mantime.extractor.word_extractors),
+                 sum(len(names) for names
+                     in self.configuration['extractors'].itervalues())),
+                ('attributes', len(baseline.header), len(selected.header)),
+                ('patterns', self._template_size(
+                    baseline.header, getattr(self.mantime.extractor,
+                                             'template_patterns', None)),
+                 self._template_size(selected.header,
+                                     self.configuration['patterns'])),
+                ('model (bytes)', sum(baseline.model_sizes),
+                 sum(selected.model_sizes))):
+            lines.append('{:<18}{:>12}{:>12}'.format(name, before, after))
+        lines.append('{:<18}{:>11.2f}s{:>11.2f}s'.format(
+            'extraction', baseline.extraction_seconds,
+            selected.extraction_seconds))
+        for step in FOLD_STEPS:
+            lines.append('{:<18}{:>11.2f}s{:>11.2f}s'.format(
+                step, sum(seconds.get(step, 0.)
+                          for seconds in baseline.timings),
+                sum(seconds.get(step, 0.) for seconds in selected.timings)))
+        lines.append('')
+        lines.append('{:<18}{:>12}{:>12}'.format('F1', 'whole', 'selected'))
+        for stage in sorted(baseline.scores, key=stage_order):
+            lines.append('{:<18}{:>12.4f}{:>12.4f}'.format(
+                stage, baseline.scores[stage].f1,
+                selected.scores[stage].f1))
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+#
+#   Copyright 2015 Michele Filannino
+#
+#   gnTEAM, School of Computer Science, University of Manchester.
+#   All rights reserved. This program and the accompanying materials
+#   are made available under the terms of the GNU General Public License.
+#
+#   author: Michele Filannino
+#   email:  filannim@cs.man.ac.uk
+#
+#   For details, see www.cs.man.ac.uk/~filannim/
+
+'''It contains the manifest of the incremental annotation of a folder.
+
+   The manifest lives in the output folder and records, for each input, the
+   MD5 of its content and the configuration it was annotated with (model
+   fingerprint, post-processing pipeline, decoding, domain and writer). An
+   input whose content and configuration match its record, and whose output
+   file exists, is not annotated again.
+
+   The manifest is a journal (a JSON object per line) appended to and
+   flushed as soon as each output file is in place; since the writers
+   rename complete files into place, an interrupted run resumes from the
+   last annotated input. The journal is compacted when opened.
+'''
+
+import hashlib
+import json
+import logging
+import os
+
+MANIFEST_FILE_NAME = '.mantime_manifest.jsonl'
+
+
+def file_md5(path):
+    '''It returns the MD5 digest (hex) of the content of the file at path.
+
+    '''
+    md5_obj = hashlib.md5()
+    with open(path, 'rb') as source:
+        for chunk in iter(lambda: source.read(1 << 20), ''):
+            md5_obj.update(chunk)
+    return md5_obj.hexdigest()
+
+
+def configuration(mantime):
+    '''It returns what the output of a ManTIME object depends on, besides
+    its input.
+
+    '''
+    return {'model': mantime.model.fingerprint(),
+            'post_processing_pipeline': mantime.post_processing_pipeline,
+            'decoding': mantime.decoding,
+            'domain': mantime.domain,
+            'writer': type(mantime.writer).__name__}
+
+
+class AnnotationManifest(object):
+    '''The records of the inputs annotated in an output folder.
+
+    '''
+
+    def __init__(self, folder, configuration):
+        self.folder = folder
+        self.configuration = configuration
+        self.path = os.path.join(folder, MANIFEST_FILE_NAME)
+        self.records = {}
+        self._hashes = {}
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+        try:
+            with open(self.path) as journal:
+                for line in journal:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # the last line of an interrupted run
+                        continue
+                    self.records[record['input']] = record
+        except IOError:
+            pass
+        self._compact()
+        self._journal = open(self.path, 'a')
+
+    def _compact(self):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as journal:
+            for _, record in sorted(self.records.iteritems()):
+                journal.write(json.dumps(record, sort_keys=True) + '\n')
+        os.rename(tmp_path, self.path)
+
+    def _input_md5(self, input_path):
+        md5_value = self._hashes.get(input_path)
+        if md5_value is None:
+            md5_value = self._hashes[input_path] = file_md5(input_path)
+        return md5_value
+
+    def is_current(self, input_path, output_path):
+        '''It says whether output_path is the annotation of the current
+        content of input_path with the current configuration.
+
+        '''
+        record = self.records.get(os.path.basename(input_path))
+        return bool(record) and \
+            record['output'] == os.path.basename(output_path) and \
+            record['configuration'] == self.configuration and \
+            os.path.isfile(output_path) and \
+            record['md5'] == self._input_md5(input_path)
+
+    def pending(self, input_paths, output_path):
+        '''It returns the inputs which need to be annotated (output_path
+        returns the output file of an input).
+
+        '''
+        pending = [input_path for input_path in input_paths
+                   if not self.is_current(input_path, output_path(input_path))]
+        logging.info('Incremental: {} of {} inputs to annotate.'.format(
+            len(pending), len(input_paths)))
+        return pending
+
+    def record(self, input_path, output_path):
+        '''It records that output_path is the annotation of input_path.
+
+        '''
+        record = {'input': os.path.basename(input_path),
+                  'md5': self._input_md5(input_path),
+                  'output': os.path.basename(output_path),
+                  'configuration': self.configuration}
+        self.records[record['input']] = record
+        self._journal.write(json.dumps(record, sort_keys=True) + '\n')
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+
+    def close(self):
+        self._journal.close()
@@ -16,91 +16,254 @@ __author__ = "Michele Filannino <filannino.m@gmail.com>"
 __version__ = "0.1"
 __codename__ = "purple tempo"
 
-import cPickle
 import glob
 import logging
 import os
 import xml.etree.cElementTree as cElementTree
 
+from classifier import ClassificationModel
 from classifier import IdentificationClassifier
 from classifier import NormalisationClassifier
 from classifier import RelationClassifier
-from settings import PATH_MODEL_FOLDER
+from evaluation import CrossValidation
+from feature_selection import FeatureSelection
+from metrics import METRICS
+from metrics import record_document
+from settings import EVENT_ATTRIBUTES
+from utilities import LRUCache
+from utilities import corpus_stamp
+from pipeline import Pipeline
 
 
 class ManTIME(object):
 
     def __init__(self, reader, writer, extractor, model_name, pipeline=True,
-                 domain='general'):
+                 domain='general', decoding='rewrite', sentence_cache=0):
+        """With sentence_cache, the attribute values and the identification
+        labels of up to that many sentences are cached, so that a document
+        annotated again after an edit only has its changed sentences
+        extracted and labelled by CRF++.
+
+        extractor is used for training; the annotations are extracted with
+        the extractors listed in the manifest of the model only (see
+        AttributesExtractor.bound).
+
+        """
         assert domain in ('general', 'clinical')
+        assert decoding in ('rewrite', 'viterbi')
         self.post_processing_pipeline = pipeline
+        self.decoding = decoding
         self.reader = reader
         self.writer = writer
         self.extractor = extractor
         self.documents = []
         self.model_name = model_name
-        self.model_path = '{}/{}/model.pickle'.format(PATH_MODEL_FOLDER,
-                                                      self.model_name)
+        self.sentence_cache = sentence_cache
+        if sentence_cache:
+            extractor.cache = LRUCache(sentence_cache, 'features')
         try:
-            self.model = cPickle.load(open(os.path.abspath(self.model_path)))
+            self.model = ClassificationModel.load(self.model_name)
             logging.info('{} model: loaded.'.format(self.model.name))
         except IOError:
             self.model = None
             logging.info('{} model: built.'.format(model_name))
+        self._bind_extractor()
+        self._attach_label_cache()
         self.domain = domain
 
-    def train(self, folder):
+    def _bind_extractor(self):
+        manifest = getattr(self.model, 'extractors', None)
+        if not manifest:
+            self.label_extractor = self.extractor
+            return
+        self.label_extractor = self.extractor.bound(manifest,
+                                                    self.model.header())
+        if self.sentence_cache:
+            self.label_extractor.cache = LRUCache(self.sentence_cache,
+                                                  'features')
+        logging.info('{} model: {} extractors bound.'.format(
+            self.model.name, sum(len(names) for names
+                                 in manifest['extractors'].itervalues())))
+
+    def _attach_label_cache(self):
+        if self.sentence_cache and self.model:
+            self.model.label_cache = LRUCache(self.sentence_cache, 'labels')
+
+    def train(self, folder, streaming=False, resume=False):
+        """It trains the models on the documents in folder.
+
+        In streaming mode each document is parsed and extracted once, its
+        rows are appended to all the training matrices and then it is
+        released, instead of holding the whole corpus in self.documents.
+
+        The model is built in a staging folder and replaces the previous one
+        only once complete (see ClassificationModel). With resume, a training
+        interrupted on the same corpus with the same extractors continues
+        from its last checkpoint: the training matrices, if complete, are not
+        computed again, as well as the CRF models already trained.
+
+        """
         folder = os.path.abspath(folder)
         assert os.path.isdir(folder), 'Folder doesn\'t exist.'
 
         identifier = IdentificationClassifier()
         normaliser = NormalisationClassifier()
         linker = RelationClassifier()
+        classifiers = (identifier, normaliser, linker)
 
-        # corpus collection
         input_files = os.path.join(folder, self.reader.file_filter)
         documents = sorted(glob.glob(input_files))
-        for index, input_file in enumerate(documents, start=1):
-            basename = os.path.basename(input_file)
-            position = '[{}/{}]'.format(index, len(documents))
-            try:
-                logging.info('{} Doc {}.'.format(position, basename))
-                doc = self.extractor.extract(self.reader.parse(input_file))
-                self.documents.append(doc)
-            except cElementTree.ParseError:
-                msg = '{} Doc {} skipped: parse error.'.format(position,
-                                                               basename)
-                logging.error(msg)
-
-        # training models (identification and normalisation)
-        modl = identifier.train(self.documents, self.model_name)
-        modl = normaliser.train(self.documents, modl)
-        modl = linker.train(self.documents, modl)
+        modl = ClassificationModel(self.model_name, resume=resume,
+                                   corpus=corpus_stamp(documents),
+                                   extractors=self.extractor.manifest())
+
+        if modl.completed('matrices'):
+            logging.info('Training matrices: restored.')
+        else:
+            for classifier in classifiers:
+                classifier.start_training(modl)
+
+            # corpus collection
+            for index, input_file in enumerate(documents, start=1):
+                basename = os.path.basename(input_file)
+                position = '[{}/{}]'.format(index, len(documents))
+                try:
+                    logging.info('{} Doc {}.'.format(position, basename))
+                    with METRICS.span('parse'):
+                        doc = self.reader.parse(input_file)
+                    with METRICS.span('extract'):
+                        doc = self.extractor.extract(doc)
+                    record_document(doc, 'train')
+                    with METRICS.span('add_training_document'):
+                        for classifier in classifiers:
+                            classifier.add_training_document(doc)
+                    if not streaming:
+                        self.documents.append(doc)
+                except cElementTree.ParseError:
+                    msg = '{} Doc {} skipped: parse error.'.format(position,
+                                                                   basename)
+                    logging.error(msg)
+
+            for classifier in classifiers:
+                classifier.close_training()
+            modl.complete('matrices', *(
+                [modl.trainingset_path('identification', idnt_class)
+                 for idnt_class in ('EVENT', 'TIMEX')] +
+                [modl.trainingset_path('normalisation', attribute)
+                 for attribute in EVENT_ATTRIBUTES] +
+                [modl.trainingset_path('relation', 'TLINK')] +
+                modl.files()))
+
+        # training models (identification, normalisation and relations)
+        with METRICS.span('train_models'):
+            for classifier in classifiers:
+                modl = classifier.learn(modl)
         self.model = modl
         # dumping models
-        cPickle.dump(modl, open(self.model_path, 'w'))
+        modl.save()
+        self.label_extractor = self.extractor
+        self._attach_label_cache()
 
         return modl
 
-    def label(self, input_obj):
+    def cross_validate(self, folder, k=10, seed=None, processes=None):
+        """It cross-validates the models on the documents in folder with k
+        folds (shuffled with seed, if given) and returns the
+        evaluation.CrossValidation with the scores of each stage.
+
+        The documents are parsed and extracted once for all the folds, which
+        are trained and tested by up to processes at a time. The model of
+        this object is left untouched.
+
+        """
+        folder = os.path.abspath(folder)
+        assert os.path.isdir(folder), 'Folder doesn\'t exist.'
+        input_files = os.path.join(folder, self.reader.file_filter)
+        documents = sorted(glob.glob(input_files))
+        validation = CrossValidation(self, k, seed, processes)
+        return validation.run(documents)
+
+    def select_features(self, folder, keep=.5, context=.25, k=5, seed=None,
+                        processes=None):
+        """It selects the best keep fraction of the attributes of the
+        extractor on the documents in folder, the best context fraction with
+        the whole CRF++ template (see feature_selection), and returns the
+        feature_selection.FeatureSelection, whose configuration makes a
+        reduced FullExtractor.
+
+        Both the whole and the selected attributes are cross-validated with
+        k folds, to compare speed, model size and accuracy.
+
+        """
+        folder = os.path.abspath(folder)
+        assert os.path.isdir(folder), 'Folder doesn\'t exist.'
+        input_files = os.path.join(folder, self.reader.file_filter)
+        documents = sorted(glob.glob(input_files))
+        selection = FeatureSelection(self, keep, context, k, seed, processes)
+        return selection.run(documents)
+
+    def label(self, input_obj, **kwargs):
+        """It annotates input_obj; kwargs are passed on to the reader (e.g.
+        the document creation time of a TextReader input).
+
+        """
+        return self.label_batch([input_obj], [kwargs])
+
+    def label_stream(self, input_objs, queue_size=2, output_path=None):
+        """It yields an (input, output) pair for each input, as label() does
+        for a single one, overlapping the annotation steps of consecutive
+        inputs (see pipeline.Pipeline).
+
+        output_path, if given, returns the path of the output file of an
+        input: each output is then streamed to its file by the writer and
+        the pair holds the path in place of the output.
+
+        """
+        return Pipeline(self, queue_size, output_path).run(input_objs)
+
+    def label_batch(self, input_objs, reader_options=None):
+        """It annotates several inputs at once: the parser and each CRF model
+        run once for the whole batch.
+
+        reader_options holds the reader keyword arguments of each input. It
+        returns one output per input, the same that label() would return.
+
+        """
         # according to the type
         assert self.model, 'Model not loaded.'
+        if reader_options is None:
+            reader_options = [{}] * len(input_objs)
 
         identifier = IdentificationClassifier()
         normaliser = NormalisationClassifier()
         linker = RelationClassifier()
 
         try:
-            doc = self.extractor.extract(self.reader.parse(input_obj))
-            annotated_doc = identifier.test([doc], self.model,
-                                            self.post_processing_pipeline)
-            annotated_doc = normaliser.test([doc], self.model, self.domain)
-            annotated_doc = linker.test([doc], self.model)
-
-            output = self.writer.write(annotated_doc)
-            return output
+            with METRICS.span('parse'):
+                docs = self.reader.parse_many(input_objs, reader_options)
         except cElementTree.ParseError:
+            if len(input_objs) > 1:
+                # the broken input is skipped on its own
+                return [self.label_batch([input_obj], [options])[0]
+                        for input_obj, options in zip(input_objs,
+                                                      reader_options)]
             msg = 'Document {} skipped: parse error.'.format(
-                os.path.relpath(input_obj))
+                os.path.relpath(input_objs[0]))
             logging.error(msg)
             return ['']
+        with METRICS.span('extract'):
+            docs = [self.label_extractor.extract(doc) for doc in docs]
+        with METRICS.span('identify'):
+            annotated_doc = identifier.test(docs, self.model,
+                                            self.post_processing_pipeline,
+                                            self.decoding)
+        with METRICS.span('normalise'):
+            annotated_doc = normaliser.test(docs, self.model, self.domain)
+        with METRICS.span('link'):
+            annotated_doc = linker.test(docs, self.model)
+        for doc in annotated_doc:
+            record_document(doc, 'label')
+
+        with METRICS.span('write'):
+            output = self.writer.write(annotated_doc)
+        return output
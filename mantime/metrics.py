@@ -0,0 +1,306 @@
+#!/usr/bin/env python
+#
+#   Copyright 2015 Michele Filannino
+#
+#   gnTEAM, School of Computer Science, University of Manchester.
+#   All rights reserved. This program and the accompanying materials
+#   are made available under the terms of the GNU General Public License.
+#
+#   author: Michele Filannino
+#   email:  filannim@cs.man.ac.uk
+#
+#   For details, see www.cs.man.ac.uk/~filannim/
+
+'''It contains the metrics of ManTIME: counters, histograms and spans.
+
+   METRICS is the registry of the process: it aggregates every measure in
+   memory and hands each of them, as an event (a dictionary), to the sinks
+   added to it (e.g. a JSONLinesSink). prometheus_text() renders a registry
+   in the Prometheus text format; the annotation service exposes it at
+   GET /metrics.
+
+   A span times a block of code (with METRICS.span('identify'): ...): its
+   duration goes in the mantime_span_seconds histogram, its failures in
+   mantime_errors_total and the sinks get its start, duration and parent
+   span (the enclosing one in the same thread).
+
+   Metrics:
+       mantime_documents_total{phase}              documents processed
+       mantime_tokens_total{phase}                 tokens processed
+       mantime_entities_total{type}                predicted annotations
+       mantime_parse_cache_total{result}           parse buffer hits/misses
+       mantime_cache_total{cache,result}           LRUCache hits/misses
+       mantime_subprocess_launches_total{program}  StanfordCoreNLP, CRF++
+       mantime_errors_total{stage}                 failed spans and inputs
+       mantime_span_seconds{span}                  latency of each step
+'''
+
+from abc import ABCMeta, abstractmethod
+from bisect import bisect_left
+from contextlib import contextmanager
+import json
+import threading
+import time
+
+# upper bounds (seconds) of the buckets of the histograms
+DEFAULT_BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1., 2.5, 5., 10., 30.,
+                   60., 300.)
+
+
+class Histogram(object):
+    '''It counts the observed values falling in each bucket.'''
+    __slots__ = ('buckets', 'counts', 'count', 'sum')
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.
+
+    def observe(self, value):
+        position = bisect_left(self.buckets, value)
+        if position < len(self.buckets):
+            self.counts[position] += 1
+        self.count += 1
+        self.sum += value
+
+
+class Registry(object):
+    '''It aggregates the counters and the histograms of a process and
+    forwards each measure to its sinks.
+
+    Each measure is identified by its name and its labels (keyword
+    arguments, e.g. METRICS.inc('mantime_errors_total', stage='parse')).
+    '''
+
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+        self.sinks = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def add_sink(self, sink):
+        self.sinks.append(sink)
+        return sink
+
+    def remove_sink(self, sink):
+        self.sinks.remove(sink)
+
+    def _emit(self, event):
+        for sink in self.sinks:
+            sink.emit(event)
+
+    def inc(self, name, value=1, **labels):
+        '''It increments a counter.
+
+        '''
+        key = (name, tuple(sorted(labels.iteritems())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+        if self.sinks:
+            self._emit({'type': 'counter', 'name': name, 'labels': labels,
+                        'value': value, 'time': time.time()})
+
+    def _observe(self, name, value, labels, buckets):
+        key = (name, tuple(sorted(labels.iteritems())))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def observe(self, name, value, buckets=DEFAULT_BUCKETS, **labels):
+        '''It adds value to a histogram (buckets are used on creation).
+
+        '''
+        self._observe(name, value, labels, buckets)
+        if self.sinks:
+            self._emit({'type': 'histogram', 'name': name, 'labels': labels,
+                        'value': value, 'time': time.time()})
+
+    @contextmanager
+    def span(self, name, **labels):
+        '''It times the enclosed block as the span name.
+
+        '''
+        stack = self._local.__dict__.setdefault('spans', [])
+        parent = stack[-1] if stack else None
+        stack.append(name)
+        start = time.time()
+        failed = False
+        try:
+            yield
+        except Exception:
+            failed = True
+            self.inc('mantime_errors_total', stage=name)
+            raise
+        finally:
+            seconds = time.time() - start
+            stack.pop()
+            span_labels = dict(labels, span=name)
+            self._observe('mantime_span_seconds', seconds, span_labels,
+                          DEFAULT_BUCKETS)
+            if self.sinks:
+                self._emit({'type': 'span', 'name': name, 'labels': labels,
+                            'parent': parent, 'time': start,
+                            'seconds': seconds, 'error': failed})
+
+    def _values(self):
+        return {'counters': [[name, list(labels), value]
+                             for (name, labels), value
+                             in self.counters.iteritems()],
+                'histograms': [[name, list(labels), list(h.buckets),
+                                list(h.counts), h.count, h.sum]
+                               for (name, labels), h
+                               in self.histograms.iteritems()]}
+
+    def snapshot(self):
+        '''It returns the current values (JSON-serialisable).
+
+        '''
+        with self._lock:
+            return self._values()
+
+    def drain(self):
+        '''It returns the snapshot and resets the registry (e.g. in a worker
+        process, whose measures are merged by the parent one).
+
+        '''
+        with self._lock:
+            snapshot = self._values()
+            self.counters = {}
+            self.histograms = {}
+        return snapshot
+
+    def merge(self, snapshot):
+        '''It adds the values of a snapshot to the registry.
+
+        '''
+        with self._lock:
+            for name, labels, value in snapshot['counters']:
+                key = (name, tuple(tuple(label) for label in labels))
+                self.counters[key] = self.counters.get(key, 0) + value
+            for name, labels, buckets, counts, count, total in \
+                    snapshot['histograms']:
+                key = (name, tuple(tuple(label) for label in labels))
+                histogram = self.histograms.get(key)
+                if histogram is None:
+                    histogram = self.histograms[key] = Histogram(buckets)
+                assert list(histogram.buckets) == list(buckets), \
+                    'Different buckets.'
+                histogram.counts = [a + b for a, b
+                                    in zip(histogram.counts, counts)]
+                histogram.count += count
+                histogram.sum += total
+
+
+class Sink(object):
+    '''A destination of the metric events.'''
+    __metaclass__ = ABCMeta
+
+    @abstractmethod
+    def emit(self, event):
+        pass
+
+
+class JSONLinesSink(Sink):
+    '''It writes each event as a line of JSON.
+
+    '''
+
+    def __init__(self, output):
+        if isinstance(output, basestring):
+            output = open(output, 'a')
+        self.output = output
+        self._lock = threading.Lock()
+
+    def emit(self, event):
+        line = json.dumps(event, sort_keys=True) + '\n'
+        with self._lock:
+            self.output.write(line)
+            self.output.flush()
+
+    def close(self):
+        self.output.close()
+
+
+def _escape(value):
+    return unicode(value).replace('\\', '\\\\').replace('"', '\\"')\
+        .replace('\n', '\\n')
+
+
+def _labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return u'{' + u','.join(u'{}="{}"'.format(name, _escape(value))
+                            for name, value in pairs) + u'}'
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def prometheus_text(registry, gauges=None):
+    '''It returns the values of registry, and gauges (a dictionary of
+    current values by name), in the Prometheus text format.
+
+    '''
+    snapshot = registry.snapshot()
+    lines = []
+    for name, value in sorted((gauges or {}).iteritems()):
+        lines.append(u'# TYPE {} gauge'.format(name))
+        lines.append(u'{} {}'.format(name, _number(value)))
+    counters = {}
+    for name, labels, value in snapshot['counters']:
+        counters.setdefault(name, []).append((labels, value))
+    for name in sorted(counters):
+        lines.append(u'# TYPE {} counter'.format(name))
+        for labels, value in sorted(counters[name]):
+            lines.append(u'{}{} {}'.format(name, _labels(labels),
+                                          _number(value)))
+    histograms = {}
+    for name, labels, buckets, counts, count, total in \
+            snapshot['histograms']:
+        histograms.setdefault(name, []).append((labels, buckets, counts,
+                                                count, total))
+    for name in sorted(histograms):
+        lines.append(u'# TYPE {} histogram'.format(name))
+        for labels, buckets, counts, count, total in sorted(histograms[name]):
+            cumulative = 0
+            for bucket, bucket_count in zip(buckets, counts):
+                cumulative += bucket_count
+                lines.append(u'{}_bucket{} {}'.format(
+                    name, _labels(labels, [('le', _number(bucket))]),
+                    cumulative))
+            lines.append(u'{}_bucket{} {}'.format(
+                name, _labels(labels, [('le', '+Inf')]), count))
+            lines.append(u'{}_sum{} {}'.format(name, _labels(labels),
+                                              _number(total)))
+            lines.append(u'{}_count{} {}'.format(name, _labels(labels),
+                                                count))
+    return '\n'.join(lines) + '\n'
+
+
+def record_document(document, phase):
+    '''It counts a document, its tokens and (when labelling) its predicted
+    annotations by type.
+
+    '''
+    METRICS.inc('mantime_documents_total', phase=phase)
+    METRICS.inc('mantime_tokens_total',
+                sum(len(sentence.words) for sentence in document.sentences),
+                phase=phase)
+    if phase == 'label':
+        entities = {}
+        for element in document.predicted_annotations.itervalues():
+            entity_type = type(element).__name__
+            entities[entity_type] = entities.get(entity_type, 0) + 1
+        for entity_type, count in entities.iteritems():
+            METRICS.inc('mantime_entities_total', count, type=entity_type)
+
+
+METRICS = Registry()
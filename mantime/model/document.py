@@ -15,6 +15,11 @@
 
 """
 
+from array import array
+from collections import MutableMapping
+import hashlib
+import re
+
 from ..utilities import deephash
 
 
@@ -26,6 +31,8 @@ class SequenceLabel(object):
          ^---^       ^---^  tag
     '''
     _SEPARATOR = '-'
+    _CODES = {}
+    _TABLE = []
 
     def __init__(self, position, tag=None):
         assert type(tag) == str or not tag
@@ -66,6 +73,38 @@ class SequenceLabel(object):
     def copy(self):
         return SequenceLabel(self.position, self.tag)
 
+    def code(self):
+        '''It returns the small integer which interns the label.
+
+        Words store their labels as codes rather than as objects.
+        '''
+        key = (self.position, getattr(self, 'tag', None))
+        try:
+            return SequenceLabel._CODES[key]
+        except KeyError:
+            SequenceLabel._CODES[key] = len(SequenceLabel._TABLE)
+            SequenceLabel._TABLE.append(key)
+            return SequenceLabel._CODES[key]
+
+    @staticmethod
+    def chunk_positions(length, annotation_format='IO'):
+        '''It returns the positions of the words of an annotation made of
+        length words, e.g. ['B', 'I', 'E'] in WBIOE, ['I', 'I', 'I'] in IO.
+
+        '''
+        pattern = ['I'] * length
+        pattern[0] = 'B'
+        pattern[-1] = 'E'
+        if length == 1:
+            pattern = ['W']
+        return [pos if pos in annotation_format else 'I' for pos in pattern]
+
+    @staticmethod
+    def from_code(code):
+        '''It returns a new SequenceLabel from its code.'''
+        position, tag = SequenceLabel._TABLE[code]
+        return SequenceLabel(position, tag)
+
     def __str__(self):
         if self.tag:
             return self._SEPARATOR.join([self.position, self.tag])
@@ -83,6 +122,9 @@ class SequenceLabel(object):
         return deephash(self.__dict__)
 
 
+OUT_LABEL_CODE = SequenceLabel('O').code()
+
+
 class DependencyGraphNode(object):
 
     def __init__(self, label):
@@ -192,7 +234,7 @@ class Document(object):
          * Word
            - next                                           X
            - previous                                       X
-           - constituency parent                            X
+           - constituency parent (lazily)                   X
            - dependencies out (basic)                       X
            - dependencies in (basic)                        X
            - dependencies out (collapsed)                   X
@@ -237,32 +279,34 @@ class Document(object):
             s.next = next_sentence
 
         # dependencies_out and dependencies_in for `Word`
+        # (the dictionaries are assigned only when non-empty)
         for sentence in self.sentences:
             # basic-dependencies
             for idx, node in sentence.basic_dependencies.nodes.iteritems():
-                for parent_idx, rel in node.parents.iteritems():
-                    parent = sentence.words[parent_idx]
-                    sentence.words[idx].basic_dependencies_in[rel] = parent
-                for child_idx, rel in node.childs.iteritems():
-                    child = sentence.words[child_idx]
-                    sentence.words[idx].basic_dependencies_out[rel] = child
+                word = sentence.words[idx]
+                if node.parents:
+                    word.basic_dependencies_in = {
+                        rel: sentence.words[parent_idx] for parent_idx, rel
+                        in node.parents.iteritems()}
+                if node.childs:
+                    word.basic_dependencies_out = {
+                        rel: sentence.words[child_idx] for child_idx, rel
+                        in node.childs.iteritems()}
 
             # collapsed-dependencies
             for idx, node in sentence.collapsed_dependencies.nodes.iteritems():
-                for parent_idx, rel in node.parents.iteritems():
-                    parent = sentence.words[parent_idx]
-                    sentence.words[idx].collapsed_dependencies_in[rel] = parent
-                for child_idx, rel in node.childs.iteritems():
-                    child = sentence.words[child_idx]
-                    sentence.words[idx].collapsed_dependencies_out[rel] = child
-
-        # constituency anchoring for `Word`
-        for sentence in self.sentences:
-            for id_word in xrange(len(sentence.words)):
-                word = sentence.words[id_word]
-                word.constituency_parent = \
-                    sentence.parsetree[
-                        sentence.parsetree.leaf_treeposition(id_word)[:-1]]
+                word = sentence.words[idx]
+                if node.parents:
+                    word.collapsed_dependencies_in = {
+                        rel: sentence.words[parent_idx] for parent_idx, rel
+                        in node.parents.iteritems()}
+                if node.childs:
+                    word.collapsed_dependencies_out = {
+                        rel: sentence.words[child_idx] for child_idx, rel
+                        in node.childs.iteritems()}
+
+        # constituency anchoring for `Word` is resolved lazily (see
+        # Word.constituency_parent and Sentence.constituency).
 
         # coreference mentions, representatives for `Word`, `Sentence` and
         # `Document` classes.
@@ -301,14 +345,8 @@ class Document(object):
                 if type(obj) in (Event, TemporalExpression)]
 
         for obj in objs:
-            pattern = ['I'] * len(obj.words)
-            pattern[0] = 'B'
-            pattern[-1] = 'E'
-            if len(obj.words) == 1:
-                pattern = ['W']
-            for idx, pos in enumerate(pattern):
-                if pos not in annotation_format:
-                    pattern[idx] = 'I'
+            pattern = SequenceLabel.chunk_positions(len(obj.words),
+                                                    annotation_format)
             for idx, word in enumerate(obj.words):
                 word.gold_label = SequenceLabel(pattern[idx], obj.tag)
                 word.tag_attributes = obj.tag_attributes
@@ -341,17 +379,279 @@ class Document(object):
         return deephash(self.__dict__)
 
 
+class ConstituencyTree(object):
+    '''It represents a constituency tree as parent-pointer arrays.
+
+    The nodes (leaves included) are numbered in pre-order, as they appear in
+    the bracketed parse string, which is read without building any nltk
+    Tree. For each node the arrays store its parent (-1 for the root), its
+    position among the parent's children, its number of children and
+    whether it is a leaf. `leaves` maps each token to its leaf node.
+    '''
+    __slots__ = ('labels', 'parents', 'child_positions', 'n_children',
+                 'is_leaf', 'leaves')
+    _TOKENS = re.compile(r'\(\s*([^\s()]*)|\)|([^\s()]+)')
+
+    def __init__(self, parsetree=''):
+        self.labels = []
+        self.parents = array('i')
+        self.child_positions = array('i')
+        self.n_children = array('i')
+        self.is_leaf = array('b')
+        self.leaves = array('i')
+        stack = []
+        for match in self._TOKENS.finditer(parsetree):
+            if match.group(0) == ')':
+                if stack:
+                    stack.pop()
+                continue
+            node = len(self.labels)
+            parent = stack[-1] if stack else -1
+            self.parents.append(parent)
+            if parent >= 0:
+                self.child_positions.append(self.n_children[parent])
+                self.n_children[parent] += 1
+            else:
+                self.child_positions.append(0)
+            self.n_children.append(0)
+            if match.group(2) is not None:
+                self.labels.append(match.group(2))
+                self.is_leaf.append(True)
+                self.leaves.append(node)
+            else:
+                self.labels.append(match.group(1))
+                self.is_leaf.append(False)
+                stack.append(node)
+
+    def parent(self, node):
+        '''It returns the parent node (None for the root).'''
+        parent = self.parents[node]
+        if parent < 0:
+            return None
+        return parent
+
+    def children(self, node):
+        '''It returns the child nodes, in order.'''
+        result = []
+        for child in xrange(node + 1, len(self.parents)):
+            if self.parents[child] == node:
+                result.append(child)
+                if len(result) == self.n_children[node]:
+                    break
+        return result
+
+    def leaf_parent(self, id_word):
+        '''It returns the part-of-speech node of the id_word-th token.'''
+        return self.parent(self.leaves[id_word])
+
+    def __len__(self):
+        return len(self.labels)
+
+
+class DependencyTable(object):
+    '''It represents the dependencies (basic or collapsed) of the words of a
+    sentence as arrays, computed once for all its words.
+
+    For each word the arrays store its parent (the source of its first
+    incoming relation, as in Word.dependencies_in; -1 if none) and the type
+    of that relation, the number of its incoming and outgoing relations and
+    two bitmasks with a bit set for each type of labels among its incoming
+    and outgoing relations. `ancestors(k)` is the array of the k-th
+    ancestors, obtained from the (k-1)-th ones in a single pass.
+    '''
+    __slots__ = ('words', 'kind', 'labels', 'parents', 'relations', 'n_in',
+                 'n_out', 'in_masks', 'out_masks', '_ancestors', '_rows',
+                 '_climbs')
+
+    def __init__(self, words, kind, labels):
+        assert kind in ('basic', 'collapsed')
+        self.words = words
+        self.kind = kind
+        self.labels = labels
+        bits = {label: 1 << bit for bit, label in enumerate(labels)}
+        positions = {id(word): position
+                     for position, word in enumerate(words)}
+        mask = lambda deps: sum(bits.get(relation, 0) for relation in deps)
+        self.parents = array('i')
+        self.relations = []
+        self.n_in = array('i')
+        self.n_out = array('i')
+        self.in_masks = []
+        self.out_masks = []
+        for word in words:
+            if kind == 'basic':
+                deps_in = word.basic_dependencies_in
+                deps_out = word.basic_dependencies_out
+            else:
+                deps_in = word.collapsed_dependencies_in
+                deps_out = word.collapsed_dependencies_out
+            first = next(deps_in.iteritems(), None)
+            if first is None:
+                self.parents.append(-1)
+                self.relations.append(None)
+            else:
+                self.parents.append(positions[id(first[1])])
+                self.relations.append(first[0])
+            self.n_in.append(len(deps_in))
+            self.n_out.append(len(deps_out))
+            self.in_masks.append(mask(deps_in))
+            self.out_masks.append(mask(deps_out))
+        self._ancestors = [array('i', xrange(len(words))), self.parents]
+        self._rows = {}
+        self._climbs = {}
+
+    def ancestors(self, k):
+        '''It returns the array of the k-th ancestors of the words (-1 if
+        the chain of parents is shorter).
+
+        '''
+        parents = self.parents
+        while len(self._ancestors) <= k:
+            self._ancestors.append(array('i', (
+                parents[node] if node >= 0 else -1
+                for node in self._ancestors[-1])))
+        return self._ancestors[k]
+
+    def row(self, mask):
+        '''It returns the flags (a tuple of booleans, one for each label)
+        of a bitmask.
+
+        '''
+        flags = self._rows.get(mask)
+        if flags is None:
+            flags = self._rows[mask] = tuple(
+                bool(mask >> bit & 1) for bit in xrange(len(self.labels)))
+        return flags
+
+    def climb(self, stop, steps):
+        '''It returns, for each word, the first among itself and its
+        ancestors up to the steps-th one for which stop (a function of a
+        word) is True, the steps-th ancestor if there is none and -1 if the
+        chain of parents ends before.
+
+        '''
+        key = (stop, steps)
+        nodes = self._climbs.get(key)
+        if nodes is not None:
+            return nodes
+        stops = [bool(stop(word)) for word in self.words]
+        nodes = array('i', [-1] * len(self.parents))
+        pending = range(len(self.parents))
+        for k in xrange(steps + 1):
+            ancestors = self.ancestors(k)
+            left = []
+            for node in pending:
+                ancestor = ancestors[node]
+                if ancestor < 0 or stops[ancestor] or k == steps:
+                    nodes[node] = ancestor
+                else:
+                    left.append(node)
+            pending = left
+            if not pending:
+                break
+        self._climbs[key] = nodes
+        return nodes
+
+    def __len__(self):
+        return len(self.parents)
+
+
+class FeatureHeader(object):
+    '''It represents the ordered list of attribute names of the words.
+
+    The header is shared by all the sentences processed with the same
+    extractors: every name is stored once and mapped to its column position,
+    so that words don't need to carry their own attribute name strings.
+    '''
+    def __init__(self, names=()):
+        self.names = []
+        self.positions = {}
+        for name in names:
+            self.add(name)
+
+    def add(self, name):
+        '''It returns the position of *name*, appending it if it is new.'''
+        try:
+            return self.positions[name]
+        except KeyError:
+            self.positions[name] = len(self.names)
+            self.names.append(name)
+            return self.positions[name]
+
+    def __len__(self):
+        return len(self.names)
+
+    def __iter__(self):
+        return iter(self.names)
+
+    @staticmethod
+    def key(name):
+        '''It returns the attribute name without its position prefix (e.g.
+        word_token_normalised for 042_word_token_normalised), which doesn't
+        change when other extractors are added or removed.'''
+        return name.split('_', 1)[1]
+
+
+DEFAULT_HEADER = FeatureHeader()
+
+
+class WordAttributes(MutableMapping):
+    '''Dictionary-like view on the attribute values of a word.
+
+    The values live in the sentence, one row per word, and the columns are
+    given by the sentence's FeatureHeader. Unset values are stored as None.
+    '''
+    __slots__ = ('sentence', 'id_word')
+
+    def __init__(self, sentence, id_word):
+        self.sentence = sentence
+        self.id_word = id_word
+
+    def __getitem__(self, name):
+        value = self.sentence.get_attribute(
+            self.id_word, self.sentence.header.positions[name])
+        if value is None:
+            raise KeyError(name)
+        return value
+
+    def __setitem__(self, name, value):
+        self.sentence.set_attribute(self.id_word,
+                                    self.sentence.header.add(name), value)
+
+    def __delitem__(self, name):
+        self[name]
+        self.sentence.set_attribute(
+            self.id_word, self.sentence.header.positions[name], None)
+
+    def __iter__(self):
+        for position, name in enumerate(self.sentence.header.names):
+            if self.sentence.get_attribute(self.id_word,
+                                           position) is not None:
+                yield name
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+
 class Sentence(object):
 
-    def __init__(self, id_sentence, basic_dependencies=None,
-                 collapsed_dependencies=None, parsetree='', text=''):
-        from nltk import ParentedTree
+    __slots__ = ('id_sentence', 'basic_dependencies',
+                 'collapsed_dependencies', '_parsetree', '_tree',
+                 '_constituency', 'words',
+                 'next', 'previous', 'coreference_mentions',
+                 'coreference_representatives', '_connected_sentences',
+                 'header', '_attribute_values', '_width',
+                 '_dependency_tables')
 
+    def __init__(self, id_sentence, basic_dependencies=None,
+                 collapsed_dependencies=None, parsetree='', text='',
+                 header=DEFAULT_HEADER):
         assert type(id_sentence) == int, 'Wrong id type'
         assert basic_dependencies is None or \
             type(basic_dependencies) == list, 'Basic dependencies type'
         assert collapsed_dependencies is None or \
             type(collapsed_dependencies) == list, 'Collapsed dependencies type'
+        assert isinstance(header, FeatureHeader), 'Wrong header type'
         if text:
             assert type(text) == list, 'Wrong text type'
 
@@ -359,13 +659,141 @@ class Sentence(object):
         self.basic_dependencies = DependencyGraph(basic_dependencies)
         self.collapsed_dependencies = DependencyGraph(collapsed_dependencies)
         self._parsetree = parsetree
-        self.parsetree = ParentedTree(parsetree)
+        self._tree = None
+        self._constituency = None
         self.words = []
         self.next = None
         self.previous = None
         self.coreference_mentions = []
         self.coreference_representatives = []
         self._connected_sentences = None
+        self.header = header
+        self._attribute_values = []
+        self._width = 0
+        self._dependency_tables = None
+
+    @property
+    def parsetree(self):
+        '''The nltk ParentedTree of the sentence, built on first access.
+
+        '''
+        if self._tree is None:
+            from nltk import ParentedTree
+            self._tree = ParentedTree(self._parsetree)
+        return self._tree
+
+    @property
+    def constituency(self):
+        '''The compact ConstituencyTree of the sentence, built on first
+        access.
+
+        '''
+        if self._constituency is None:
+            self._constituency = ConstituencyTree(self._parsetree)
+        return self._constituency
+
+    def dependency_table(self, kind, labels):
+        '''The DependencyTable of the basic or collapsed dependencies of the
+        words, built on first access (and again if labels changes).
+
+        '''
+        tables = self._dependency_tables
+        if tables is None:
+            tables = self._dependency_tables = {}
+        table = tables.get(kind)
+        if table is None or table.labels is not labels:
+            table = tables[kind] = DependencyTable(self.words, kind, labels)
+        return table
+
+    def reset_attributes(self, header):
+        '''It binds the sentence to *header* and allocates an empty row of
+        attribute values for each word.
+
+        '''
+        assert isinstance(header, FeatureHeader), 'Wrong header type'
+        self.header = header
+        self._width = len(header)
+        self._attribute_values = [None] * (len(self.words) * self._width)
+
+    def attribute_row(self, id_word):
+        '''It returns the attribute values of a word in header order.
+
+        '''
+        if self._width < len(self.header):
+            self._resize(len(self.header))
+        start = id_word * self._width
+        return self._attribute_values[start:start + self._width]
+
+    def get_attribute(self, id_word, position):
+        '''It returns the value of a word's attribute (None if unset).
+
+        '''
+        if position >= self._width:
+            return None
+        try:
+            return self._attribute_values[id_word * self._width + position]
+        except IndexError:
+            return None
+
+    def set_attribute(self, id_word, position, value):
+        '''It stores the value of a word's attribute in the sentence array.
+
+        The array is laid out row by row (one row per word) and it is resized
+        the first time a column beyond the current width is written.
+        '''
+        index = id_word * self._width + position
+        if position >= self._width or index >= len(self._attribute_values):
+            self._resize(max(len(self.header), position + 1))
+            index = id_word * self._width + position
+        self._attribute_values[index] = value
+
+    def attribute_values(self):
+        '''It returns the width and a copy of the attribute values of the
+        words (see load_attribute_values).
+
+        '''
+        return self._width, list(self._attribute_values)
+
+    def load_attribute_values(self, header, width, values):
+        '''It binds the sentence to *header* and restores the attribute
+        values returned by attribute_values().
+
+        '''
+        assert isinstance(header, FeatureHeader), 'Wrong header type'
+        assert len(values) == len(self.words) * width, 'Wrong values length'
+        self.header = header
+        self._width = width
+        self._attribute_values = list(values)
+
+    def fingerprint(self):
+        '''It returns an MD5 digest of what the word and sentence extractors
+        read: the words (form, lemma, POS, named entity and coreference
+        flags), the parse tree and the dependencies.
+
+        '''
+        md5_obj = hashlib.md5()
+        for word in self.words:
+            md5_obj.update(repr((word.word_form, word.lemma,
+                                 word.part_of_speech, word.named_entity_tag,
+                                 bool(word.is_coreference_head),
+                                 word.coreference_mention is not None)))
+        md5_obj.update(repr(self._parsetree))
+        for graph in (self.basic_dependencies, self.collapsed_dependencies):
+            md5_obj.update(repr(sorted((id_word, sorted(node.childs.items()))
+                                       for id_word, node
+                                       in graph.nodes.iteritems())))
+        return md5_obj.digest()
+
+    def _resize(self, width):
+        values = [None] * (len(self.words) * width)
+        old_width = self._width
+        for id_word in xrange(len(self._attribute_values) // old_width
+                              if old_width else 0):
+            values[id_word * width:id_word * width + old_width] = \
+                self._attribute_values[id_word * old_width:
+                                       (id_word + 1) * old_width]
+        self._attribute_values = values
+        self._width = width
 
     def connected_sentences(self):
         '''It returns a set of all the id_sentences to which the current
@@ -394,18 +822,73 @@ class Sentence(object):
         return id_sentence in connections
 
     def __str__(self):
-        return str(self.__dict__)
+        return str({slot: getattr(self, slot) for slot in self.__slots__})
 
     def __repr__(self):
-        return repr(self.__dict__)
+        return repr({slot: getattr(self, slot) for slot in self.__slots__})
 
     def __hash__(self):
         return deephash([self._indexed_dependencies, self._parsetree,
                          self.words])
 
 
+class _OptionalDict(object):
+    '''Dictionary attribute kept in a slot only when it is not empty.
+
+    Reading an unset attribute returns a new empty dictionary, therefore the
+    attribute has to be assigned (not updated in place).
+    '''
+    def __init__(self, slot):
+        self.slot = slot
+
+    def __get__(self, obj, objtype=None):
+        if obj is None:
+            return self
+        return getattr(obj, self.slot) or {}
+
+    def __set__(self, obj, value):
+        setattr(obj, self.slot, value or None)
+
+
+class _LabelCode(object):
+    '''SequenceLabel attribute stored in a slot as its small integer code.
+
+    Reading it returns a new SequenceLabel object.
+    '''
+    def __init__(self, slot):
+        self.slot = slot
+
+    def __get__(self, obj, objtype=None):
+        if obj is None:
+            return self
+        return SequenceLabel.from_code(getattr(obj, self.slot))
+
+    def __set__(self, obj, value):
+        assert isinstance(value, SequenceLabel), 'Wrong label type'
+        setattr(obj, self.slot, value.code())
+
+
 class Word(object):
 
+    __slots__ = ('word_form', 'character_offset_begin',
+                 'character_offset_end', 'lemma', 'named_entity_tag',
+                 'part_of_speech', '_attributes', 'id_token', 'id_sentence',
+                 'sentence', '_gold_label', '_predicted_label',
+                 'tag_attributes', 'next', 'previous',
+                 '_basic_dependencies_in', '_basic_dependencies_out',
+                 '_collapsed_dependencies_in', '_collapsed_dependencies_out',
+                 'constituency_left_sibling', 'constituency_right_sibling',
+                 '_constituency_parent', 'coreference_mention',
+                 'coreference_representative', 'is_coreference_head',
+                 'is_coreference_representative')
+
+    gold_label = _LabelCode('_gold_label')
+    predicted_label = _LabelCode('_predicted_label')
+    basic_dependencies_in = _OptionalDict('_basic_dependencies_in')
+    basic_dependencies_out = _OptionalDict('_basic_dependencies_out')
+    collapsed_dependencies_in = _OptionalDict('_collapsed_dependencies_in')
+    collapsed_dependencies_out = _OptionalDict('_collapsed_dependencies_out')
+
     def __init__(self, word_form, char_offset_begin, char_offset_end,
                  lemma, named_entity_tag, part_of_speech, id_token,
                  id_sentence):
@@ -415,26 +898,56 @@ class Word(object):
         self.lemma = lemma
         self.named_entity_tag = named_entity_tag
         self.part_of_speech = part_of_speech
-        self.attributes = dict()
+        self._attributes = None
         self.id_token = id_token
         self.id_sentence = id_sentence
         self.sentence = None
-        self.gold_label = SequenceLabel('O')
-        self.predicted_label = SequenceLabel('O')
+        self._gold_label = OUT_LABEL_CODE
+        self._predicted_label = OUT_LABEL_CODE
         self.tag_attributes = dict()
         self.next = None
         self.previous = None
-        self.basic_dependencies_in = dict()
-        self.basic_dependencies_out = dict()
-        self.collapsed_dependencies_in = dict()
-        self.collapsed_dependencies_out = dict()
+        self._basic_dependencies_in = None
+        self._basic_dependencies_out = None
+        self._collapsed_dependencies_in = None
+        self._collapsed_dependencies_out = None
         self.constituency_left_sibling = None
         self.constituency_right_sibling = None
-        self.constituency_parent = None
+        self._constituency_parent = None
         self.coreference_mention = None
+        self.coreference_representative = None
         self.is_coreference_head = False
         self.is_coreference_representative = False
 
+    @property
+    def attributes(self):
+        '''Dictionary-like access to the attributes of the word.
+
+        The values are stored in the sentence the word belongs to. Words
+        outside a sentence keep their own dictionary.
+        '''
+        if self.sentence is None:
+            if self._attributes is None:
+                self._attributes = dict()
+            return self._attributes
+        return WordAttributes(self.sentence, self.id_token)
+
+    @property
+    def constituency_parent(self):
+        '''The nltk node of the word's part of speech, resolved on first
+        access.
+
+        '''
+        if self._constituency_parent is None and self.sentence is not None:
+            parsetree = self.sentence.parsetree
+            self._constituency_parent = parsetree[
+                parsetree.leaf_treeposition(self.id_token)[:-1]]
+        return self._constituency_parent
+
+    @constituency_parent.setter
+    def constituency_parent(self, node):
+        self._constituency_parent = node
+
     def dependencies_out(self, type, target_word=None):
         '''Returns couples (`relation_type`, `target_word`) of outgoing
         dependency relations from the current word.
@@ -474,14 +987,14 @@ class Word(object):
             return [(r, w) for r, w in deps.iteritems()]
 
     def __str__(self):
-        return str(self.__dict__)
+        return str({slot: getattr(self, slot) for slot in self.__slots__})
 
     def __repr__(self):
         return '[{} ({},{})]'.format(self.lemma, self.character_offset_begin,
                                      self.character_offset_end)
 
     def __hash__(self):
-        return deephash(self.__dict__)
+        return hash((self.id_sentence, self.id_token))
 
     def __lt__(self, other):
         assert isinstance(self, type(other)), 'Wrong types!'
@@ -27,6 +27,52 @@ import sys
 from timex_clinical import normalise
 
 
+class NoteIndex(object):
+    """Positional index of a clinical note
+
+    It is built with a single tokenising pass over the text and stores the
+    date references, the positions of each signal (together with the number
+    of dates preceding them) and a prefix-sum of the newlines, so that the
+    number of newlines between any two positions is computed in O(1).
+    """
+    def __init__(self, text, date_syntax, signals):
+        self.text = text
+        self.date_refs = []
+        self.signal_refs = {signal: [] for signal in signals}
+        self.newlines = [0] * (len(text) + 1)
+        for position, char in enumerate(text):
+            self.newlines[position + 1] = self.newlines[position] + \
+                (char == '\n')
+        groups = ['(?P<date>{})'.format(date_syntax)]
+        names = {}
+        for num, signal in enumerate(signals):
+            names['signal{}'.format(num)] = signal
+            groups.append('(?P<signal{}>{})'.format(num, re.escape(signal)))
+        for match in re.finditer('|'.join(groups), text):
+            if match.lastgroup == 'date':
+                self.date_refs.append((match.start(), match.end()))
+            else:
+                self.signal_refs[names[match.lastgroup]].append(
+                    (match.start(), len(self.date_refs)))
+
+    def newlines_inside(self, start, end):
+        """Number of newlines strictly between start and end."""
+        low, high = min(start, end), max(start, end)
+        if high <= low:
+            return 0
+        return self.newlines[high] - self.newlines[low + 1]
+
+    def dates_within(self, threshold):
+        """Number of leading dates having at most *threshold* newlines before
+        them (they always are a prefix of date_refs)."""
+        valid = 0
+        for date in self.date_refs:
+            if self.newlines_inside(0, date[0]) > threshold:
+                break
+            valid += 1
+        return valid
+
+
 class DocumentAnalyser(object):
     """Analyses clinical documents
 
@@ -43,58 +89,61 @@ class DocumentAnalyser(object):
 
     def analyse(self, path, filename, normalisation=False):
         clinical_note = ClinicalDocument()
-        text = ''
+        lines = []
         with codecs.open(os.path.join(path, filename)) as file_content:
             for line in file_content:
                 if not re.match("^(?:\]\]>)?<(?:\?|/)?[A-Za-z]+", line):
-                    text += line.lower()
-        date_refs = [(match.start(), match.end()) for match in re.finditer(self.date_syntaxes[0], text)]
+                    lines.append(line.lower())
+        text = ''.join(lines)
+        index = NoteIndex(text, self.date_syntaxes[0],
+                          (self.admission_signals, self.discharge_signals,
+                           self.operation_signals, self.transfer_signals))
         clinical_note.file_name = filename
         clinical_note.file_path = path
         if normalisation:
-            clinical_note.admission_date = normalise(self.search_closest(self.admission_signals, date_refs, text, 'forward', 6))[2]
-            clinical_note.discharge_date = normalise(self.search_closest(self.discharge_signals, date_refs, text, 'forward', 6))[2]
+            clinical_note.admission_date = normalise(self.search_closest(self.admission_signals, index, 'forward', 6))[2]
+            clinical_note.discharge_date = normalise(self.search_closest(self.discharge_signals, index, 'forward', 6))[2]
             if clinical_note.discharge_date == 'NONE':
-                clinical_note.discharge_date = normalise(self.search_closest(self.discharge_signals, date_refs, text, 'forward', 50))[2]
-            clinical_note.operation_date = normalise(self.search_closest(self.operation_signals, date_refs, text, 'both'), clinical_note.admission_date.replace('-', ''))[2]
-            clinical_note.transfer_date = normalise(self.search_closest(self.transfer_signals, date_refs, text, 'both'), clinical_note.admission_date.replace('-', ''))[2]
+                clinical_note.discharge_date = normalise(self.search_closest(self.discharge_signals, index, 'forward', 50))[2]
+            clinical_note.operation_date = normalise(self.search_closest(self.operation_signals, index, 'both'), clinical_note.admission_date.replace('-', ''))[2]
+            clinical_note.transfer_date = normalise(self.search_closest(self.transfer_signals, index, 'both'), clinical_note.admission_date.replace('-', ''))[2]
             clinical_note.course_length = self.get_difference_from_normalised_dates(clinical_note.admission_date, clinical_note.discharge_date)
         else:
-            clinical_note.admission_date = self.search_closest(self.admission_signals, date_refs, text, 'forward', 6)
-            clinical_note.discharge_date = self.search_closest(self.discharge_signals, date_refs, text, 'forward', 6)
+            clinical_note.admission_date = self.search_closest(self.admission_signals, index, 'forward', 6)
+            clinical_note.discharge_date = self.search_closest(self.discharge_signals, index, 'forward', 6)
             if not clinical_note.discharge_date:
-                clinical_note.discharge_date = self.search_closest(self.discharge_signals, date_refs, text, 'forward', 50)
+                clinical_note.discharge_date = self.search_closest(self.discharge_signals, index, 'forward', 50)
                 clinical_note.discharge_date_not_in_header = True
-            clinical_note.operation_date = self.search_closest(self.operation_signals, date_refs, text, 'both')
-            clinical_note.transfer_date = self.search_closest(self.transfer_signals, date_refs, text, 'both')
+            clinical_note.operation_date = self.search_closest(self.operation_signals, index, 'both')
+            clinical_note.transfer_date = self.search_closest(self.transfer_signals, index, 'both')
             clinical_note.course_length = self.get_difference_from_normalised_dates(normalise(clinical_note.admission_date)[2], normalise(clinical_note.discharge_date)[2])
         return clinical_note
 
-    def search_closest(self, object, date_refs, text, direction='both', threshold=10*10):
+    def search_closest(self, object, index, direction='both', threshold=10*10):
+        """It returns the text of the date closest to any occurrence of the
+        signal *object*.
+
+        The distance is the number of characters multiplied by the number of
+        newlines in between (plus one). It grows monotonically moving away
+        from the signal on both sides, therefore only the nearest date before
+        and the nearest date after each signal occurrence are candidates.
+        """
         min_value = 10**10
-        object_refs = [match.start() for match in re.finditer(re.escape(object), text)]
         result = (-1, -1, -1)
-        for target_word in object_refs:
-            if direction =='forward': dates = [date for date in date_refs if date[0] > target_word and self.get_number_of_newlines_inside(0, date[0], text) <= threshold]
-            elif direction =='backward': dates = [date for date in date_refs if date[0] < target_word and self.get_number_of_newlines_inside(0, date[0], text) <= threshold]
-            else: dates = [date for date in date_refs if self.get_number_of_newlines_inside(0, date[0], text) <= threshold]
-            for date in dates:
-                n_of_returns = self.get_number_of_newlines_inside(date[0], target_word, text)
+        valid = index.dates_within(threshold)
+        for target_word, following in index.signal_refs[object]:
+            candidates = []
+            if direction in ('backward', 'both') and min(following, valid):
+                candidates.append(index.date_refs[min(following, valid) - 1])
+            if direction in ('forward', 'both') and following < valid:
+                candidates.append(index.date_refs[following])
+            for date in candidates:
+                n_of_returns = index.newlines_inside(date[0], target_word)
                 distance = abs(date[0]-target_word)*(n_of_returns+1)
-                # print n_of_returns, self.get_number_of_newlines_inside(date[0],target_word,text)
                 if distance<min_value:
                     result = (target_word,date[0],date[1])
                     min_value = distance
-                # print text[date[0]:date[1]]
-        return text[result[1]:result[2]]
-
-    def get_number_of_newlines_inside(self, start, end, text):
-        return_refs = [match.start() for match in re.finditer(re.escape('\n'),
-                       text)]
-        result = len([return_pointer for return_pointer in return_refs if
-                      return_pointer < max(start, end) and
-                      return_pointer > min(start, end)])
-        return result
+        return index.text[result[1]:result[2]]
 
     def get_difference_from_normalised_dates(self, date1, date2):
         try:
@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+#
+#   Copyright 2015 Michele Filannino
+#
+#   gnTEAM, School of Computer Science, University of Manchester.
+#   All rights reserved. This program and the accompanying materials
+#   are made available under the terms of the GNU General Public License.
+#
+#   author: Michele Filannino
+#   email:  filannim@cs.man.ac.uk
+#
+#   For details, see www.cs.man.ac.uk/~filannim/
+
+'''It contains the staged annotation pipeline of ManTIME.
+
+   Each step of ManTIME.label (parse, extract, identify, normalise, link and
+   write) runs in its own thread and hands its documents to the next one
+   through a bounded queue. The slow steps mostly wait for external processes
+   (StanfordCoreNLP, crf_test), hence the parsing of a document, the decoding
+   of the previous one and the feature extraction of another one overlap.
+   Documents leave the pipeline in the same order they entered it, each with
+   the same output ManTIME.label would give. Given an output_path function,
+   the write step streams each output straight to its own file instead.
+'''
+
+import logging
+import os
+import Queue
+import sys
+import threading
+import time
+import xml.etree.cElementTree as cElementTree
+
+from classifier import IdentificationClassifier
+from classifier import NormalisationClassifier
+from classifier import RelationClassifier
+from metrics import METRICS
+from metrics import record_document
+
+# it marks the end of the input
+_END = object()
+
+
+class _Item(object):
+    '''A document travelling through the pipeline.'''
+    __slots__ = ('input_obj', 'value', 'error')
+
+    def __init__(self, input_obj):
+        self.input_obj = input_obj
+        self.value = input_obj
+        self.error = None
+
+
+class Stage(object):
+    '''A step of the pipeline: it applies function to each item of source and
+    puts the result in sink, keeping track of its busy time. With with_input,
+    function takes the original input as well.
+
+    '''
+
+    def __init__(self, name, function, source, sink, with_input=False):
+        self.name = name
+        self.function = function
+        self.with_input = with_input
+        self.source = source
+        self.sink = sink
+        self.busy_time = 0.
+        self.processed = 0
+        self.thread = threading.Thread(target=self.run, name=name)
+        self.thread.daemon = True
+
+    def run(self):
+        item = self.source.get()
+        while item is not _END:
+            if item.error is None:
+                start = time.time()
+                try:
+                    with METRICS.span(self.name):
+                        if self.with_input:
+                            item.value = self.function(item.input_obj,
+                                                       item.value)
+                        else:
+                            item.value = self.function(item.value)
+                except Exception:
+                    item.error = sys.exc_info()
+                self.busy_time += time.time() - start
+                self.processed += 1
+            self.sink.put(item)
+            item = self.source.get()
+        self.sink.put(_END)
+
+
+class Pipeline(object):
+    '''It annotates a stream of inputs with the stages of a ManTIME object.
+
+    '''
+
+    def __init__(self, mantime, queue_size=2, output_path=None):
+        assert mantime.model, 'Model not loaded.'
+        assert queue_size > 0, 'Wrong queue size.'
+        self.mantime = mantime
+        self.queue_size = queue_size
+        self.output_path = output_path
+        self.stages = []
+        self.wall_time = 0.
+
+    def _functions(self):
+        mantime = self.mantime
+        identifier = IdentificationClassifier()
+        normaliser = NormalisationClassifier()
+        linker = RelationClassifier()
+        return [
+            ('parse', mantime.reader.parse),
+            ('extract', mantime.label_extractor.extract),
+            ('identify', lambda doc: identifier.test(
+                [doc], mantime.model, mantime.post_processing_pipeline,
+                mantime.decoding)[0]),
+            ('normalise', lambda doc: normaliser.test(
+                [doc], mantime.model, mantime.domain)[0]),
+            ('link', lambda doc: linker.test([doc], mantime.model)[0]),
+            ('write', self._write)]
+
+    def _write(self, input_obj, doc):
+        record_document(doc, 'label')
+        if self.output_path:
+            return self.mantime.writer.write_file(doc,
+                                                  self.output_path(input_obj))
+        return self.mantime.writer.write([doc])[0]
+
+    def run(self, input_objs):
+        '''It yields an (input, output) pair for each input, in order; with
+        output_path, the output is the path of the file written.
+
+        '''
+        queues = [Queue.Queue(self.queue_size)]
+        self.stages = []
+        for name, function in self._functions():
+            queues.append(Queue.Queue(self.queue_size))
+            self.stages.append(Stage(name, function, queues[-2], queues[-1],
+                                     with_input=(name == 'write')))
+
+        def feed():
+            for input_obj in input_objs:
+                queues[0].put(_Item(input_obj))
+            queues[0].put(_END)
+
+        feeder = threading.Thread(target=feed, name='feed')
+        feeder.daemon = True
+        start = time.time()
+        for stage in self.stages:
+            stage.thread.start()
+        feeder.start()
+
+        try:
+            item = queues[-1].get()
+            while item is not _END:
+                if item.error is None:
+                    yield item.input_obj, item.value
+                elif issubclass(item.error[0], cElementTree.ParseError):
+                    msg = 'Document {} skipped: parse error.'.format(
+                        os.path.relpath(item.input_obj))
+                    logging.error(msg)
+                    yield item.input_obj, ''
+                else:
+                    raise item.error[0], item.error[1], item.error[2]
+                item = queues[-1].get()
+        finally:
+            self.wall_time = time.time() - start
+            self.report()
+
+    def statistics(self):
+        '''It returns the throughput (documents per second) and the occupancy
+        of each stage (the fraction of the wall time it was busy).
+
+        '''
+        processed = self.stages[-1].processed if self.stages else 0
+        wall_time = self.wall_time or float('inf')
+        return {'documents': processed,
+                'wall_time': self.wall_time,
+                'throughput': processed / wall_time,
+                'occupancy': [(stage.name, stage.busy_time / wall_time)
+                              for stage in self.stages]}
+
+    def report(self):
+        stats = self.statistics()
+        logging.info('Pipeline: {} documents in {:.2f}s ({:.2f} docs/s).'
+                     .format(stats['documents'], stats['wall_time'],
+                             stats['throughput']))
+        for name, occupancy in stats['occupancy']:
+            logging.info('Pipeline: {} stage busy {:.0%}.'.format(
+                name, occupancy))
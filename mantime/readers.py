@@ -42,7 +42,7 @@ from model.data import Event
 from model.data import EventInstance
 from model.data import TemporalExpression
 from model.data import TemporalLink
-from utilities import Mute_stderr
+from metrics import METRICS
 from settings import PATH_CORENLP_FOLDER
 from normalisers.clinical_doc_analyser import DocumentAnalyser
 
@@ -73,9 +73,36 @@ class BatchedCoreNLP(object):
         hash_value = str(hash(text))
         dest_file = os.path.join(os.path.abspath(folder), hash_value)
         try:
-            return cPickle.load(open(dest_file))
+            result = cPickle.load(open(dest_file))
         except IOError:
+            METRICS.inc('mantime_parse_cache_total', result='miss')
             return self._parse(text, dest_file)
+        METRICS.inc('mantime_parse_cache_total', result='hit')
+        return result
+
+    def parse_many(self, texts, folder='./buffer/'):
+        """Returns the parsing of each text, computing the missing ones with a
+        single StanfordCoreNLP run.
+
+        """
+        results = [None] * len(texts)
+        missing = {}
+        for position, text in enumerate(texts):
+            dest_file = os.path.join(os.path.abspath(folder),
+                                     str(hash(text)))
+            try:
+                results[position] = cPickle.load(open(dest_file))
+                METRICS.inc('mantime_parse_cache_total', result='hit')
+            except IOError:
+                METRICS.inc('mantime_parse_cache_total', result='miss')
+                missing.setdefault(text, (dest_file, []))[1].append(position)
+        if missing:
+            for text, result in self._parse_many(missing.keys()).iteritems():
+                dest_file, positions = missing[text]
+                cPickle.dump(result, open(dest_file, 'w'))
+                for position in positions:
+                    results[position] = result
+        return results
 
     def _parse(self, text, dest_file):
         '''Computes the parsing calling Stanford NLP api.
@@ -89,14 +116,36 @@ class BatchedCoreNLP(object):
         with codecs.open(filename, 'w', encoding='utf8') as tmp:
             tmp.write(text)
             tmp.flush()
+            METRICS.inc('mantime_subprocess_launches_total',
+                        program='corenlp')
             result = batch_parse(os.path.dirname(tmp.name), self.folder)
             result = list(result)[0]
         cPickle.dump(result, open(dest_file, 'w'))
         return result
 
+    def _parse_many(self, texts):
+        '''Computes the parsing of several texts with one call to Stanford
+        NLP api and returns them by text.
+
+        '''
+        import shutil
+        import tempfile
+        from corenlp import batch_parse
+        dirname = tempfile.mkdtemp()
+        try:
+            for position, text in enumerate(texts):
+                file_name = os.path.join(dirname, str(position))
+                with codecs.open(file_name, 'w', encoding='utf8') as tmp:
+                    tmp.write(text)
+            METRICS.inc('mantime_subprocess_launches_total',
+                        program='corenlp')
+            return {texts[int(result['file_name'])]: result
+                    for result in batch_parse(dirname, self.folder)}
+        finally:
+            shutil.rmtree(dirname)
 
-with Mute_stderr():
-    CORENLP = BatchedCoreNLP(PATH_CORENLP_FOLDER)
+
+CORENLP = BatchedCoreNLP(PATH_CORENLP_FOLDER)
 
 
 class Reader(object):
@@ -107,6 +156,16 @@ class Reader(object):
     def parse(self, text):
         pass
 
+    def parse_many(self, inputs, options=None):
+        '''It parses several inputs and returns their Document objects.
+
+        options holds the keyword arguments of parse() for each input.
+        '''
+        if options is None:
+            options = [{}] * len(inputs)
+        return [self.parse(input_obj, **input_options)
+                for input_obj, input_options in zip(inputs, options)]
+
 
 class TextReader(Reader):
     '''Handles textual input.
@@ -115,12 +174,35 @@ class TextReader(Reader):
     def __init__(self):
         pass
 
-    def parse(self, text):
+    def parse(self, text, dct=None):
         '''It parses a textual unicode input and return a Document object.
 
+        The document creation time is dct (a date), or today if not given.
+        '''
+        return self.parse_many([text], [{'dct': dct}])[0]
+
+    def parse_many(self, texts, options=None):
+        '''It parses several textual unicode inputs at once (see parse).
+
+        '''
+        if options is None:
+            options = [{}] * len(texts)
+        filenames = [self._write(text, **text_options)
+                     for text, text_options in zip(texts, options)]
+        tempeval_parser = TempEval3FileReader()
+        try:
+            return tempeval_parser.parse_many(filenames)
+        finally:
+            for filename in filenames:
+                os.remove(filename)
+
+    def _write(self, text, dct=None):
+        '''It writes text in a temporary TempEval-3 file and returns its
+        path.
+
         '''
         assert type(text) == unicode
-        now = datetime.now()
+        now = dct or datetime.now()
         month, day = '{:0>2}'.format(now.month), '{:0>2}'.format(now.day)
         tmp_file = tempfile.NamedTemporaryFile(delete=False)
         filename = tmp_file.name
@@ -133,8 +215,7 @@ class TextReader(Reader):
             tmp_file.write('<TEXT>\n')
             tmp_file.write(cgi.escape(text, True))
             tmp_file.write('</TEXT>\n</TimeML>')
-        tempeval_parser = TempEval3FileReader()
-        return tempeval_parser.parse(filename)
+        return filename
 
 
 class FileReader(Reader):
@@ -161,6 +242,23 @@ class TempEval3FileReader(FileReader):
         """It parses the content of file_path and extracts relevant information
         from a TempEval-3 annotated file. Those information are packed in a
         Document object, which is our internal representation.
+        """
+        return self.parse_many([file_path])[0]
+
+    def parse_many(self, file_paths, options=None):
+        """It parses several TempEval-3 files, running StanfordCoreNLP once
+        for all of them.
+
+        """
+        sources = [self._read(file_path) for file_path in file_paths]
+        stanford_trees = CORENLP.parse_many([source[4] for source in sources])
+        return [self._build(source, stanford_tree)
+                for source, stanford_tree in zip(sources, stanford_trees)]
+
+    def _read(self, file_path):
+        """It reads the XML of a TempEval-3 file and returns its relevant
+        elements.
+
         """
         assert os.path.isfile(file_path), 'File path does not exist!'
         logging.info('Document {}: parsing...'.format(
@@ -182,9 +280,16 @@ class TempEval3FileReader(FileReader):
         text_xml = etree.tostring(text_node)
         # StanfordParser strips internally the text :(
         left_chars = len(text_string) - len(text_string.lstrip())
+        return (file_path, xml, docid, dct, text_string, text_xml, title,
+                left_chars)
 
-        with Mute_stderr():
-            stanford_tree = CORENLP.parse(text_string)
+    def _build(self, source, stanford_tree):
+        """It packs the elements read from a TempEval-3 file and their
+        parsing in a Document object.
+
+        """
+        (file_path, xml, docid, dct, text_string, text_xml, title,
+         left_chars) = source
         document = Document(file_path)
         document.text_offset = left_chars
         document.file_path = os.path.abspath(file_path)
@@ -372,9 +477,16 @@ class WikiWarsInLineFileReader(FileReader):
         text_xml = etree.tostring(text_node)
         # StanfordParser strips internally the text :(
         left_chars = len(text_string) - len(text_string.lstrip())
+        return (file_path, xml, docid, dct, text_string, text_xml, title,
+                left_chars)
+
+    def _build(self, source, stanford_tree):
+        """It packs the elements read from a TempEval-3 file and their
+        parsing in a Document object.
 
-        with Mute_stderr():
-            stanford_tree = CORENLP.parse(text_string)
+        """
+        (file_path, xml, docid, dct, text_string, text_xml, title,
+         left_chars) = source
         document = Document(file_path)
         document.text_offset = left_chars
         document.file_path = os.path.abspath(file_path)
@@ -473,6 +585,23 @@ class i2b2FileReader(FileReader):
         """It parses the content of file_path and extracts relevant information
         from a TempEval-3 annotated file. Those information are packed in a
         Document object, which is our internal representation.
+        """
+        return self.parse_many([file_path])[0]
+
+    def parse_many(self, file_paths, options=None):
+        """It parses several TempEval-3 files, running StanfordCoreNLP once
+        for all of them.
+
+        """
+        sources = [self._read(file_path) for file_path in file_paths]
+        stanford_trees = CORENLP.parse_many([source[4] for source in sources])
+        return [self._build(source, stanford_tree)
+                for source, stanford_tree in zip(sources, stanford_trees)]
+
+    def _read(self, file_path):
+        """It reads the XML of a TempEval-3 file and returns its relevant
+        elements.
+
         """
         assert os.path.isfile(file_path), 'File path does not exist!'
         logging.info('Document {}: parsing...'.format(
@@ -489,8 +618,7 @@ class i2b2FileReader(FileReader):
 
         # StanfordParser strips internally the text :(
         left_chars = len(text_string) - len(text_string.lstrip())
-        with Mute_stderr():
-            stanford_tree = CORENLP.parse(text_string)
+        stanford_tree = CORENLP.parse(text_string)
 
         document = Document(file_path)
         document.text_offset = left_chars
@@ -0,0 +1,473 @@
+#!/usr/bin/env python
+#
+#   Copyright 2015 Michele Filannino
+#
+#   gnTEAM, School of Computer Science, University of Manchester.
+#   All rights reserved. This program and the accompanying materials
+#   are made available under the terms of the GNU General Public License.
+#
+#   author: Michele Filannino
+#   email:  filannim@cs.man.ac.uk
+#
+#   For details, see www.cs.man.ac.uk/~filannim/
+
+'''It contains the annotation service of ManTIME.
+
+   A pool of worker processes is forked once at start-up; each of them builds
+   its own ManTIME object (model, extractor and gazetteers loaded once) and
+   annotates the texts it receives. The HTTP front-end accepts at most
+   `workers + queue_size` requests at a time and rejects the others straight
+   away (503), so that a burst of traffic never piles up unbounded work.
+
+   Requests are handed to the workers in micro-batches: as soon as a worker
+   is free, the scheduler collects the waiting requests (up to `batch_size`,
+   waiting at most `batch_wait` seconds for more) and annotates them with a
+   single ManTIME.label_batch call, i.e. one parser run and one run of each
+   CRF model for the whole batch. The more requests wait, the larger the
+   batches get; a request never waits for more than `batch_wait` plus the
+   batch in progress. A batch whose worker dies or does not answer within
+   the timeout is failed, so that its worker and its requests are always
+   freed.
+
+   Each worker sends the metrics it recorded (see metrics.py) back with the
+   annotations of a batch; they are merged in the registry of the service
+   together with the requests, their latency and the size of the batches.
+
+   API:
+       POST /annotate  {"text": "...", "dct": "YYYY-MM-DD"}  (dct optional)
+                       -> {"timeml": "..."}
+       POST /          sentence=... (HTML form) -> templates/mantime.html
+       GET  /static/*  the files of the static folder
+       GET  /health    -> {"status": "ok", "model": ..., "workers": ...,
+                           "in_flight": ..., "queued": ..., "capacity": ...,
+                           "batch_size": ...}
+       GET  /metrics   -> the metrics in the Prometheus text format
+'''
+
+from BaseHTTPServer import BaseHTTPRequestHandler
+from BaseHTTPServer import HTTPServer
+import cgi
+from datetime import datetime
+import functools
+import json
+import logging
+import mimetypes
+import multiprocessing
+import os
+import Queue
+from SocketServer import ThreadingMixIn
+import threading
+import time
+import traceback
+import urlparse
+
+from classifier import ClassificationModel
+from metrics import METRICS
+from metrics import prometheus_text
+
+MAX_REQUEST_SIZE = 1024 * 1024
+ROOT_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FORM_TEMPLATE = os.path.join(ROOT_FOLDER, 'templates', 'mantime.html')
+STATIC_FOLDER = os.path.join(ROOT_FOLDER, 'static')
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+# the ManTIME object of the current worker process
+_MANTIME = None
+
+
+class ServiceBusy(Exception):
+    '''Raised when the service has no room for another request.'''
+    pass
+
+
+class AnnotationError(Exception):
+    '''Raised when a worker fails annotating a text.'''
+    pass
+
+
+def _start_worker(model_name, pipeline, domain, decoding, sentence_cache):
+    '''It builds the ManTIME object of a worker process.
+
+    '''
+    global _MANTIME
+    from mantime import ManTIME
+    from readers import TextReader
+    from writers import TempEval3Writer
+    from attributes_extractor import FullExtractor
+
+    # the measures and the sinks of the parent process are not the worker's
+    METRICS.drain()
+    del METRICS.sinks[:]
+    _MANTIME = ManTIME(reader=TextReader(), writer=TempEval3Writer(),
+                       extractor=FullExtractor(), model_name=model_name,
+                       pipeline=pipeline, domain=domain, decoding=decoding,
+                       sentence_cache=sentence_cache)
+    logging.info('Worker {}: ready.'.format(os.getpid()))
+
+
+def _annotate(texts, dcts):
+    '''It annotates texts in the current worker process and returns a
+    (success, output) pair for each of them.
+
+    Errors are returned rather than raised. If the batch fails, its texts are
+    annotated one by one so that a bad text only fails itself.
+    '''
+    try:
+        outputs = _MANTIME.label_batch(texts, [{'dct': dct} for dct in dcts])
+        return [(True, output) for output in outputs]
+    except Exception:
+        if len(texts) == 1:
+            return [(False, traceback.format_exc())]
+    return [_annotate([text], [dct])[0] for text, dct in zip(texts, dcts)]
+
+
+def _annotate_batch(texts, dcts):
+    '''It returns the results of _annotate and the metrics recorded by the
+    worker in the meantime.
+
+    '''
+    return _annotate(texts, dcts), METRICS.drain()
+
+
+class _Request(object):
+    '''A text waiting for its annotation.'''
+    __slots__ = ('text', 'dct', 'done', 'success', 'output')
+
+    def __init__(self, text, dct):
+        self.text = text
+        self.dct = dct
+        self.done = threading.Event()
+        self.success = False
+        self.output = None
+
+
+class _Batch(object):
+    '''The requests annotated together by a worker.'''
+    __slots__ = ('requests', 'result', 'deadline', 'released')
+
+    def __init__(self, requests):
+        self.requests = requests
+        self.result = None
+        self.deadline = None
+        self.released = False
+
+
+def render_form(result):
+    '''It returns the page of the HTML form showing result (TimeML).
+
+    '''
+    with open(FORM_TEMPLATE) as template:
+        page = template.read().decode('utf8')
+    utterance = datetime.now().strftime('%A, %d %B %Y')
+    return page.replace(u'{{result|safe}}', result)\
+        .replace(u'{{utterance}}', cgi.escape(utterance))
+
+
+def parse_dct(value):
+    '''It returns the date represented by a YYYY-MM-DD string (or None).
+
+    '''
+    if value is None:
+        return None
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+
+class AnnotationService(object):
+    '''It dispatches the annotation requests to a pool of warm workers.
+
+    '''
+
+    def __init__(self, model_name, workers=None, queue_size=None,
+                 timeout=600, pipeline=True, domain='general',
+                 max_requests_per_worker=None, batch_size=8, batch_wait=.01,
+                 decoding='rewrite', sentence_cache=0):
+        # the manifest is checked once here, before forking the workers
+        ClassificationModel.load(model_name)
+        assert batch_size > 0, 'Wrong batch size.'
+        self.model_name = model_name
+        self.workers = workers or multiprocessing.cpu_count()
+        if queue_size is None:
+            queue_size = self.workers * batch_size
+        self.capacity = self.workers + queue_size
+        self.timeout = timeout
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.in_flight = 0
+        self._lock = threading.Lock()
+        self._requests = Queue.Queue()
+        self._idle_workers = threading.Semaphore(self.workers)
+        self._running = Queue.Queue()
+        self._pool = multiprocessing.Pool(
+            self.workers, _start_worker,
+            (model_name, pipeline, domain, decoding, sentence_cache),
+            max_requests_per_worker)
+        self._scheduler = threading.Thread(target=self._schedule)
+        self._scheduler.daemon = True
+        self._scheduler.start()
+        self._reaper = threading.Thread(target=self._reap)
+        self._reaper.daemon = True
+        self._reaper.start()
+
+    def _next_batch(self):
+        '''It waits for a request and a free worker and returns the batch of
+        requests collected in the meantime (None when closing).
+
+        '''
+        request = self._requests.get()
+        # the requests abandoned after their timeout are skipped
+        while request is not None and request.done.is_set():
+            request = self._requests.get()
+        if request is None:
+            return None
+        self._idle_workers.acquire()
+        batch = [request]
+        deadline = time.time() + self.batch_wait
+        while len(batch) < self.batch_size:
+            try:
+                request = self._requests.get(
+                    timeout=max(0, deadline - time.time()))
+            except Queue.Empty:
+                break
+            if request is None:
+                self._requests.put(None)
+                break
+            if not request.done.is_set():
+                batch.append(request)
+        return _Batch(batch)
+
+    def _schedule(self):
+        batch = self._next_batch()
+        while batch:
+            texts = [request.text for request in batch.requests]
+            dcts = [request.dct for request in batch.requests]
+            METRICS.observe('mantime_batch_size', len(texts),
+                            buckets=BATCH_SIZE_BUCKETS)
+            try:
+                batch.deadline = time.time() + self.timeout
+                batch.result = self._pool.apply_async(
+                    _annotate_batch, (texts, dcts),
+                    callback=functools.partial(self._completed, batch))
+                self._running.put(batch)
+            except Exception:
+                self._fail(batch, traceback.format_exc())
+            batch = self._next_batch()
+
+    def _reap(self):
+        '''It fails the batches that end without a callback, i.e. whose
+        worker died or raised, or that outlive the timeout.
+
+        '''
+        batch = self._running.get()
+        while batch is not None:
+            try:
+                batch.result.get(max(0, batch.deadline - time.time()))
+            except multiprocessing.TimeoutError:
+                self._fail(batch, 'No answer from the worker in {} '
+                           'seconds.'.format(self.timeout))
+            except Exception:
+                self._fail(batch, traceback.format_exc())
+            batch = self._running.get()
+
+    def _completed(self, batch, outcome):
+        results, metrics = outcome
+        METRICS.merge(metrics)
+        self._complete(batch, results)
+
+    def _fail(self, batch, error):
+        self._complete(batch, [(False, error)] * len(batch.requests))
+
+    def _complete(self, batch, results):
+        '''It frees the worker of batch and completes its requests (only the
+        first time, either from the callback or from the reaper).
+
+        '''
+        with self._lock:
+            if batch.released:
+                return
+            batch.released = True
+        self._idle_workers.release()
+        for request, (success, output) in zip(batch.requests, results):
+            self._finish(request, success, output)
+
+    def _finish(self, request, success, output):
+        '''It completes request and frees its slot, unless it is already
+        complete. It returns whether it did.
+
+        '''
+        with self._lock:
+            if request.done.is_set():
+                return False
+            request.success, request.output = success, output
+            self.in_flight -= 1
+            request.done.set()
+        return True
+
+    def annotate(self, text, dct=None):
+        '''It returns the TimeML annotation of text.
+
+        It raises ServiceBusy if all the workers are busy and the queue is
+        full, AnnotationError if the worker fails and
+        multiprocessing.TimeoutError if the annotation takes too long.
+        '''
+        with self._lock:
+            if self.in_flight >= self.capacity:
+                METRICS.inc('mantime_requests_total', outcome='busy')
+                raise ServiceBusy()
+            self.in_flight += 1
+        request = _Request(text, dct)
+        with METRICS.span('request'):
+            self._requests.put(request)
+            request.done.wait(self.timeout)
+            # still waiting: the request is abandoned and its slot freed
+            if self._finish(request, False, None):
+                METRICS.inc('mantime_requests_total', outcome='timeout')
+                raise multiprocessing.TimeoutError()
+        if not request.success:
+            METRICS.inc('mantime_requests_total', outcome='error')
+            raise AnnotationError(request.output)
+        METRICS.inc('mantime_requests_total', outcome='ok')
+        return request.output
+
+    def health(self):
+        return {'status': 'ok', 'model': self.model_name,
+                'workers': self.workers, 'in_flight': self.in_flight,
+                'queued': self._requests.qsize(),
+                'capacity': self.capacity, 'batch_size': self.batch_size}
+
+    def metrics(self):
+        '''It returns the metrics of the service and of its workers in the
+        Prometheus text format.
+
+        '''
+        return prometheus_text(METRICS, {'mantime_in_flight': self.in_flight,
+                                         'mantime_queued':
+                                         self._requests.qsize(),
+                                         'mantime_capacity': self.capacity})
+
+    def close(self):
+        self._requests.put(None)
+        self._running.put(None)
+        self._pool.terminate()
+        self._pool.join()
+
+
+class AnnotationRequestHandler(BaseHTTPRequestHandler):
+    '''It exposes an AnnotationService over HTTP (JSON in, JSON out).
+
+    '''
+
+    def _reply(self, status, content, headers=()):
+        body = json.dumps(content)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _reply_body(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _static(self):
+        name = os.path.normpath(self.path[len('/static/'):].split('?')[0])
+        path = os.path.join(STATIC_FOLDER, name)
+        if name.startswith(('.', '/')) or not os.path.isfile(path):
+            return self._reply(404, {'error': 'not found'})
+        with open(path, 'rb') as static_file:
+            body = static_file.read()
+        self._reply_body(200, body, mimetypes.guess_type(path)[0] or
+                         'application/octet-stream')
+
+    def do_GET(self):
+        if self.path.startswith('/static/'):
+            self._static()
+        elif self.path.rstrip('/') == '/health':
+            self._reply(200, self.server.service.health())
+        elif self.path.rstrip('/') == '/metrics':
+            self._reply_body(200,
+                             self.server.service.metrics().encode('utf8'),
+                             'text/plain; version=0.0.4; charset=utf-8')
+        else:
+            self._reply(404, {'error': 'not found'})
+
+    def _read_body(self):
+        '''It returns the body of the request (None, having replied, if it
+        is missing or too large).
+
+        '''
+        try:
+            size = int(self.headers.getheader('Content-Length', 0))
+        except ValueError:
+            return self._reply(400, {'error': 'invalid Content-Length'})
+        if size > MAX_REQUEST_SIZE:
+            return self._reply(413, {'error': 'request too large'})
+        return self.rfile.read(size)
+
+    def _annotate(self, text, dct=None):
+        '''It returns the TimeML of text (None, having replied, if the
+        service fails).
+
+        '''
+        try:
+            return self.server.service.annotate(unicode(text), dct)
+        except ServiceBusy:
+            self._reply(503, {'error': 'service busy'},
+                        [('Retry-After', '1')])
+        except multiprocessing.TimeoutError:
+            self._reply(504, {'error': 'annotation timed out'})
+        except AnnotationError as error:
+            logging.error('Annotation failed:\n{}'.format(error))
+            self._reply(500, {'error': 'annotation failed'})
+
+    def _form(self):
+        body = self._read_body()
+        if body is None:
+            return
+        try:
+            sentence = urlparse.parse_qs(body)['sentence'][0].decode('utf8')
+        except (KeyError, UnicodeDecodeError):
+            return self._reply(400, {'error': 'expected sentence=...'})
+        timeml = self._annotate(sentence)
+        if timeml is not None:
+            self._reply_body(200, render_form(timeml).encode('utf8'),
+                             'text/html; charset=utf-8')
+
+    def do_POST(self):
+        if self.path.rstrip('/') == '':
+            return self._form()
+        if self.path.rstrip('/') != '/annotate':
+            return self._reply(404, {'error': 'not found'})
+        body = self._read_body()
+        if body is None:
+            return
+        try:
+            content = json.loads(body)
+            text = content['text']
+            assert isinstance(text, basestring)
+            dct = parse_dct(content.get('dct'))
+        except (ValueError, KeyError, TypeError, AttributeError,
+                AssertionError):
+            return self._reply(400, {'error': 'expected {"text": "...", ' +
+                                     '"dct": "YYYY-MM-DD"}'})
+        timeml = self._annotate(text, dct)
+        if timeml is not None:
+            self._reply(200, {'timeml': timeml})
+
+    def log_message(self, format, *args):
+        logging.info('{} {}'.format(self.address_string(), format % args))
+
+
+class AnnotationServer(ThreadingMixIn, HTTPServer):
+    '''A threaded HTTP server; the actual work happens in the service pool.
+
+    '''
+    daemon_threads = True
+
+    def __init__(self, address, service):
+        HTTPServer.__init__(self, address, AnnotationRequestHandler)
+        self.service = service
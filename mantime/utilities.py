@@ -18,29 +18,14 @@ import collections
 import copy
 import md5
 import os
+import threading
 
+from metrics import METRICS
 
-class Mute_stderr(object):
-    '''A context manager for doing a "deep suppression" of stderr.
 
-    It will suppress all print, even if the print originates in a compiled
-    C/Fortran sub-function. This will not suppress raised exceptions.
-    '''
-    def __init__(self):
-        # Open a pair of null files
-        self.null_fds = os.open(os.devnull, os.O_RDWR)
-        # Save the actual stderr file descriptors.
-        self.save_fds = os.dup(2)
-
-    def __enter__(self):
-        """Assign the null pointers to stderr."""
-        os.dup2(self.null_fds, 2)
-
-    def __exit__(self, *_):
-        """Re-assign the real stderr back (2)."""
-        os.dup2(self.save_fds, 2)
-        # Close the null file
-        os.close(self.null_fds)
+# the standard error of the external programs (StanfordCoreNLP, CRF++): only
+# their own output is discarded, never the one of ManTIME
+DEVNULL = open(os.devnull, 'w')
 
 
 def deephash(obj):
@@ -117,6 +102,42 @@ def search_subsequence(sequence, key, end=False):
                 yield start_position
 
 
+class LRUCache(object):
+    '''A mapping holding at most capacity items: the least recently used one
+    is evicted first. Hits and misses are counted in the metrics as
+    mantime_cache_total{cache=name}.
+    '''
+
+    def __init__(self, capacity, name='cache'):
+        assert capacity > 0, 'Wrong capacity.'
+        self.capacity = capacity
+        self.name = name
+        self._items = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._items.pop(key)
+            except KeyError:
+                value = None
+            else:
+                self._items[key] = value
+        METRICS.inc('mantime_cache_total', cache=self.name,
+                    result='miss' if value is None else 'hit')
+        return default if value is None else value
+
+    def put(self, key, value):
+        with self._lock:
+            self._items.pop(key, None)
+            self._items[key] = value
+            if len(self._items) > self.capacity:
+                self._items.popitem(last=False)
+
+    def __len__(self):
+        return len(self._items)
+
+
 def extractors_stamp():
     path = os.path.abspath('./mantime/attributes_extractor.py')
     attributes_extractor_content = open(path).read()
@@ -125,6 +146,18 @@ def extractors_stamp():
     return md5_obj.digest()
 
 
+def corpus_stamp(paths):
+    '''It returns an MD5 digest (hex) of the names, sizes and modification
+    times of the files at paths.
+
+    '''
+    md5_obj = md5.new()
+    md5_obj.update(repr([(os.path.basename(path), os.path.getsize(path),
+                          int(os.path.getmtime(path)))
+                         for path in sorted(paths)]))
+    return md5_obj.hexdigest()
+
+
 def main():
     '''Test code'''
     assert list(search_subsequence('', 'come')) == []
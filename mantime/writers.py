@@ -19,16 +19,98 @@
 
    In order to force the existence of the write() method I preferred Python
    interfaces to the duck typing practice.
+
+   The writers can also stream their output: write_document() writes a single
+   document piece by piece on a file-like object, stream() writes a sequence
+   of documents one at a time and write_file() writes a document on a new
+   file. None of them builds the output in memory, so that large corpora are
+   exported in constant memory while they are being annotated.
 """
 
 from abc import ABCMeta, abstractmethod
 import cgi
+import codecs
+from itertools import chain
+import os
+from StringIO import StringIO
 
+from columnar import ColumnarMatrixBuilder
 from model.data import TemporalExpression
 from model.data import Event
 from model.data import TemporalLink
 
 
+def render_text(document, annotations, escape=False):
+    """It yields the pieces of the document text with each annotation string
+    in place of the text of its element (an Event or a TemporalExpression).
+
+    annotations is an iterable of (element, annotation string) pairs; they
+    are sorted by position and the text is visited once, hence the cost
+    depends on the length of the text and not on the number of elements. An
+    element overlapping a previous one is skipped. With escape, the text
+    (not the annotations) is escaped for XML.
+    """
+    text = document.text
+    offset = document.text_offset
+    position = 0
+    by_position = lambda pair: (pair[0].start, pair[0].end)
+    for element, annotation in sorted(annotations, key=by_position):
+        start = element.start + offset
+        if start < position:
+            continue
+        piece = text[position:start]
+        yield cgi.escape(piece, True) if escape else piece
+        yield annotation
+        position = max(element.end + offset, start + 1)
+    piece = text[position:]
+    yield cgi.escape(piece, True) if escape else piece
+
+
+def text_elements(document):
+    """It returns the elements of the document which annotate its text.
+
+    """
+    return [e for e in document.predicted_annotations.itervalues()
+            if type(e) in (Event, TemporalExpression)]
+
+
+def inline_annotation(element, event_id='id'):
+    """It returns the inline tag of an element (with all its attributes) used
+    by the i2b2, HTML and generic XML writers; event_id is the name of the
+    identifier attribute of the events.
+
+    """
+    if isinstance(element, TemporalExpression):
+        return unicode('<TIMEX3 tid="{idx}" type="{ttype}"' +
+                       ' mod="{mod}" value="{value}">' +
+                       '{text}</TIMEX3>').format(**element.__dict__)
+    return unicode('<EVENT ' + event_id + '="{idx}" type="{eclass}" ' +
+                   'modality="{modality}" ' +
+                   'polarity="{polarity}"' +
+                   '>{text}</EVENT>').format(**element.__dict__)
+
+
+class LineWriter(object):
+    """It writes lines on a file-like object as soon as they are appended,
+    separated by newlines as '\n'.join() would do. A line is either a string
+    or an iterable of strings (e.g. the pieces yielded by render_text).
+
+    """
+
+    def __init__(self, output):
+        self.output = output
+        self.separator = ''
+
+    def append(self, line):
+        self.output.write(self.separator)
+        if isinstance(line, basestring):
+            self.output.write(line)
+        else:
+            for piece in line:
+                self.output.write(piece)
+        self.separator = '\n'
+
+
 class Writer(object):
     """This class is an abstract writer for ManTIME."""
     __metaclass__ = ABCMeta
@@ -37,6 +119,45 @@ class Writer(object):
     def write(self, document):
         pass
 
+    def write_document(self, document, output):
+        """It writes a single document on output (a file-like object).
+
+        Writers which can produce a document piece by piece override it; this
+        one writes the string returned by write().
+        """
+        output.write(self.write([document])[0])
+
+    def stream(self, documents, output):
+        """It writes the documents on output one at a time.
+
+        """
+        for document in documents:
+            self.write_document(document, output)
+
+    def write_file(self, document, file_path):
+        """It writes a document on a new UTF-8 file and returns its path.
+
+        The file is written aside and renamed, so that it is either complete
+        or missing, even if the process is interrupted.
+        """
+        tmp_path = file_path + '.tmp'
+        with codecs.open(tmp_path, 'w', encoding='utf8') as output:
+            self.write_document(document, output)
+        os.rename(tmp_path, file_path)
+        return file_path
+
+    def _strings(self, documents):
+        """It returns the output of write_document() as a string for each
+        document.
+
+        """
+        outputs = []
+        for document in documents:
+            output = StringIO()
+            self.write_document(document, output)
+            outputs.append(output.getvalue())
+        return outputs
+
 
 class FileWriter(Writer):
     """This classs is an abstract file writer for ManTIME."""
@@ -71,7 +192,32 @@ class TempEval3Writer(FileWriter):
         super(TempEval3Writer, self).__init__()
 
     def write(self, documents):
-        """It writes on an external file in the TempEval-3 format.
+        """It returns the documents in the TempEval-3 format.
+
+        """
+        return self._strings(documents)
+
+    @staticmethod
+    def _annotation(element):
+        """It returns the inline TimeML tag of an element.
+
+        """
+        if isinstance(element, TemporalExpression):
+            if element.mod:
+                return str('<TIMEX3 tid="{idx}" ' +
+                           'type="{ttype}" ' +
+                           'mod="{mod}" value="{value}">' +
+                           '{text}</TIMEX3>').format(**element.__dict__)
+            return str('<TIMEX3 tid="{idx}" ' +
+                       'type="{ttype}" ' +
+                       'value="{value}">' +
+                       '{text}</TIMEX3>').format(**element.__dict__)
+        return str('<EVENT eid="{idx}" class="{eclass}">' +
+                   '{text}</EVENT>').format(**element.__dict__)
+
+    def write_document(self, document, output):
+        """It writes the document in the TempEval-3 format on output (a
+        file-like object), piece by piece.
 
         """
 
@@ -91,89 +237,57 @@ class TempEval3Writer(FileWriter):
                                      name[obj.tag], id_str[direction])
             return result
 
-        outputs = []
-        for document in documents:
-            output = []
-            output.append('<?xml version="1.0" ?>')
-            output.append('<TimeML xmlns:xsi="http://www.w3.org/2001/XMLSche' +
-                          'ma-instance" xsi:noNamespaceSchemaLocation="http:' +
-                          '//timeml.org/timeMLdocs/TimeML_1.2.1.xsd">\n')
-            output.append(u'<DOCID>{doc_id}</DOCID>\n'.format(
-                doc_id=document.doc_id))
-            output.append(str('<DCT><TIMEX3 tid="t0" type="DATE" value="{}" ' +
-                              'temporalFunction="false" functionInDocument="' +
-                              'CREATION_TIME">{}</TIMEX3></DCT>\n'
-                              ).format(document.dct, document.dct_text))
-            output.append(u'<TITLE>{}</TITLE>\n\n'.format(document.title))
-
-            text = list(document.text)
-            # TO-DO: This works properly only for IO annotation schema!
-            elements = (e for e in document.predicted_annotations.itervalues()
-                        if type(e) in (Event, TemporalExpression))
-            for element in elements:
-                # sostituisco il pezzetto nel testo con la stringa annotata
-                if isinstance(element, TemporalExpression):
-                    if element.mod:
-                        annotation = str('<TIMEX3 tid="{idx}" ' +
-                                         'type="{ttype}" ' +
-                                         'mod="{mod}" value="{value}">' +
-                                         '{text}</TIMEX3>').format(
-                            **element.__dict__)
-                    else:
-                        annotation = str('<TIMEX3 tid="{idx}" ' +
-                                         'type="{ttype}" ' +
-                                         'value="{value}">' +
-                                         '{text}</TIMEX3>').format(
-                            **element.__dict__)
-                    text[element.start + document.text_offset] = annotation
-                elif isinstance(element, Event):
-                    annotation = str('<EVENT eid="{idx}" class="{eclass}">' +
-                                     '{text}</EVENT>').format(
-                                         **element.__dict__)
-                text[element.start + document.text_offset] = annotation
-                # empty the remaining characters
-                for i in xrange(document.text_offset + element.start + 1,
-                                document.text_offset + element.end):
-                    text[i] = ''
-
-            output.append(u'<TEXT>{}</TEXT>\n\n'.format(''.join(text)))
-
-            # MAKEINSTANCEs
-            events = (e for e in document.predicted_annotations.itervalues()
-                      if isinstance(e, Event))
-            for event in events:
-                instance = str('<MAKEINSTANCE eiid="i{idx}" eventID="{idx}" ' +
-                               'pos="{pos}" tense="{tense}" ' +
-                               'aspect="{aspect}" polarity="{polarity}" ' +
-                               'modality="{modality}" />').format(
-                                   **event.__dict__)
-                output.append(instance)
-            output.append('')
-
-            # TLINKs
-            def makeinstance(obj):
-                if type(obj) == Event:
-                    return 'i{}'.format(obj.identifier())
-                else:
-                    return obj.identifier()
-
-            tlinks = (e for e in document.predicted_annotations.itervalues()
-                      if isinstance(e, TemporalLink))
-            for tlink in tlinks:
-                xml_tag = unicode('<TLINK lid="{}" {}="{}" ' +
-                                  '{}="{}" ' +
-                                  'relType="{}" />').format(
-                    tlink.lid,
-                    attribute_name_tlink(tlink.from_obj, 'from'),
-                    makeinstance(tlink.from_obj),
-                    attribute_name_tlink(tlink.to_obj, 'to'),
-                    makeinstance(tlink.to_obj),
-                    tlink.relation_type)
-                output.append(xml_tag)
-
-            output.append('</TimeML>\n')
-            outputs.append('\n'.join(output))
-        return outputs
+        lines = LineWriter(output)
+        lines.append('<?xml version="1.0" ?>')
+        lines.append('<TimeML xmlns:xsi="http://www.w3.org/2001/XMLSchema-' +
+                     'instance" xsi:noNamespaceSchemaLocation="http://' +
+                     'timeml.org/timeMLdocs/TimeML_1.2.1.xsd">\n')
+        lines.append(u'<DOCID>{doc_id}</DOCID>\n'.format(
+            doc_id=document.doc_id))
+        lines.append(str('<DCT><TIMEX3 tid="t0" type="DATE" value="{}" ' +
+                         'temporalFunction="false" functionInDocument="' +
+                         'CREATION_TIME">{}</TIMEX3></DCT>\n'
+                         ).format(document.dct, document.dct_text))
+        lines.append(u'<TITLE>{}</TITLE>\n\n'.format(document.title))
+
+        # TO-DO: This works properly only for IO annotation schema!
+        annotations = ((element, self._annotation(element))
+                       for element in text_elements(document))
+        lines.append(chain([u'<TEXT>'], render_text(document, annotations),
+                           [u'</TEXT>\n\n']))
+
+        # MAKEINSTANCEs
+        events = (e for e in document.predicted_annotations.itervalues()
+                  if isinstance(e, Event))
+        for event in events:
+            lines.append(str('<MAKEINSTANCE eiid="i{idx}" eventID="{idx}" ' +
+                             'pos="{pos}" tense="{tense}" ' +
+                             'aspect="{aspect}" polarity="{polarity}" ' +
+                             'modality="{modality}" />').format(
+                                 **event.__dict__))
+        lines.append('')
+
+        # TLINKs
+        def makeinstance(obj):
+            if type(obj) == Event:
+                return 'i{}'.format(obj.identifier())
+            else:
+                return obj.identifier()
+
+        tlinks = (e for e in document.predicted_annotations.itervalues()
+                  if isinstance(e, TemporalLink))
+        for tlink in tlinks:
+            lines.append(unicode('<TLINK lid="{}" {}="{}" ' +
+                                 '{}="{}" ' +
+                                 'relType="{}" />').format(
+                tlink.lid,
+                attribute_name_tlink(tlink.from_obj, 'from'),
+                makeinstance(tlink.from_obj),
+                attribute_name_tlink(tlink.to_obj, 'to'),
+                makeinstance(tlink.to_obj),
+                tlink.relation_type))
+
+        lines.append('</TimeML>\n')
 
 
 class i2b2Writer(FileWriter):
@@ -185,118 +299,104 @@ class i2b2Writer(FileWriter):
         self.inline = inline
 
     def write(self, documents):
-        """It writes on an external file in the i2b2 format.
+        """It returns the documents in the i2b2 format.
 
         Can write both in inline and stand-off XML format.
+        """
+        return self._strings(documents)
+
+    def write_document(self, document, output):
+        """It writes the document in the i2b2 format on output (a file-like
+        object), piece by piece.
+
         """
         if self.inline:
-            return self.write_inline(documents)
+            return self.write_inline_document(document, output)
 
         # stand-off way
-        outputs = []
-        for document in documents:
-            output = []
-            output.append('<?xml version="1.0" ?>')
-            output.append('<ClinicalNarrativeTemporalAnnotation>')
-            output.append(u'<TEXT><![CDATA[{}]]></TEXT>'.format(document.text))
-
-            output.append(u'<TAGS>')
-            # TIMEX3s, EVENTs, TLINKs
-            for element in document.predicted_annotations.itervalues():
-                xml_tag = ''
-                if isinstance(element, TemporalExpression):
-                    element.text = document.get_text(element.start,
-                                                     element.end)
-                    cstart, cend = element.start + 1, element.end + 1
-                    xml_tag = str('<TIMEX3 id="{idx}" start="{cstart}" ' +
-                                  'end="{cend}" text="{text}" type="{ttype}"' +
-                                  ' val="{value}" mod="{mod}" />').format(
-                        cstart=cstart, cend=cend, **element.__dict__)
-                elif isinstance(element, Event):
-                    element.text = document.get_text(element.start,
-                                                     element.end)
-                    cstart, cend = element.start + 1, element.end + 1
-                    xml_tag = str('<EVENT id="{idx}" start="{cstart}" ' +
-                                  'end="{cend}" text="{text}" ' +
-                                  'modality="{modality}" ' +
-                                  'polarity="{polarity}" ' +
-                                  'type="{eclass}" />').format(
-                        cstart=cstart, cend=cend, **element.__dict__)
-                elif isinstance(element, TemporalLink):
-                    xml_tag = unicode('<TLINK id="{}" fromID="{}" ' +
-                                      'fromText="{}" toID="{}" toText="{}" ' +
-                                      'type="{}" />').format(
-                        element.lid, element.from_obj.identifier(),
-                        element.from_obj.text, element.to_obj.identifier(),
-                        element.to_obj.text, element.relation_type)
-                output.append(xml_tag)
-
-            # SECTIMEs
-            output.append(str('<SECTIME id="S0" start="_" end="_" ' +
-                              'text="_" type="ADMISSION" ' +
-                              'dvalue="{}" />').format(
-                document.sec_times.admission_date))
-            output.append(str('<SECTIME id="S1" start="_" end="_" ' +
-                              'text="_" type="DISCHARGE" ' +
-                              'dvalue="{}" />').format(
-                document.sec_times.discharge_date))
-
-            # TLINKs
-
-            # Ending
-            output.append(u'</TAGS>')
-            output.append(u'</ClinicalNarrativeTemporalAnnotation>')
-
-            outputs.append('\n'.join(output))
-        return outputs
+        lines = LineWriter(output)
+        lines.append('<?xml version="1.0" ?>')
+        lines.append('<ClinicalNarrativeTemporalAnnotation>')
+        lines.append(u'<TEXT><![CDATA[{}]]></TEXT>'.format(document.text))
+
+        lines.append(u'<TAGS>')
+        # TIMEX3s, EVENTs, TLINKs
+        for element in document.predicted_annotations.itervalues():
+            xml_tag = ''
+            if isinstance(element, TemporalExpression):
+                element.text = document.get_text(element.start,
+                                                 element.end)
+                cstart, cend = element.start + 1, element.end + 1
+                xml_tag = str('<TIMEX3 id="{idx}" start="{cstart}" ' +
+                              'end="{cend}" text="{text}" type="{ttype}"' +
+                              ' val="{value}" mod="{mod}" />').format(
+                    cstart=cstart, cend=cend, **element.__dict__)
+            elif isinstance(element, Event):
+                element.text = document.get_text(element.start,
+                                                 element.end)
+                cstart, cend = element.start + 1, element.end + 1
+                xml_tag = str('<EVENT id="{idx}" start="{cstart}" ' +
+                              'end="{cend}" text="{text}" ' +
+                              'modality="{modality}" ' +
+                              'polarity="{polarity}" ' +
+                              'type="{eclass}" />').format(
+                    cstart=cstart, cend=cend, **element.__dict__)
+            elif isinstance(element, TemporalLink):
+                xml_tag = unicode('<TLINK id="{}" fromID="{}" ' +
+                                  'fromText="{}" toID="{}" toText="{}" ' +
+                                  'type="{}" />').format(
+                    element.lid, element.from_obj.identifier(),
+                    element.from_obj.text, element.to_obj.identifier(),
+                    element.to_obj.text, element.relation_type)
+            lines.append(xml_tag)
+
+        # SECTIMEs
+        lines.append(str('<SECTIME id="S0" start="_" end="_" ' +
+                         'text="_" type="ADMISSION" ' +
+                         'dvalue="{}" />').format(
+            document.sec_times.admission_date))
+        lines.append(str('<SECTIME id="S1" start="_" end="_" ' +
+                         'text="_" type="DISCHARGE" ' +
+                         'dvalue="{}" />').format(
+            document.sec_times.discharge_date))
+
+        # TLINKs
+
+        # Ending
+        lines.append(u'</TAGS>')
+        lines.append(u'</ClinicalNarrativeTemporalAnnotation>')
 
     def write_inline(self, documents):
-        """It writes on an external file in the TempEval-3 format.
+        """It returns the documents in the inline i2b2 format.
 
         """
         outputs = []
         for document in documents:
-            output = []
-            output.append('<?xml version="1.0" ?>')
-            output.append('<ClinicalNarrativeTemporalAnnotation>')
-
-            text = [cgi.escape(c, True) for c in list(document.text)]
-            # TO-DO: This works properly only for IO annotation schema!
-            for element in document.predicted_annotations.itervalues():
-                # sostituisco il pezzetto nel testo con la stringa annotata
-                if isinstance(element, TemporalExpression):
-                    annotation = unicode('<TIMEX3 tid="{idx}" type="{ttype}"' +
-                                         ' mod="{mod}" value="{value}">' +
-                                         '{text}</TIMEX3>').format(
-                                             **element.__dict__)
-                elif isinstance(element, Event):
-                    annotation = unicode('<EVENT id="{idx}" type="{eclass}" ' +
-                                         'modality="{modality}" ' +
-                                         'polarity="{polarity}"' +
-                                         '>{text}</EVENT>').format(
-                                             **element.__dict__)
-                elif isinstance(element, TemporalLink):
-                    annotation = unicode('<TLINK id="{}" fromID="{}" ' +
-                                         'fromText="{}" toID="{}" ' +
-                                         'toText="{}" type="{}" />').format(
-                        element.lid, element.from_obj.identifier(),
-                        element.from_obj.text, element.to_obj.identifier(),
-                        element.to_obj.text, element.relation_type)
-                text[element.start + document.text_offset] = annotation
-                # empty the remaining characters
-                for i in xrange(document.text_offset + element.start + 1,
-                                document.text_offset + element.end):
-                    text[i] = ''
-
-            output.append(u'<TEXT>{}</TEXT>\n\n'.format(
-                ''.join(text)))
-
-            output.append(u'')
-
-            output.append(u'</ClinicalNarrativeTemporalAnnotation>')
-            outputs.append('\n'.join(output))
+            output = StringIO()
+            self.write_inline_document(document, output)
+            outputs.append(output.getvalue())
         return outputs
 
+    def write_inline_document(self, document, output):
+        """It writes the document in the inline i2b2 format on output.
+
+        """
+        lines = LineWriter(output)
+        lines.append('<?xml version="1.0" ?>')
+        lines.append('<ClinicalNarrativeTemporalAnnotation>')
+
+        # TO-DO: This works properly only for IO annotation schema!
+        # (TLINKs have no position in the text)
+        annotations = ((element, inline_annotation(element, 'id'))
+                       for element in text_elements(document))
+        lines.append(chain([u'<TEXT>'],
+                           render_text(document, annotations, escape=True),
+                           [u'</TEXT>\n\n']))
+
+        lines.append(u'')
+
+        lines.append(u'</ClinicalNarrativeTemporalAnnotation>')
+
 
 class HTMLWriter(FileWriter):
     """This class is a writer in HTML/CSS3 format."""
@@ -307,48 +407,37 @@ class HTMLWriter(FileWriter):
         self.domain = domain
 
     def write(self, documents, domain='general'):
-        """It writes on an external file in the HTML/CSS3 format.
+        """It returns the documents in the HTML/CSS3 format.
+
+        """
+        return self._strings(documents)
+
+    def write_document(self, document, output):
+        """It writes the document in the HTML/CSS3 format on output (a
+        file-like object), piece by piece.
 
         """
         maxcdn_bootstrap = 'https://maxcdn.bootstrapcdn.com/bootstrap/3.3.4/'
-        outputs = []
-        for document in documents:
-            output = []
-            output.append('<?xml version="1.0" encoding="UTF-8"?>')
-            output.append('<!DOCTYPE html PUBLIC "-//W3C//DTD XHTML 1.0 ' +
-                          'Strict//EN" "http://www.w3.org/TR/xhtml1/DTD/' +
-                          'xhtml1-strict.dtd">')
-            output.append('<html xmlns="http://www.w3.org/1999/xhtml">')
-            output.append('<meta name="Author" content="Michele Filannino" />')
-            output.append('<link rel="stylesheet" href="{}css/bootstrap.min.css" />'.format(maxcdn_bootstrap))
-            output.append('<link rel="stylesheet" href="{}css/bootstrap-theme.min.css" />'.format(maxcdn_bootstrap))
-            output.append('<script src="{}js/bootstrap.min.js"></script>'.format(maxcdn_bootstrap))
-            output.append('<link href="https://rawgit.com/filannim/ManTIME/master/static/mantime.css" rel="stylesheet" type="text/css" />')
-            output.append('<title>{}</title>'.format(str(document.title)))
-
-            text = [cgi.escape(c, True) for c in list(document.text)]
-            # TO-DO: This works properly only for IO annotation schema!
-            for element in document.predicted_annotations.itervalues():
-                # sostituisco il pezzetto nel testo con la stringa annotata
-                if isinstance(element, TemporalExpression):
-                    annotation = unicode('<TIMEX3 tid="{idx}" type="{ttype}"' +
-                                         ' mod="{mod}" value="{value}">' +
-                                         '{text}</TIMEX3>').format(
-                                             **element.__dict__)
-                elif isinstance(element, Event):
-                    annotation = unicode('<EVENT eid="{idx}" type="{eclass}" ' +
-                                         'modality="{modality}" ' +
-                                         'polarity="{polarity}"' +
-                                         '>{text}</EVENT>').format(
-                                             **element.__dict__)
-                text[element.start + document.text_offset] = annotation
-                # empty the remaining characters
-                for i in xrange(document.text_offset + element.start + 1,
-                                document.text_offset + element.end):
-                    text[i] = ''
-
-            output.append(u'<body>')
-            output.append(u'''<div id="wrapper">
+        lines = LineWriter(output)
+        lines.append('<?xml version="1.0" encoding="UTF-8"?>')
+        lines.append('<!DOCTYPE html PUBLIC "-//W3C//DTD XHTML 1.0 ' +
+                     'Strict//EN" "http://www.w3.org/TR/xhtml1/DTD/' +
+                     'xhtml1-strict.dtd">')
+        lines.append('<html xmlns="http://www.w3.org/1999/xhtml">')
+        lines.append('<meta name="Author" content="Michele Filannino" />')
+        lines.append('<link rel="stylesheet" href="{}css/bootstrap.min.css" />'.format(maxcdn_bootstrap))
+        lines.append('<link rel="stylesheet" href="{}css/bootstrap-theme.min.css" />'.format(maxcdn_bootstrap))
+        lines.append('<script src="{}js/bootstrap.min.js"></script>'.format(maxcdn_bootstrap))
+        lines.append('<link href="https://rawgit.com/filannim/ManTIME/master/static/mantime.css" rel="stylesheet" type="text/css" />')
+        lines.append('<title>{}</title>'.format(str(document.title)))
+
+        # TO-DO: This works properly only for IO annotation schema!
+        annotations = ((element, inline_annotation(element, 'eid'))
+                       for element in text_elements(document))
+        text = render_text(document, annotations, escape=True)
+
+        lines.append(u'<body>')
+        lines.append(u'''<div id="wrapper">
 
                             <div id="sidebar-wrapper" style="background-color: #f7f7f7;">
                               <ul class="sidebar-nav">
@@ -379,18 +468,15 @@ class HTMLWriter(FileWriter):
                                     <h1>{}</h1>
                                     <hr />'''.format(str(document.title)))
 
-            output.append(u''.join(text))
-
-            output.append(u'''<footer class="footer"><p>Generated by <a href="https://github.com/filannim/ManTIME" style="display: inline;">ManTIME</a> &copy; 2015 Michele Filannino</p><p><img src="https://rawgit.com/filannim/ManTIME/master/static/uni_logo.jpg" height="55"/></p></footer></div></div></div></div>''')
-            output.append(u'<script src="https://code.jquery.com/jquery-2.1.4.min.js"></script>')
+        lines.append(text)
 
-            output.append(u'</body>')
+        lines.append(u'''<footer class="footer"><p>Generated by <a href="https://github.com/filannim/ManTIME" style="display: inline;">ManTIME</a> &copy; 2015 Michele Filannino</p><p><img src="https://rawgit.com/filannim/ManTIME/master/static/uni_logo.jpg" height="55"/></p></footer></div></div></div></div>''')
+        lines.append(u'<script src="https://code.jquery.com/jquery-2.1.4.min.js"></script>')
 
-            # TLINKs
-            output.append(u'</html>')
-            outputs.append('\n'.join(output))
-        return outputs
+        lines.append(u'</body>')
 
+        # TLINKs
+        lines.append(u'</html>')
 
 class XMLGenericWriter(FileWriter):
     """This class is a writer in HTML/CSS3 format."""
@@ -401,45 +487,29 @@ class XMLGenericWriter(FileWriter):
         self.domain = domain
 
     def write(self, documents, domain='general'):
-        """It writes on an external file in the HTML/CSS3 format.
+        """It returns the documents in the generic XML format.
 
         """
-        outputs = []
-        for document in documents:
-            output = []
-            output.append('<?xml version="1.0" encoding="UTF-8"?>')
-            output.append('<mantime>')
-            output.append('<title>{}</title>'.format(str(document.title)))
-            output.append('<content>')
-
-            text = [cgi.escape(c, True) for c in list(document.text)]
-            # TO-DO: This works properly only for IO annotation schema!
-            for element in document.predicted_annotations.itervalues():
-                # sostituisco il pezzetto nel testo con la stringa annotata
-                if isinstance(element, TemporalExpression):
-                    annotation = unicode('<TIMEX3 tid="{idx}" type="{ttype}"' +
-                                         ' mod="{mod}" value="{value}">' +
-                                         '{text}</TIMEX3>').format(
-                                             **element.__dict__)
-                elif isinstance(element, Event):
-                    annotation = unicode('<EVENT id="{idx}" type="{eclass}" ' +
-                                         'modality="{modality}" ' +
-                                         'polarity="{polarity}"' +
-                                         '>{text}</EVENT>').format(
-                                             **element.__dict__)
-                text[element.start + document.text_offset] = annotation
-                # empty the remaining characters
-                for i in xrange(document.text_offset + element.start + 1,
-                                document.text_offset + element.end):
-                    text[i] = ''
-
-            output.append(u''.join(text))
-
-            output.append('</content>')
-            output.append(u'</mantime>')
-            outputs.append('\n'.join(output))
-        return outputs
+        return self._strings(documents)
 
+    def write_document(self, document, output):
+        """It writes the document in the generic XML format on output (a
+        file-like object), piece by piece.
+
+        """
+        lines = LineWriter(output)
+        lines.append('<?xml version="1.0" encoding="UTF-8"?>')
+        lines.append('<mantime>')
+        lines.append('<title>{}</title>'.format(str(document.title)))
+        lines.append('<content>')
+
+        # TO-DO: This works properly only for IO annotation schema!
+        annotations = ((element, inline_annotation(element, 'id'))
+                       for element in text_elements(document))
+        lines.append(render_text(document, annotations, escape=True))
+
+        lines.append('</content>')
+        lines.append(u'</mantime>')
 
 class AttributeMatrixWriter(Writer):
     """This class writes the attribute matrix taken by ML algorithms."""
@@ -450,22 +520,62 @@ class AttributeMatrixWriter(Writer):
         self.header = include_header
 
     def write(self, documents):
-        # save_to = os.path.abspath(save_to)
-        # with open(save_to, 'w') as output:
-        output = []
-        if self.header:
-            first_word = documents[0].sentences[0].words[0]
-            header = [k for k, _ in sorted(first_word.attributes.items())]
-            output.append(self.separator.join(header))
+        """It returns the attribute matrix of the documents as a string.
+
+        """
+        output = StringIO()
+        self.stream(documents, output)
+        # without the newline after the last line
+        return output.getvalue()[:-1]
+
+    def write_document(self, document, output):
+        """It writes the rows of the document on output (a file-like object),
+        one at a time, with an empty line after each sentence.
+
+        """
+        for sentence in document.sentences:
+            for word in sentence.words:
+                row = sentence.attribute_row(word.id_token)
+                row.append(str(word.predicted_label))
+                output.write(self.separator.join(row))
+                output.write('\n')
+            output.write('\n')
+
+    def write_columnar(self, documents, dest):
+        """It writes the attribute matrix of the documents in the columnar
+        layout (see columnar.py) in dest, a folder, and returns dest.
+
+        """
+        builder = None
         for document in documents:
             for sentence in document.sentences:
+                if builder is None:
+                    builder = ColumnarMatrixBuilder(
+                        list(sentence.header) + ['label'])
                 for word in sentence.words:
-                    row = [v for _, v in sorted(word.attributes.items())]
-                    row.append(word.predicted_label)
-                    output.append(self.separator.join(row))
-                output.append('')
-        # logging.info('{} exported.'.format(save_to))
-        return '\n'.join(output)
+                    row = sentence.attribute_row(word.id_token)
+                    row.append(str(word.predicted_label))
+                    builder.add_row(row)
+                builder.end_sequence()
+        return (builder or ColumnarMatrixBuilder()).save(dest)
+
+    def stream(self, documents, output):
+        """It writes the attribute matrix of the documents on output one
+        document at a time, preceded by the header (if required).
+
+        """
+        documents = iter(documents)
+        if self.header:
+            try:
+                first = next(documents)
+            except StopIteration:
+                return
+            header = list(first.sentences[0].header)
+            output.write(self.separator.join(header))
+            output.write('\n')
+            documents = chain([first], documents)
+        for document in documents:
+            self.write_document(document, output)
 
 Writer.register(FileWriter)
 FileWriter.register(SimpleXMLFileWriter)
@@ -11,30 +11,80 @@
 #
 #   For details, see www.cs.man.ac.uk/~filannim/
 
-from datetime import datetime
-from flask import Flask, render_template, request
-import re
+import argparse
+import logging
 
-from mantime.mantime import ManTIME
-from mantime.readers import TextReader
-from mantime.writers import TempEval3Writer
-from mantime.attributes_extractor import FullExtractor
+from mantime.service import AnnotationServer
+from mantime.service import AnnotationService
+from mantime.metrics import METRICS
+from mantime.metrics import JSONLinesSink
 
-app = Flask("ManTIME")
-app.debug = False
 
-MANTIME = ManTIME(reader=TextReader(), writer=TempEval3Writer(), pipeline=True,
-                  extractor=FullExtractor(), model_name='TBAQ_full_training')
+def main():
+    """ It serves ManTIME annotations over HTTP.
+    """
+    logging.basicConfig(format='%(asctime)s: %(message)s',
+                        level=logging.INFO,
+                        datefmt='%m/%d/%Y %I:%M:%S %p')
+    parser = argparse.ArgumentParser(
+        description='ManTIME: temporal information extraction service')
+    parser.add_argument('model', nargs='?', default='TBAQ_full_training',
+                        help='Name of the model to use (case sensitive)')
+    parser.add_argument('--host', default='127.0.0.1',
+                        help='Address to listen on (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=4001,
+                        help='Port to listen on (default: 4001)')
+    parser.add_argument('-w', '--workers', type=int, default=None,
+                        help='Number of worker processes (default: CPUs)')
+    parser.add_argument('-q', '--queue', type=int, default=None,
+                        help='Requests waiting for a worker before the ' +
+                        'service answers 503 (default: workers * batch size)')
+    parser.add_argument('-b', '--batch-size', type=int, default=8,
+                        help='Maximum number of requests annotated together')
+    parser.add_argument('--batch-wait', type=int, default=10,
+                        help='Milliseconds a batch waits for more requests')
+    parser.add_argument('-t', '--timeout', type=int, default=600,
+                        help='Seconds allowed for each annotation')
+    parser.add_argument('--max-requests', type=int, default=None,
+                        help='Requests served by a worker before it is ' +
+                        'replaced')
+    parser.add_argument('--no-ppp', dest='post_processing_pipeline',
+                        action='store_false',
+                        help='it does not use the post processing pipeline.')
+    parser.add_argument('--viterbi', action='store_true',
+                        help='the post processing pipeline decodes again ' +
+                        'with the scale factors instead of rewriting the ' +
+                        'labels.')
+    parser.add_argument('--sentence-cache', type=int, default=0,
+                        help='Sentences whose features and labels each ' +
+                        'worker keeps, so that edited texts are annotated ' +
+                        'again only where they changed (default: 0, off)')
+    parser.add_argument('--metrics-log', default=None,
+                        help='File where the metric events of the service ' +
+                        'are appended (JSON lines)')
+    args = parser.parse_args()
+    if args.metrics_log:
+        METRICS.add_sink(JSONLinesSink(args.metrics_log))
 
+    service = AnnotationService(args.model, workers=args.workers,
+                                queue_size=args.queue, timeout=args.timeout,
+                                pipeline=args.post_processing_pipeline,
+                                decoding='viterbi' if args.viterbi
+                                else 'rewrite',
+                                max_requests_per_worker=args.max_requests,
+                                batch_size=args.batch_size,
+                                batch_wait=args.batch_wait / 1000.,
+                                sentence_cache=args.sentence_cache)
+    server = AnnotationServer((args.host, args.port), service)
+    logging.info('Serving {} on http://{}:{}/ ({} workers).'.format(
+        args.model, args.host, args.port, service.workers))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
 
-@app.route('/', methods=['POST'])
-def index():
-    now = datetime.now()
-    utterance = now.strftime("%A, %d %B %Y")
-    sentence = request.form['sentence']
-    result = MANTIME.label(sentence)[0]
-    print sentence, result
-    return render_template('mantime.html', sentence=sentence, result=result,
-                           utterance=utterance)
-
-app.run(host="130.88.192.69", port=4001, use_reloader=True)
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+#
+#   Copyright 2014 Michele Filannino
+#
+#   gnTEAM, School of Computer Science, University of Manchester.
+#   All rights reserved. This program and the accompanying materials
+#   are made available under the terms of the GNU General Public License.
+#
+#   author: Michele Filannino
+#   email:  filannim@cs.man.ac.uk
+#
+#   For details, see www.cs.man.ac.uk/~filannim/
+
+'''It tests the constrained Viterbi decoding of crf_utilities.
+
+   Run it from the root folder with: python -m unittest discover tests
+'''
+
+import itertools
+import math
+import random
+import unittest
+
+from mantime.crf_utilities import TransitionConstraints
+from mantime.crf_utilities import constrained_viterbi
+from mantime.model.document import SequenceLabel
+
+FORMATS = ('IO', 'BIO', 'BIOE', 'WBIOE')
+TAGS = ('TIMEX3', 'EVENT')
+
+
+def label_names(annotation_format):
+    '''It returns the labels of annotation_format, 'O' first.'''
+    return ['O'] + [str(SequenceLabel(position, tag))
+                    for position in annotation_format if position != 'O'
+                    for tag in TAGS]
+
+
+def encode(annotations, annotation_format):
+    '''It returns the labels of a sentence made of annotations, a list of
+       (tag, length) pairs where a None tag stands for an unannotated word,
+       as store_gold_annotations encodes them.
+    '''
+    labels = []
+    for tag, length in annotations:
+        if tag is None:
+            labels.extend(['O'] * length)
+        else:
+            labels.extend(str(SequenceLabel(position, tag))
+                          for position in SequenceLabel.chunk_positions(
+                              length, annotation_format))
+    return labels
+
+
+class TransitionConstraintsTest(unittest.TestCase):
+
+    def test_every_encoded_annotation_is_accepted(self):
+        # up to three adjacent annotations, or unannotated words, of 1 to 5
+        # words each
+        pieces = [(tag, length) for tag in (None,) + TAGS
+                  for length in xrange(1, 6)]
+        for annotation_format in FORMATS:
+            constraints = TransitionConstraints(annotation_format)
+            for n_pieces in (1, 2, 3):
+                for annotations in itertools.product(pieces,
+                                                     repeat=n_pieces):
+                    labels = encode(annotations, annotation_format)
+                    self.assertTrue(constraints.can_start(labels[0]),
+                                    (annotation_format, labels))
+                    self.assertTrue(constraints.can_end(labels[-1]),
+                                    (annotation_format, labels))
+                    for previous, label in zip(labels, labels[1:]):
+                        self.assertTrue(
+                            constraints.allowed(previous, label),
+                            (annotation_format, labels, previous, label))
+
+    def test_broken_annotations_are_rejected(self):
+        constraints = TransitionConstraints('WBIOE')
+        self.assertFalse(constraints.can_start('I-TIMEX3'))
+        self.assertFalse(constraints.can_end('B-TIMEX3'))
+        self.assertFalse(constraints.allowed('O', 'E-EVENT'))
+        self.assertFalse(constraints.allowed('B-TIMEX3', 'I-EVENT'))
+        self.assertFalse(constraints.allowed('B-TIMEX3', 'O'))
+
+
+class ConstrainedViterbiTest(unittest.TestCase):
+
+    @staticmethod
+    def brute_force(scores, n_labels, allowed, start, end):
+        '''It returns the best valid sequence trying them all.'''
+        n_words = len(scores) // n_labels
+        valid = (sequence for sequence in itertools.product(
+            xrange(n_labels), repeat=n_words)
+            if start[sequence[0]] and end[sequence[-1]] and
+            all(allowed[previous][label]
+                for previous, label in zip(sequence, sequence[1:])))
+        return list(max(valid, key=lambda sequence: sum(
+            scores[word * n_labels + label]
+            for word, label in enumerate(sequence))))
+
+    def test_matches_brute_force(self):
+        generator = random.Random(3)
+        for annotation_format in FORMATS:
+            constraints = TransitionConstraints(annotation_format)
+            names = label_names(annotation_format)
+            n_labels = len(names)
+            allowed = [[constraints.allowed(previous, label)
+                        for label in names] for previous in names]
+            start = [constraints.can_start(label) for label in names]
+            end = [constraints.can_end(label) for label in names]
+            for _ in xrange(50):
+                n_words = generator.randint(1, 4)
+                scores = [math.log(generator.random())
+                          for _ in xrange(n_words * n_labels)]
+                self.assertEqual(
+                    constrained_viterbi(scores, n_labels, allowed, start,
+                                        end),
+                    self.brute_force(scores, n_labels, allowed, start, end))
+
+    def test_best_labels_without_valid_sequences(self):
+        scores = [0.1, 0.9, 0.8, 0.2]
+        nothing = [[False, False], [False, False]]
+        self.assertEqual(constrained_viterbi(scores, 2, nothing,
+                                             [True, True], [True, True]),
+                         [1, 0])
+
+
+if __name__ == '__main__':
+    unittest.main()